@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+End-to-end benchmark against the deterministic fake model backend
+
+Usage:
+    python benchmarks/e2e_bench.py [--iterations 20] [--latency-ms 0] [--jitter-ms 0]
+                                   [--error-rate 0] [--vendors 10000,100000,1000000]
+                                   [--only process,vendors_10000,...]
+                                   [--baseline benchmarks/baseline.json] [--save-baseline]
+                                   [--tolerance 0.2]
+
+Drives InvoiceAgent.process_invoice, apply_correction and extract_field,
+VendorManager.search_vendor over synthetic vendor masters, and VectorIndexer
+indexing and querying, all offline. Model calls go to FakeGenerativeModel
+with the given latency and injected error rate; embeddings use
+FakeEmbeddingFunction. Each scenario runs in a fresh process so its peak
+RSS is its own. Results are compared with a stored baseline (written with
+--save-baseline); the exit status is 1 if any scenario regressed by more
+than --tolerance.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ["MODEL_BACKEND"] = "fake"
+
+DEFAULT_BASELINE = os.path.join(ROOT, "benchmarks", "baseline.json")
+SAMPLES = [os.path.join(ROOT, name) for name in ("sample.pdf", "test.pdf")]
+CORRECTIONS = ["PO number is PO-4411", "Currency should be EUR", "Line 1 amount should be 99.00"]
+FIELDS = ["po_number", "payment_terms", "due_date", "customer_name"]
+WORDS = ["acme", "global", "north", "river", "delta", "summit", "pioneer", "apex", "harbor", "cedar",
+         "atlas", "nova", "vertex", "bright", "union", "metro", "prime", "coastal", "iron", "silver"]
+
+
+def isolate(tmp_dir: str):
+    """Point every on-disk store at a scratch directory"""
+    from config import Config
+
+    Config.VECTOR_DB_DIR = tmp_dir
+    Config.VENDOR_DB_PATH = os.path.join(tmp_dir, "vendor_database.json")
+    Config.SESSION_DATA_PATH = os.path.join(tmp_dir, "session_data.json")
+    Config.DOCUMENT_STORE_DIR = os.path.join(tmp_dir, "documents")
+    Config.BM25_INDEX_PATH = os.path.join(tmp_dir, "bm25_index.sqlite3")
+    Config.EXTRACTED_TEXT_DIR = os.path.join(tmp_dir, "extracted_texts")
+
+
+def make_agent(args):
+    from invoice_agent import InvoiceAgent
+    from tools.fake_model import FakeEmbeddingFunction, FakeGenerativeModel
+    from tools.invoice_parser import InvoiceParser
+    from tools.pdf_extractor import PDFExtractor
+    from tools.vector_indexer import VectorIndexer
+    from tools.vendor_manager import VendorManager
+
+    model = FakeGenerativeModel(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    agent = InvoiceAgent(
+        pdf_extractor=PDFExtractor(model=model),
+        vector_indexer=VectorIndexer(embedding_function=FakeEmbeddingFunction()),
+        invoice_parser=InvoiceParser(model=model),
+        vendor_manager=VendorManager(),
+    )
+    return agent, model
+
+
+def synthetic_invoice(i: int, rng: random.Random) -> str:
+    """A plain-text invoice of roughly 2 KB"""
+    lines = [
+        f"Invoice Number: INV-{i:06d}",
+        f"Invoice Date: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        f"Vendor Name: {' '.join(rng.sample(WORDS, 2)).title()} Ltd",
+        f"Customer Name: {' '.join(rng.sample(WORDS, 2)).title()} GmbH",
+        f"PO Number: PO-{rng.randint(1000, 9999)}",
+        "Currency: EUR",
+        "Description  Qty  Unit Price  Amount",
+    ]
+    for n in range(30):
+        quantity, price = rng.randint(1, 9), rng.randint(5, 500)
+        lines.append(f"{rng.choice(WORDS).title()} part {n}  {quantity}  {price:.2f}  {quantity * price:.2f}")
+    lines.append(f"Total Amount: {rng.randint(1000, 90000):.2f}")
+    return "\n".join(lines)
+
+
+def scenario_process(args):
+    agent, model = make_agent(args)
+    model.error_rate = args.error_rate
+
+    def op(i):
+        agent.process_invoice(SAMPLES[i % len(SAMPLES)], f"BENCH-{i}")
+    return op, model
+
+
+def scenario_correction(args):
+    agent, model = make_agent(args)
+    agent.process_invoice(SAMPLES[0], "BENCH-CORRECT")
+    model.error_rate = args.error_rate
+
+    def op(i):
+        agent.apply_correction(CORRECTIONS[i % len(CORRECTIONS)])
+    return op, model
+
+
+def scenario_extract(args):
+    agent, model = make_agent(args)
+    agent.process_invoice(SAMPLES[0], "BENCH-EXTRACT")
+    model.error_rate = args.error_rate
+
+    def op(i):
+        agent.extract_field(FIELDS[i % len(FIELDS)])
+    return op, model
+
+
+def scenario_vendors(args, size: int):
+    from models import Vendor
+    from tools.vendor_manager import VendorManager
+
+    manager = VendorManager()
+    manager.vendors = [
+        Vendor.model_construct(
+            vendor_id=f"VEN-{n:08X}",
+            name=f"{WORDS[n % 20].title()} {WORDS[n // 20 % 20].title()} {n} Ltd",
+            normalized_name=f"{WORDS[n % 20]} {WORDS[n // 20 % 20]} {n}",
+            created_at="2024-01-01T00:00:00",
+        )
+        for n in range(size)
+    ]
+    manager._build_index()
+    rng = random.Random(0)
+
+    # Exact hits, fuzzy (containment) hits and misses, which scan every vendor
+    def op(i):
+        vendor = manager.vendors[rng.randrange(size)]
+        query = [vendor.name.upper(), f"{vendor.normalized_name} holdings", f"unknown vendor {i}"][i % 3]
+        manager.search_vendor(query)
+    return op, None
+
+
+def scenario_index(args):
+    from tools.fake_model import FakeEmbeddingFunction
+    from tools.vector_indexer import VectorIndexer
+
+    indexer = VectorIndexer(embedding_function=FakeEmbeddingFunction())
+    rng = random.Random(0)
+
+    def op(i):
+        indexer.index_document(f"BENCH-{i}", synthetic_invoice(i, rng))
+    return op, None
+
+
+def scenario_query(args):
+    from tools.fake_model import FakeEmbeddingFunction
+    from tools.vector_indexer import VectorIndexer
+
+    indexer = VectorIndexer(embedding_function=FakeEmbeddingFunction())
+    rng = random.Random(0)
+    documents = max(args.iterations, 50)
+    for n in range(documents):
+        indexer.index_document(f"BENCH-{n}", synthetic_invoice(n, rng))
+
+    def op(i):
+        if i % 2:
+            indexer.search(f"{rng.choice(WORDS)} part total", top_k=10)
+        else:
+            indexer.query_document(f"BENCH-{rng.randrange(documents)}", "total amount due", n_results=5)
+    return op, None
+
+
+def scenarios(args) -> list:
+    names = ["process", "correction", "extract", "index", "query"]
+    names += [f"vendors_{size}" for size in args.vendors]
+    return [name for name in names if not args.only or name in args.only]
+
+
+def run_scenario(name: str, args) -> dict:
+    """Set up and time one scenario (called in a fresh process)"""
+    with tempfile.TemporaryDirectory(prefix="bench_") as tmp_dir, contextlib.redirect_stdout(io.StringIO()):
+        isolate(tmp_dir)
+        if name.startswith("vendors_"):
+            op, model = scenario_vendors(args, int(name.split("_")[1]))
+        else:
+            op, model = globals()[f"scenario_{name}"](args)
+        calls_before = len(model.calls) if model else 0
+
+        latencies, failures = [], 0
+        started = time.perf_counter()
+        for i in range(args.iterations):
+            start = time.perf_counter()
+            try:
+                op(i)
+            except Exception:
+                failures += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "iterations": args.iterations,
+        "throughput": args.iterations / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p99_ms": percentile(latencies, 99),
+        "failed_ops": failures,
+        "model_calls": len(model.calls) - calls_before if model else 0,
+        "model_errors": model.failures if model else 0,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return a list of "scenario: metric" regressions"""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p99_ms", "peak_rss_mb"):
+            if result[metric] > base[metric] * (1 + tolerance):
+                regressions.append(f"{name}: {metric} {base[metric]:.2f} -> {result[metric]:.2f}")
+        if result["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput']:.1f} -> {result['throughput']:.1f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated model latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random latency (0..jitter) per call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of model calls that fail")
+    parser.add_argument("--vendors", type=lambda v: [int(n) for n in v.split(",") if n],
+                        default=[10000, 100000, 1000000], help="Vendor master sizes")
+    parser.add_argument("--only", type=lambda v: set(v.split(",")), default=None, help="Scenarios to run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    print(f"{args.iterations} iterations, model latency {args.latency_ms:g}+{args.jitter_ms:g} ms, "
+          f"error rate {args.error_rate:g}\n")
+    print(f"{'scenario':18s} {'ops/s':>9s} {'p50 ms':>9s} {'p99 ms':>9s} {'failed':>7s} "
+          f"{'calls':>6s} {'errors':>7s} {'rss MB':>8s} {'vs baseline p50':>16s}")
+
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    for name in scenarios(args):
+        with context.Pool(1) as pool:
+            result = pool.apply(run_scenario, (name, args))
+        results[name] = result
+        base = baseline.get(name)
+        delta = f"{(result['p50_ms'] / base['p50_ms'] - 1) * 100:+15.0f}%" if base and base["p50_ms"] else f"{'-':>16s}"
+        print(f"{name:18s} {result['throughput']:9.1f} {result['p50_ms']:9.2f} {result['p99_ms']:9.2f} "
+              f"{result['failed_ops']:7d} {result['model_calls']:6d} {result['model_errors']:7d} "
+              f"{result['peak_rss_mb']:8.1f} {delta}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, **results}, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"\nNo baseline at {args.baseline} (run with --save-baseline to create one)")
+        return
+    regressions = compare(results, baseline, args.tolerance)
+    for regression in regressions:
+        print(f"[WARNING] Regression {regression}")
+    if regressions:
+        sys.exit(1)
+    print(f"\nNo regressions beyond {args.tolerance:.0%} of baseline")
+
+
+if __name__ == "__main__":
+    main()
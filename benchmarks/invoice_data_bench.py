@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark: whole-invoice pydantic round trips vs. structural sharing
+
+Usage:
+    python benchmarks/invoice_data_bench.py [line_items] [repeats]
+
+Each hot path is timed in its previous form (model_dump() the whole invoice,
+edit the dict, InvoiceData(**dict) it back) and in its current form (edit a
+column view or a shallow document and re-validate only the touched rows).
+Allocations are counted with tracemalloc.
+"""
+
+import contextlib
+import copy
+import io
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MODEL_BACKEND", "fake")
+
+from models import CompactInvoice, InvoiceData, InvoiceMetadata, LineItem
+from tools.fake_model import FakeGenerativeModel
+from tools.invoice_parser import InvoiceParser
+from tools.invoice_validator import InvoiceValidator
+from tools.json_patch import apply_patch
+
+def make_invoice(rows: int) -> InvoiceData:
+    return InvoiceData(
+        metadata=InvoiceMetadata(invoice_number="BENCH-1", currency="USD", subtotal=rows * 2.5, total_amount=rows * 2.75),
+        line_items=[
+            LineItem(description=f"Part {i}", hsn_sac="8471", quantity=1, unit_price=2.5, amount=2.5,
+                     tax_rate=10.0, tax_amount=0.25)
+            for i in range(rows)
+        ],
+    )
+
+def measure(fn, repeats: int) -> tuple:
+    """Return (best ms per call, allocated blocks still held by the result)"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        best = float("inf")
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start)
+
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        result = fn()
+        allocated = sum(stat.count_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+        tracemalloc.stop()
+    del result
+    return best * 1000, allocated
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    parser = InvoiceParser(model=FakeGenerativeModel())
+    validator = InvoiceValidator()
+    invoice = make_invoice(rows)
+    gap = invoice.model_copy(update={"line_items": list(invoice.line_items)})
+    gap.line_items[7] = gap.line_items[7].model_copy(update={"amount": None})
+    op = {"op": "replace", "path": "/line_items/7/amount", "value": 3.0}
+
+    def patch_before():
+        patched, _ = apply_patch(invoice.model_dump(), [op])
+        return InvoiceData(**patched)
+
+    def repair_before():
+        data = copy.deepcopy(gap.model_dump())
+        item = data["line_items"][7]
+        item["amount"] = round(item["quantity"] * item["unit_price"], 2)
+        return InvoiceData(**data)
+
+    def correct_before():
+        data = invoice.model_dump()
+        data["metadata"]["currency"] = "GBP"
+        return InvoiceData(**data)
+
+    cases = [
+        ("patch one line-item cell", patch_before, lambda: parser._apply_patch_ops(invoice, [op])),
+        ("repair one missing amount", repair_before, lambda: validator.repair(gap)),
+        ("metadata-only correction", correct_before,
+         lambda: parser._apply_corrections(invoice, {"metadata": {"currency": "GBP"}})),
+        ("line-item rows for summary", lambda: [item.model_dump() for item in invoice.line_items],
+         lambda: CompactInvoice.from_model(invoice).rows()),
+        ("sum of amounts", lambda: sum(row["amount"] for row in invoice.model_dump()["line_items"]),
+         lambda: CompactInvoice.from_model(invoice).column_sum("amount")),
+    ]
+
+    print(f"{rows} line items, best of {repeats}\n")
+    print(f"{'operation':28s} {'before ms':>10s} {'after ms':>9s} {'speedup':>8s} {'before allocs':>14s} {'after allocs':>13s}")
+    for name, before, after in cases:
+        before_ms, before_allocs = measure(before, repeats)
+        after_ms, after_allocs = measure(after, repeats)
+        print(f"{name:28s} {before_ms:10.2f} {after_ms:9.2f} {before_ms / after_ms:7.1f}x "
+              f"{before_allocs:14d} {after_allocs:13d}")
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,39 @@ class Config:
     
     # Model Configuration
     GEMINI_MODEL = "gemini-2.5-flash"
+    MODEL_BACKEND = os.getenv("MODEL_BACKEND", "gemini").lower()  # "gemini" or "fake" (offline stand-in)
+    FAKE_MODEL_LATENCY_MS = float(os.getenv("FAKE_MODEL_LATENCY_MS", "0"))  # simulated per-call latency (fake backend)
+    FAKE_MODEL_ERROR_RATE = float(os.getenv("FAKE_MODEL_ERROR_RATE", "0"))  # fraction of fake calls that fail
+    MODEL_CACHE = os.getenv("MODEL_CACHE", "off").lower()  # "off", "record" or "replay" (offline, cache only)
+    MODEL_ROUTING = os.getenv("MODEL_ROUTING", "false").lower() == "true"  # per-task model tiers with escalation
+    MODEL_TIERS = [m.strip() for m in os.getenv(
+        "MODEL_TIERS", f"gemini-2.5-flash-lite,{GEMINI_MODEL},gemini-2.5-pro"
+    ).split(",") if m.strip()]  # cheapest first
+    MODEL_TIER_PRICES = os.getenv("MODEL_TIER_PRICES", "0.10:0.40,0.30:2.50,1.25:10.00")  # USD per 1M tokens in:out
+    ROUTER_LARGE_INPUT_TOKENS = int(os.getenv("ROUTER_LARGE_INPUT_TOKENS", "8000"))  # parses above start one tier up
+    ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", "20"))  # attempts before a tier's record is used
+    ROUTER_MAX_ESCALATION_RATE = float(os.getenv("ROUTER_MAX_ESCALATION_RATE", "0.5"))
+    ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.6"))
+    ROUTER_STATS_WINDOW = int(os.getenv("ROUTER_STATS_WINDOW", "200"))  # task outcomes halved past this many attempts
+    ROUTER_STATS_FLUSH_S = float(os.getenv("ROUTER_STATS_FLUSH_S", "30"))  # interval between stats file writes
+    ROUTER_PROBE_EVERY = int(os.getenv("ROUTER_PROBE_EVERY", "20"))  # 1 in N tasks still tries a skipped tier; 0 disables
+    CIRCUIT_BREAKER = os.getenv("CIRCUIT_BREAKER", "true").lower() == "true"  # fail fast while a model keeps erroring
+    CIRCUIT_WINDOW = int(os.getenv("CIRCUIT_WINDOW", "20"))  # recent calls per model considered
+    CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+    CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+    CIRCUIT_COOLDOWN_S = float(os.getenv("CIRCUIT_COOLDOWN_S", "30"))  # open time before a trial call
+    HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"  # duplicate slow calls, first answer wins
+    HEDGE_QUANTILE = float(os.getenv("HEDGE_QUANTILE", "0.95"))  # latency quantile after which a call is hedged
+    HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+    HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "16"))
+    STRUCTURED_OUTPUT = os.getenv("STRUCTURED_OUTPUT", "true").lower() == "true"
+    PREPROCESS_TEXT = os.getenv("PREPROCESS_TEXT", "true").lower() == "true"  # compact prompts and invoice text
+    PATCH_CORRECTIONS = os.getenv("PATCH_CORRECTIONS", "true").lower() == "true"  # delta-only correction ops
+    
+    # Map-reduce line-item parsing for long invoices
+    MAP_REDUCE_MIN_CHARS = int(os.getenv("MAP_REDUCE_MIN_CHARS", "12000"))  # longer texts are parsed in segments
+    PARSE_SEGMENT_CHARS = int(os.getenv("PARSE_SEGMENT_CHARS", "6000"))
+    PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "4"))
     
     # Storage Paths
     EXTRACTED_TEXT_DIR = os.getenv("EXTRACTED_TEXT_DIR", "extracted_texts")
@@ -21,10 +54,69 @@ class Config:
     # Embedding Configuration
     COLLECTION_NAME = "invoice_documents"
     
+    # Document Text Store Configuration
+    DOCUMENT_STORE_DIR = os.getenv("DOCUMENT_STORE_DIR", os.path.join(VECTOR_DB_DIR, "documents"))
+    DOCUMENT_STORE_MMAP_THRESHOLD = 1024 * 1024  # bytes of compressed blob
+    
+    # Columnar Export Configuration
+    EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(VECTOR_DB_DIR, "exports"))  # appended Parquet/Arrow datasets
+    MODEL_CACHE_PATH = os.getenv("MODEL_CACHE_PATH", os.path.join(VECTOR_DB_DIR, "model_cache.bin"))  # recorded model responses
+    ROUTER_STATS_PATH = os.getenv("ROUTER_STATS_PATH", os.path.join(VECTOR_DB_DIR, "model_router_stats.json"))
+    FAILED_PAGES_PATH = os.getenv("FAILED_PAGES_PATH", os.path.join(VECTOR_DB_DIR, "failed_pages.json"))  # retry queue
+    
+    # Server Startup Configuration
+    AGENT_PRELOAD = os.getenv("AGENT_PRELOAD", "false").lower() == "true"  # warm up before workers fork
+    COMPRESSION_MIN_SIZE = 1000  # bytes; smaller responses are sent uncompressed
+
+    # Request Scheduling Configuration
+    SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "2"))  # threads running agent work
+    SCHEDULER_BULK_MAX_ACTIVE = int(os.getenv("SCHEDULER_BULK_MAX_ACTIVE", "1"))  # uploads running at once
+    SCHEDULER_INTERACTIVE_QUEUE = int(os.getenv("SCHEDULER_INTERACTIVE_QUEUE", "32"))  # waiting corrections/lookups
+    SCHEDULER_BULK_QUEUE = int(os.getenv("SCHEDULER_BULK_QUEUE", "8"))  # waiting uploads
+    SCHEDULER_INTERACTIVE_WEIGHT = int(os.getenv("SCHEDULER_INTERACTIVE_WEIGHT", "4"))
+    SCHEDULER_BULK_WEIGHT = int(os.getenv("SCHEDULER_BULK_WEIGHT", "1"))
+    RETRY_FAILED_INTERVAL_S = float(os.getenv("RETRY_FAILED_INTERVAL_S", "60"))  # 0 disables background page retries
+    RETRY_BACKOFF_S = float(os.getenv("RETRY_BACKOFF_S", "60"))  # doubled per attempt
+    RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+
+    # Index Lifecycle Configuration
+    TENANT_ID = os.getenv("TENANT_ID") or None  # separate collection per tenant when set
+    TENANT_INDEXER_CACHE = int(os.getenv("TENANT_INDEXER_CACHE", "8"))  # other tenants' indexers kept open by admin
+    INDEX_RETENTION_DAYS = float(os.getenv("INDEX_RETENTION_DAYS")) if os.getenv("INDEX_RETENTION_DAYS") else None
+    SAMPLE_RETENTION_HOURS = float(os.getenv("SAMPLE_RETENTION_HOURS", "24"))
+    INDEX_MAINTENANCE_INTERVAL_HOURS = float(os.getenv("INDEX_MAINTENANCE_INTERVAL_HOURS", "6"))
+    
+    # Hybrid Retrieval Configuration
+    BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", os.path.join(VECTOR_DB_DIR, "bm25_index.sqlite3"))
+    HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+    RRF_K = 60
+    
+    # Page Classification Configuration
+    CLASSIFY_PAGES = os.getenv("CLASSIFY_PAGES", "true").lower() == "true"  # skip blank / non-invoice pages locally
+    GROUP_PAGES = os.getenv("GROUP_PAGES", "true").lower() == "true"  # process multi-page invoices as one unit
+    PAGE_GROUP_WORKERS = int(os.getenv("PAGE_GROUP_WORKERS", "4"))  # page groups processed concurrently
+    
+    # Image Preprocessing Configuration (uploaded PNG/JPEG/WebP invoices)
+    PREPROCESS_IMAGES = os.getenv("PREPROCESS_IMAGES", "true").lower() == "true"  # crop, deskew, downscale before the model
+    IMAGE_TARGET_DPI = int(os.getenv("IMAGE_TARGET_DPI", "200"))
+    IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", "3000000"))
+    IMAGE_GRAYSCALE = os.getenv("IMAGE_GRAYSCALE", "true").lower() == "true"
+    IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "jpeg").lower()  # jpeg, webp or png
+    IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+    
+    # Duplicate Detection Configuration
+    DEDUPE_INVOICES = os.getenv("DEDUPE_INVOICES", "true").lower() == "true"  # short-circuit known duplicates
+    DEDUPE_INDEX_PATH = os.getenv("DEDUPE_INDEX_PATH", os.path.join(VECTOR_DB_DIR, "dedupe_index.sqlite3"))
+    DEDUPE_MAX_DISTANCE = int(os.getenv("DEDUPE_MAX_DISTANCE", "3"))  # SimHash bits for near-duplicate text
+    
+    # Validation Configuration
+    VALIDATE_INVOICES = os.getenv("VALIDATE_INVOICES", "true").lower() == "true"
+    VALIDATION_MAX_REEXTRACTIONS = int(os.getenv("VALIDATION_MAX_REEXTRACTIONS", "2"))  # targeted field re-asks per invoice
+    
     @classmethod
-    def validate(cls):
-        """Validate required configuration"""
-        if not cls.GOOGLE_API_KEY:
+    def validate(cls, require_api_key: bool = True):
+        """Validate required configuration (the API key only for components that create a model)"""
+        if require_api_key and cls.MODEL_BACKEND == "gemini" and cls.MODEL_CACHE != "replay" and not cls.GOOGLE_API_KEY:
             raise ValueError("GOOGLE_API_KEY not found in environment variables")
         
         # Create directories if they don't exist
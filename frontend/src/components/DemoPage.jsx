@@ -43,10 +43,9 @@ const DemoPage = () => {
         setPageResults(data.pages || []);
         setTotalPages(data.total_pages || data.pages?.length || 0);
         setActivePage(0);
-        // Set preview
-        const url = `${API}/pdf?t=${Date.now()}`;
-        setPreviewUrl(url);
+        // Set preview (one URL per upload, so the browser can revalidate it with ETag)
         const firstPage = data.pages?.[0];
+        setPreviewUrl(`${API}/pdf?doc=${encodeURIComponent(firstPage?.document_id || Date.now())}`);
         if (firstPage?.document_id) {
             // Determine if image
             setPreviewType(file?.type?.startsWith('image/') ? 'image' : 'pdf');
@@ -60,7 +59,7 @@ const DemoPage = () => {
         const formData = new FormData();
         formData.append('file', file);
         try {
-            const res = await axios.post(`${API}/process`, formData);
+            const res = await axios.post(`${API}/process`, formData, { params: { include_text: false } });
             setPreviewType(file.type?.startsWith('image/') ? 'image' : 'pdf');
             handleResults(res.data);
         } catch (err) { setError(err.response?.data?.detail || 'Backend not reachable.'); }
@@ -72,10 +71,9 @@ const DemoPage = () => {
         const formData = new FormData();
         formData.append('sample_name', name);
         try {
-            const res = await axios.post(`${API}/process-sample`, formData);
+            const res = await axios.post(`${API}/process-sample`, formData, { params: { include_text: false } });
             setPreviewType('pdf');
             handleResults(res.data);
-            setPreviewUrl(`${API}/pdf?t=${Date.now()}`);
         } catch (err) { setError(err.response?.data?.detail || 'Failed.'); }
         finally { setIsProcessing(false); }
     };
@@ -113,7 +111,7 @@ const DemoPage = () => {
 
     const downloadJSON = async () => {
         try {
-            const res = await axios.get(`${API}/current`);
+            const res = await axios.get(`${API}/current`, { params: { include_text: false } });
             const blob = new Blob([JSON.stringify(res.data, null, 2)], { type: 'application/json' });
             const url = URL.createObjectURL(blob);
             const a = document.createElement('a'); a.href = url; a.download = 'invoice_data.json'; a.click();
@@ -242,12 +240,14 @@ const DemoPage = () => {
                                         color: activePage === i ? '#60a5fa' : '#64748b', fontSize: 13, fontWeight: 600, cursor: 'pointer',
                                         transition: 'all 0.2s', whiteSpace: 'nowrap',
                                     }}>
-                                    Page {i + 1} {pageResults[i]?.error ? '⚠' : ''}
+                                    {pageResults[i]?.page_numbers?.length > 1
+                                        ? `Pages ${pageResults[i].page_numbers[0]}-${pageResults[i].page_numbers.at(-1)}`
+                                        : `Page ${pageResults[i]?.page_number ?? i + 1}`} {pageResults[i]?.error ? '⚠' : ''}
                                 </button>
                             ))}
                         </div>
-                        <button onClick={() => setActivePage(Math.min(totalPages - 1, activePage + 1))} disabled={activePage >= totalPages - 1}
-                            style={{ ...card, padding: '6px 10px', cursor: 'pointer', color: activePage >= totalPages - 1 ? '#333' : '#94a3b8', display: 'flex', alignItems: 'center' }}><ChevronRight size={16} /></button>
+                        <button onClick={() => setActivePage(Math.min(pageResults.length - 1, activePage + 1))} disabled={activePage >= pageResults.length - 1}
+                            style={{ ...card, padding: '6px 10px', cursor: 'pointer', color: activePage >= pageResults.length - 1 ? '#333' : '#94a3b8', display: 'flex', alignItems: 'center' }}><ChevronRight size={16} /></button>
                     </div>
                 )}
 
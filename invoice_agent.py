@@ -1,10 +1,17 @@
 import json
-from typing import Optional
+import threading
+import time
+from typing import Callable, Optional
+from tools.duplicate_index import DuplicateIndex, file_sha256, invoice_key, simhash, text_mentions_invoice
 from tools.pdf_extractor import PDFExtractor
-from tools.vector_indexer import VectorIndexer
+from tools.vector_indexer import VectorIndexer, date_key
 from tools.invoice_parser import InvoiceParser
+from tools.invoice_validator import InvoiceValidator
+from tools.model_router import ModelRouter
+from tools.text_preprocessor import estimate_tokens
 from tools.vendor_manager import VendorManager
-from models import InvoiceData, Vendor
+from config import Config
+from models import CompactInvoice, InvoiceData, InvoiceMetadata, ValidationReport, Vendor
 
 class InvoiceAgent:
     """
@@ -12,18 +19,181 @@ class InvoiceAgent:
     Coordinates all tools to process invoices and handle corrections
     """
     
-    def __init__(self):
-        self.pdf_extractor = PDFExtractor()
-        self.vector_indexer = VectorIndexer()
-        self.invoice_parser = InvoiceParser()
-        self.vendor_manager = VendorManager()
+    def __init__(
+        self,
+        pdf_extractor: Optional[PDFExtractor] = None,
+        vector_indexer: Optional[VectorIndexer] = None,
+        invoice_parser: Optional[InvoiceParser] = None,
+        vendor_manager: Optional[VendorManager] = None,
+        invoice_validator: Optional[InvoiceValidator] = None,
+        duplicate_index: Optional[DuplicateIndex] = None,
+        model_router: Optional[ModelRouter] = None
+    ):
+        # Tools are built lazily on first use (or by warm_up) so that
+        # constructing the agent costs nothing at import time
+        self._pdf_extractor = pdf_extractor
+        self._vector_indexer = vector_indexer
+        self._invoice_parser = invoice_parser
+        self._vendor_manager = vendor_manager
+        self._duplicate_index = duplicate_index
+        self._model_router = model_router
+        self.invoice_validator = invoice_validator or InvoiceValidator()
+        self._embedding_function = None
+        self._component_lock = threading.RLock()
+        self.ready = threading.Event()
+        self.warm_up_timings: dict = {}
+        self.warm_up_error: Optional[str] = None
         
         # Session state
         self.current_document_id: Optional[str] = None
         self.current_text: Optional[str] = None
         self.current_invoice_data: Optional[InvoiceData] = None
+        self.current_validation: Optional[ValidationReport] = None
     
-    def process_invoice(self, pdf_path: str, document_id: str) -> dict:
+    @property
+    def pdf_extractor(self) -> PDFExtractor:
+        if self._pdf_extractor is None:
+            with self._component_lock:
+                if self._pdf_extractor is None:
+                    self._pdf_extractor = PDFExtractor()
+        return self._pdf_extractor
+    
+    @property
+    def vector_indexer(self) -> VectorIndexer:
+        if self._vector_indexer is None:
+            with self._component_lock:
+                if self._vector_indexer is None:
+                    self._vector_indexer = VectorIndexer(embedding_function=self._get_embedding_function())
+        return self._vector_indexer
+    
+    @property
+    def invoice_parser(self) -> InvoiceParser:
+        if self._invoice_parser is None:
+            with self._component_lock:
+                if self._invoice_parser is None:
+                    self._invoice_parser = InvoiceParser()
+        return self._invoice_parser
+    
+    @property
+    def vendor_manager(self) -> VendorManager:
+        if self._vendor_manager is None:
+            with self._component_lock:
+                if self._vendor_manager is None:
+                    self._vendor_manager = VendorManager()
+        return self._vendor_manager
+    
+    @property
+    def duplicate_index(self) -> DuplicateIndex:
+        if self._duplicate_index is None:
+            with self._component_lock:
+                if self._duplicate_index is None:
+                    self._duplicate_index = DuplicateIndex(Config.DEDUPE_INDEX_PATH, Config.DEDUPE_MAX_DISTANCE)
+        return self._duplicate_index
+    
+    @property
+    def model_router(self) -> Optional[ModelRouter]:
+        """Model tier router, or None when MODEL_ROUTING is off (the tools' own model is used)"""
+        if self._model_router is None and Config.MODEL_ROUTING:
+            with self._component_lock:
+                if self._model_router is None:
+                    self._model_router = ModelRouter()
+        return self._model_router
+    
+    def warm_up(self, fork_safe: bool = False) -> dict:
+        """
+        Construct all tools and load their heavy state ahead of the first request
+        
+        Args:
+            fork_safe: Only load read-only state (embedding model, vendor index,
+                model clients) and leave Chroma/SQLite handles closed, so the
+                agent can be built before workers fork and shared copy-on-write
+            
+        Returns:
+            Seconds spent per warm-up step
+        """
+        steps = [
+            ("embedding_model", self._warm_embedding_model),
+            ("vendor_index", lambda: self.vendor_manager),
+            ("model_clients", lambda: (self.pdf_extractor, self.invoice_parser)),
+        ]
+        if not fork_safe:
+            steps.append(("vector_store", lambda: self.vector_indexer.collection.count()))
+        
+        try:
+            for name, step in steps:
+                started = time.perf_counter()
+                step()
+                self.warm_up_timings[name] = round(time.perf_counter() - started, 3)
+            if not fork_safe:
+                self.ready.set()
+            print(f"[SUCCESS] Agent warm-up complete: {self.warm_up_timings}")
+        except Exception as e:
+            self.warm_up_error = str(e)
+            print(f"[ERROR] Agent warm-up failed: {e}")
+            raise
+        return self.warm_up_timings
+    
+    def start_warm_up(self) -> threading.Thread:
+        """Run warm_up in a background thread"""
+        def run():
+            try:
+                self.warm_up()
+            except Exception:
+                pass
+        
+        thread = threading.Thread(target=run, name="agent-warm-up", daemon=True)
+        thread.start()
+        return thread
+    
+    def reset_after_fork(self):
+        """Drop handles that must not be shared across processes (call in a forked child)"""
+        self._vector_indexer = None
+        self._duplicate_index = None
+        self._component_lock = threading.RLock()
+        self.ready = threading.Event()
+
+    def new_session(self) -> "InvoiceAgent":
+        """
+        Agent sharing this agent's tools but with its own session state
+
+        Lets several documents run through process_invoice concurrently
+        (e.g. the page groups of one PDF) without overwriting each other's
+        current_* fields.
+        """
+        session = InvoiceAgent(
+            pdf_extractor=self.pdf_extractor,
+            vector_indexer=self.vector_indexer,
+            invoice_parser=self.invoice_parser,
+            vendor_manager=self.vendor_manager,
+            invoice_validator=self.invoice_validator,
+            duplicate_index=self.duplicate_index if Config.DEDUPE_INVOICES else None,
+            model_router=self.model_router
+        )
+        session._embedding_function = self._embedding_function
+        session.ready.set()
+        return session
+
+    def _get_embedding_function(self):
+        if self._embedding_function is None:
+            self._embedding_function = VectorIndexer.default_embedding_function()
+        return self._embedding_function
+    
+    def _warm_embedding_model(self):
+        """Load the embedding model weights by embedding a probe string"""
+        embedding_function = (
+            self._vector_indexer.embedding_function if self._vector_indexer is not None
+            else self._get_embedding_function()
+        )
+        embedding_function(["warm up"])
+    
+    def process_invoice(
+        self,
+        pdf_path: str,
+        document_id: str,
+        session: Optional[str] = None,
+        on_event: Optional[Callable[[dict], None]] = None,
+        page_type: Optional[str] = None
+    ) -> dict:
         """
         Complete invoice processing pipeline
         
@@ -35,6 +205,12 @@ class InvoiceAgent:
         Args:
             pdf_path: Path to PDF invoice
             document_id: Unique identifier for this invoice
+            session: Session label for index retention (e.g. "sample")
+            on_event: Streaming mode - model responses are streamed, text is
+                indexed while it is generated, and progress/field events are
+                passed to this callback
+            page_type: Page classification label ("invoice", "scanned"), used
+                to pick the model tier for text extraction
             
         Returns:
             Dictionary with invoice data and vendor info
@@ -42,36 +218,122 @@ class InvoiceAgent:
         print(f"\n{'='*60}")
         print(f"PROCESSING INVOICE: {document_id}")
         print(f"{'='*60}\n")
+        emit = on_event or (lambda event: None)
+        dedupe = Config.DEDUPE_INVOICES
+        
+        # Known file bytes: return the earlier result before any model call
+        sha256 = file_sha256(pdf_path) if dedupe else None
+        if dedupe:
+            duplicate = self._find_duplicate("file", self.duplicate_index.find_file(sha256), document_id)
+            if duplicate:
+                emit({"event": "duplicate", "document_id": document_id, **duplicate["duplicate"]})
+                return duplicate
         
         # Step 1: Extract text
         print("STEP 1: Extract Text from PDF")
         print("-" * 40)
-        self.current_text = self.pdf_extractor.extract_text(pdf_path, document_id)
+        emit({"event": "stage", "stage": "extract", "document_id": document_id})
+        index_stream = None
+        
+        def extract(model) -> str:
+            nonlocal index_stream
+            extractor = self.pdf_extractor.with_model(model)
+            if on_event is None:
+                return extractor.extract_text(pdf_path, document_id)
+            
+            # Step 2 runs alongside step 1: chunks are indexed as text arrives
+            if index_stream is not None:
+                # Escalated retry: drop what the failed attempt indexed
+                self.vector_indexer.delete_documents([document_id])
+            index_stream = self.vector_indexer.open_stream(document_id, session=session)
+            
+            def on_text(chunk: str):
+                index_stream.feed(chunk)
+                emit({"event": "text", "document_id": document_id, "chars": len(index_stream.text)})
+            
+            return extractor.extract_text(pdf_path, document_id, on_text=on_text)
+        
+        self.current_text = self._route(
+            "extract_text", extract, accept=lambda text: (bool(text.strip()), None), page_type=page_type
+        )
         self.current_document_id = document_id
         
+        # Near-duplicate text (rescans, forwards): skip indexing and parsing
+        fingerprint = simhash(self.current_text) if dedupe else None
+        if dedupe:
+            near = self.duplicate_index.find_near(fingerprint)
+            duplicate = near and self._find_duplicate(
+                "text", near[0], document_id, distance=near[1], text=self.current_text
+            )
+            if duplicate:
+                if on_event is not None:
+                    self.vector_indexer.delete_documents([document_id])
+                self.duplicate_index.add_file_hash(sha256, duplicate["document_id"])
+                emit({"event": "duplicate", "document_id": document_id, **duplicate["duplicate"]})
+                return duplicate
+        
         # Step 2: Index in vector database
         print(f"\nSTEP 2: Index Document in Vector Database")
         print("-" * 40)
-        self.vector_indexer.index_document(document_id, self.current_text)
+        emit({"event": "stage", "stage": "index", "document_id": document_id})
+        if on_event is None:
+            self.vector_indexer.index_document(document_id, self.current_text, session=session)
+        else:
+            index_stream.close()
         
         # Step 3: Parse invoice data
         print(f"\nSTEP 3: Parse Invoice Data")
         print("-" * 40)
-        self.current_invoice_data = self.invoice_parser.parse_invoice(self.current_text)
+        emit({"event": "stage", "stage": "parse", "document_id": document_id})
+        on_field = None
+        if on_event is not None:
+            def on_field(name: str, value):
+                emit({"event": "field", "document_id": document_id, "name": name, "value": value})
+        
+        def parse(model) -> Optional[ValidationReport]:
+            parser = self.invoice_parser.with_model(model)
+            self.current_invoice_data = parser.parse_invoice(self.current_text, on_field=on_field)
+            if not Config.VALIDATE_INVOICES:
+                return None
+            print(f"\nSTEP 3b: Validate and Repair")
+            print("-" * 40)
+            emit({"event": "stage", "stage": "validate", "document_id": document_id})
+            return self._validate_and_repair(max_reextractions=Config.VALIDATION_MAX_REEXTRACTIONS, parser=parser)
+        
+        self._route("parse", parse, accept=self._accept_validation, input_tokens=estimate_tokens(self.current_text))
         
         # Step 4: Handle vendor
         print(f"\nSTEP 4: Vendor Management")
         print("-" * 40)
+        emit({"event": "stage", "stage": "vendor", "document_id": document_id})
         vendor = self._handle_vendor()
         
+        # Same vendor, invoice number and total as an earlier invoice (resubmission)
+        key = None
+        if dedupe:
+            metadata = self.current_invoice_data.metadata
+            key = invoice_key(vendor.vendor_id if vendor else None, metadata.invoice_number, metadata.total_amount)
+            duplicate = self._find_duplicate("key", self.duplicate_index.find_key(key), document_id)
+            if duplicate:
+                self.vector_indexer.delete_documents([document_id])
+                self.duplicate_index.add_file_hash(sha256, duplicate["document_id"])
+                emit({"event": "duplicate", "document_id": document_id, **duplicate["duplicate"]})
+                return duplicate
+        
+        self._update_index_metadata(vendor)
+        
         # Prepare response
         result = {
             "document_id": document_id,
             "extracted_text": self.current_text,
             "invoice_data": self.current_invoice_data.model_dump(),
-            "vendor": vendor.model_dump() if vendor else None
+            "vendor": vendor.model_dump() if vendor else None,
+            "validation": self.current_validation.model_dump() if self.current_validation else None
         }
         
+        if dedupe:
+            self.duplicate_index.add(document_id, result, sha256=sha256, fingerprint=fingerprint, key=key)
+        
         print(f"\n{'='*60}")
         print(f"[SUCCESS] PROCESSING COMPLETE")
         print(f"{'='*60}\n")
@@ -117,22 +379,30 @@ class InvoiceAgent:
             print(f"[INFO] Using full document for correction")
         
         # Apply correction using re-prompting
-        self.current_invoice_data = self.invoice_parser.reprompt_correction(
-            focused_text,
-            self.current_invoice_data,
-            correction_query
+        self.current_invoice_data = self._route(
+            "correct",
+            lambda model: self.invoice_parser.with_model(model).reprompt_correction(
+                focused_text,
+                self.current_invoice_data,
+                correction_query
+            )
         )
+        if Config.VALIDATE_INVOICES:
+            # The user just steered the data: fix locally, but do not re-ask the model
+            self._validate_and_repair(max_reextractions=0)
         
         # Re-check vendor if vendor name was updated
         vendor = None
         if self.current_invoice_data.metadata.vendor_name:
             print(f"\nRe-checking vendor after correction...")
             vendor = self._handle_vendor()
+        self._update_index_metadata(vendor)
         
         result = {
             "document_id": self.current_document_id,
             "invoice_data": self.current_invoice_data.model_dump(),
-            "vendor": vendor.model_dump() if vendor else None
+            "vendor": vendor.model_dump() if vendor else None,
+            "validation": self.current_validation.model_dump() if self.current_validation else None
         }
         
         print(f"\n{'='*60}")
@@ -182,10 +452,14 @@ class InvoiceAgent:
             print(f"[WARNING] No relevant chunks found, using full document")
             focused_text = self.current_text
         
-        extracted = self.invoice_parser.extract_specific_field(
-            focused_text,
-            field_name,
-            context
+        extracted = self._route(
+            "field",
+            lambda model: self.invoice_parser.with_model(model).extract_specific_field(
+                focused_text,
+                field_name,
+                context
+            ),
+            accept=lambda result: (any(value is not None for value in result.values()), None)
         )
         
         print(f"\n{'='*60}")
@@ -194,6 +468,20 @@ class InvoiceAgent:
         
         return extracted
     
+    def search(self, query: str, **filters) -> dict:
+        """
+        Search all indexed invoices (not just the current one)
+        
+        Args:
+            query: Search query
+            **filters: vendor_id, currency, date_from, date_to, top_k, offset
+            
+        Returns:
+            Page of matching chunks with their invoice metadata
+        """
+        print(f"[SEARCH] Corpus search: '{query}' {filters}")
+        return self.vector_indexer.search(query, **filters)
+    
     def _build_semantic_query(self, field_name: str, context: Optional[str] = None) -> str:
         """Build semantic query from field name for better vector search"""
         # Field name to semantic query mapping
@@ -246,6 +534,154 @@ class InvoiceAgent:
             "invoice_data": self.current_invoice_data.model_dump()
         }
     
+    def _find_duplicate(
+        self,
+        match: str,
+        document_id: Optional[str],
+        new_document_id: str,
+        distance: Optional[int] = None,
+        text: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        Load an earlier result found by the duplicate index and make it current
+        
+        Args:
+            match: How the duplicate was found ("file", "text" or "key")
+            document_id: Document the index pointed at (None if no match)
+            new_document_id: Document being processed (re-processing a
+                document under its own ID is not a duplicate)
+            distance: SimHash distance for "text" matches
+            text: Extracted text of a "text" match; the earlier invoice's
+                number and total must appear in it, otherwise the match is
+                only a shared template and the document is parsed
+            
+        Returns:
+            The earlier result with a "duplicate" entry, or None if there is no
+            match or the earlier document has since been deleted
+        """
+        if document_id is None or document_id == new_document_id:
+            return None
+        result = self.duplicate_index.result(document_id)
+        if result is None or not self.vector_indexer.document_store.exists(document_id):
+            self.duplicate_index.remove([document_id])
+            return None
+        if text is not None:
+            metadata = (result.get("invoice_data") or {}).get("metadata") or {}
+            if not text_mentions_invoice(text, metadata.get("invoice_number"), metadata.get("total_amount")):
+                print(f"[DEDUPE] Text similar to {document_id} (distance {distance}) but its invoice "
+                      f"number/total differ, parsing")
+                return None
+        
+        print(f"[DEDUPE] Duplicate of {document_id} ({match} match"
+              f"{f', distance {distance}' if distance is not None else ''}), reusing its result")
+        self.current_document_id = document_id
+        self.current_text = self.vector_indexer.get_full_document(document_id)
+        self.current_invoice_data = InvoiceData(**result["invoice_data"]) if result.get("invoice_data") else None
+        self.current_validation = ValidationReport(**result["validation"]) if result.get("validation") else None
+        duplicate = {"of": document_id, "match": match}
+        if distance is not None:
+            duplicate["distance"] = distance
+        return {**result, "extracted_text": self.current_text, "duplicate": duplicate}
+    
+    def _validate_and_repair(
+        self,
+        max_reextractions: int = 0,
+        parser: Optional[InvoiceParser] = None
+    ) -> ValidationReport:
+        """
+        Validate the current invoice, fixing what can be fixed locally
+        
+        Metadata fields still failing a check are re-extracted one at a time
+        from their most relevant chunks (at most max_reextractions model
+        calls), keeping a new value only if it resolves that field's issue.
+        
+        Args:
+            max_reextractions: Model calls allowed for re-extraction
+            parser: Parser for re-extractions (defaults to invoice_parser;
+                routed parses pass their tier's parser)
+        
+        Returns:
+            Final ValidationReport (also stored as current_validation)
+        """
+        data, report = self.invoice_validator.repair(self.current_invoice_data, self.current_text)
+        reextracted = []
+        
+        for issue in report.issues:
+            if len(reextracted) >= max_reextractions:
+                break
+            field = issue.field
+            if not issue.reextract or field not in InvoiceMetadata.model_fields or field in reextracted:
+                continue
+            
+            print(f"[VALIDATE] Re-extracting {field} ({issue.code})")
+            reextracted.append(field)
+            query = self._build_semantic_query(field)
+            chunks = self.vector_indexer.query_document(self.current_document_id, query, n_results=2)
+            text = "\n\n".join(chunks) if chunks else self.current_text
+            value = (parser or self.invoice_parser).extract_specific_field(text, field).get(field)
+            if value is None or value == getattr(data.metadata, field):
+                continue
+            
+            try:
+                # Only the metadata is re-validated; line items are reused as-is
+                metadata = InvoiceMetadata(**{**data.metadata.model_dump(), field: value})
+            except ValueError:
+                continue
+            candidate = InvoiceData.model_construct(metadata=metadata, line_items=list(data.line_items))
+            candidate, candidate_report = self.invoice_validator.repair(candidate, self.current_text)
+            if not any(i.field == field and i.code == issue.code for i in candidate_report.issues):
+                print(f"[VALIDATE] {field} corrected to {value!r}")
+                data, report = candidate, candidate_report
+        
+        report.reextracted = reextracted
+        self.current_invoice_data = data
+        self.current_validation = report
+        print(f"[VALIDATE] {'Valid' if report.valid else f'{len(report.issues)} issue(s)'}, "
+              f"{len(report.fixes)} local fix(es), {len(reextracted)} re-extraction(s)")
+        return report
+    
+    def _route(self, task: str, call: Callable, accept: Optional[Callable] = None, **hints):
+        """
+        Run a model task on the routed tier, or on the tools' own model without routing
+        
+        Args:
+            task: Router task name ("extract_text", "parse", "correct", "field")
+            call: Called with the model to use (None for the tools' own model)
+            accept: Acceptance check for escalation (see ModelRouter.run)
+            **hints: input_tokens / page_type for the router
+        """
+        if self.model_router is None:
+            return call(None)
+        return self.model_router.run(task, call, accept, **hints)
+    
+    @staticmethod
+    def _accept_validation(report: Optional[ValidationReport]) -> tuple:
+        """
+        Parses are accepted unless an issue worth a re-ask remains
+        
+        Warnings the validator never re-asks about (e.g. line amounts that
+        differ because of discounts) do not escalate to a stronger tier.
+        The mean confidence of the fields found is recorded.
+        """
+        if report is None:
+            return True, None
+        scores = [score for score in report.confidence.values() if score > 0]
+        accepted = not any(issue.reextract for issue in report.issues)
+        return accepted, (sum(scores) / len(scores) if scores else None)
+    
+    def _update_index_metadata(self, vendor: Optional[Vendor]):
+        """Denormalize invoice and vendor fields into the current document's chunks (None clears a field)"""
+        metadata = self.current_invoice_data.metadata
+        self.vector_indexer.update_document_metadata(self.current_document_id, {
+            "vendor_id": vendor.vendor_id if vendor else None,
+            "vendor_name": vendor.name if vendor else metadata.vendor_name,
+            "invoice_number": metadata.invoice_number,
+            "invoice_date": metadata.invoice_date,
+            "invoice_date_key": date_key(metadata.invoice_date),
+            "currency": metadata.currency.upper() if metadata.currency else None,
+            "total_amount": metadata.total_amount,
+        })
+    
     def _handle_vendor(self) -> Optional[Vendor]:
         """Handle vendor search and creation"""
         vendor_name = self.current_invoice_data.metadata.vendor_name
@@ -277,7 +713,7 @@ class InvoiceAgent:
             print("No invoice data available")
             return
         
-        data = self.current_invoice_data
+        data = CompactInvoice.from_model(self.current_invoice_data)
         
         print("\n" + "="*60)
         print("[SUMMARY] INVOICE SUMMARY")
@@ -285,15 +721,15 @@ class InvoiceAgent:
         
         print("\n[METADATA]:")
         print("-" * 40)
-        for key, value in data.metadata.model_dump().items():
+        for key, value in data.metadata.items():
             if value is not None:
                 print(f"  {key:20s}: {value}")
         
-        print(f"\n[LINE ITEMS] ({len(data.line_items)} items):")
+        print(f"\n[LINE ITEMS] ({len(data)} items):")
         print("-" * 40)
-        for i, item in enumerate(data.line_items, 1):
+        for i, item in enumerate(data.rows(), 1):
             print(f"\n  Item {i}:")
-            for key, value in item.model_dump().items():
+            for key, value in item.items():
                 if value is not None:
                     print(f"    {key:15s}: {value}")
         
@@ -19,9 +19,10 @@ def print_menu():
     print("  3. extract <field_name>              - Extract specific field")
     print("  4. show                              - Show current invoice data")
     print("  5. save <output_file>                - Save current data to JSON file")
-    print("  6. vendors                           - List all vendors")
-    print("  7. help                              - Show this menu")
-    print("  8. exit                              - Exit application")
+    print("  6. export <out_dir> [parquet|arrow]  - Append current data to a columnar dataset")
+    print("  7. vendors                           - List all vendors")
+    print("  8. help                              - Show this menu")
+    print("  9. exit                              - Exit application")
     print("="*60)
 
 def print_help():
@@ -59,7 +60,14 @@ def print_help():
     print("   save <output_file>")
     print("   Example: save invoice_data.json")
     
-    print("\n6. LIST VENDORS:")
+    print("\n6. EXPORT TO PARQUET / ARROW:")
+    print("   export <out_dir> [parquet|arrow]")
+    print("   Example: export exports parquet")
+    print("   - Appends invoices and line_items tables (one part file per export)")
+    print("   - From the shell, JSON results can be exported in bulk:")
+    print("     python main.py export <out_dir> <results.json> [...] [--format arrow]")
+    
+    print("\n7. LIST VENDORS:")
     print("   vendors")
     print("   - Shows all vendors in the system")
     
@@ -156,6 +164,58 @@ def handle_save(agent: InvoiceAgent, args: list):
     except Exception as e:
         print(f"[ERROR] Error saving file: {e}")
 
+def handle_export(agent: InvoiceAgent, args: list):
+    """Handle export command (current invoice)"""
+    if len(args) < 1:
+        print("[ERROR] Missing output directory")
+        print("Usage: export <out_dir> [parquet|arrow]")
+        return
+    
+    data = agent.get_current_data()
+    if not data:
+        print("[WARNING] No invoice data to export")
+        return
+    
+    try:
+        from tools.invoice_exporter import InvoiceExporter
+        with InvoiceExporter(args[0], args[1] if len(args) > 1 else "parquet") as exporter:
+            exporter.add(data)
+        print(f"[SUCCESS] Exported {exporter.counts['invoices']} invoice(s), "
+              f"{exporter.counts['line_items']} line item(s) to: {args[0]}")
+        
+    except Exception as e:
+        print(f"[ERROR] Error exporting data: {e}")
+
+def export_files(args: list):
+    """
+    Bulk export saved JSON results (download / save / session files)
+    
+    Files are read one at a time, so memory use does not grow with the corpus.
+    """
+    format = "parquet"
+    if "--format" in args:
+        i = args.index("--format")
+        format = args[i + 1] if i + 1 < len(args) else format
+        args = args[:i] + args[i + 2:]
+    if len(args) < 2:
+        print("Usage: python main.py export <out_dir> <results.json> [...] [--format parquet|arrow]")
+        return
+    
+    from tools.invoice_exporter import InvoiceExporter
+    out_dir, paths = args[0], args[1:]
+    with InvoiceExporter(out_dir, format) as exporter:
+        for path in paths:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except Exception as e:
+                print(f"[ERROR] Skipping {path}: {e}")
+                continue
+            results = data.get("pages") or data.get("page_results") or ([data] if "invoice_data" in data else [])
+            exporter.add_all(results)
+    print(f"[SUCCESS] Exported {exporter.counts['invoices']} invoice(s), "
+          f"{exporter.counts['line_items']} line item(s) from {len(paths)} file(s) to: {out_dir}")
+
 def handle_vendors(agent: InvoiceAgent):
     """Handle vendors command"""
     vendors = agent.vendor_manager.list_vendors()
@@ -215,6 +275,9 @@ def interactive_mode():
             elif command == "save":
                 handle_save(agent, args)
             
+            elif command == "export":
+                handle_export(agent, args)
+            
             elif command == "vendors":
                 handle_vendors(agent)
             
@@ -236,13 +299,16 @@ def main():
         command = sys.argv[1].lower()
         args = sys.argv[2:]
         
-        if command == "process" and len(args) >= 2:
+        if command == "export":
+            export_files(args)
+        elif command == "process" and len(args) >= 2:
             handle_process(agent, args)
         elif command == "help":
             print_help()
         else:
             print("[ERROR] Invalid command line arguments")
             print("Usage: python main.py [process <pdf_path> <document_id>]")
+            print("       python main.py export <out_dir> <results.json> [...] [--format parquet|arrow]")
             print("Or run without arguments for interactive mode")
     else:
         # Interactive mode
@@ -1,10 +1,12 @@
+from dataclasses import dataclass
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from datetime import date
 
 class LineItem(BaseModel):
     """Represents a single line item in an invoice"""
     description: Optional[str] = None
+    hsn_sac: Optional[str] = Field(default=None, description="HSN/SAC code of the item, if printed")
     quantity: Optional[float] = None
     unit_price: Optional[float] = None
     amount: Optional[float] = None
@@ -33,6 +35,108 @@ class InvoiceData(BaseModel):
     metadata: InvoiceMetadata
     line_items: List[LineItem] = Field(default_factory=list)
 
+LINE_ITEM_FIELDS = tuple(LineItem.model_fields)
+METADATA_FIELDS = tuple(InvoiceMetadata.model_fields)
+
+@dataclass(slots=True)
+class CompactInvoice:
+    """
+    Column-oriented view of an invoice for internal hot paths
+    
+    Line items are held as one list per LineItem field, so sums and
+    arithmetic checks over thousands of rows need no per-row objects.
+    Changes are written back with apply_to(), which re-uses every
+    untouched LineItem instead of re-validating the whole invoice.
+    """
+    metadata: Dict[str, Any]
+    columns: Dict[str, list]
+    
+    @classmethod
+    def from_model(cls, data: InvoiceData) -> "CompactInvoice":
+        items = data.line_items
+        return cls(
+            metadata={name: getattr(data.metadata, name) for name in METADATA_FIELDS},
+            columns={name: [getattr(item, name) for item in items] for name in LINE_ITEM_FIELDS},
+        )
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> "CompactInvoice":
+        metadata = data.get("metadata") or {}
+        rows = data.get("line_items") or []
+        return cls(
+            metadata={name: metadata.get(name) for name in METADATA_FIELDS},
+            columns={name: [row.get(name) for row in rows] for name in LINE_ITEM_FIELDS},
+        )
+    
+    def to_dict(self) -> dict:
+        """Same shape as InvoiceData.model_dump()"""
+        return {"metadata": dict(self.metadata), "line_items": self.rows()}
+    
+    def rows(self) -> List[dict]:
+        return [dict(zip(LINE_ITEM_FIELDS, values)) for values in zip(*(self.columns[name] for name in LINE_ITEM_FIELDS))]
+    
+    def __len__(self) -> int:
+        return len(self.columns[LINE_ITEM_FIELDS[0]])
+    
+    def column_sum(self, name: str) -> Optional[float]:
+        """Sum of a numeric column, or None if it is empty or has gaps"""
+        values = self.columns[name]
+        return sum(values) if values and None not in values else None
+    
+    def apply_to(self, data: InvoiceData, rows=()) -> InvoiceData:
+        """
+        Return data updated from this view
+        
+        Args:
+            data: Invoice this view was built from
+            rows: Indices of line items changed in the view
+            
+        Returns:
+            New InvoiceData sharing all unchanged line items with data
+        """
+        changed = {k: v for k, v in self.metadata.items() if getattr(data.metadata, k) != v}
+        metadata = data.metadata.model_copy(update=changed) if changed else data.metadata
+        items = list(data.line_items)
+        for i in rows:
+            items[i] = items[i].model_copy(update={name: self.columns[name][i] for name in LINE_ITEM_FIELDS})
+        return InvoiceData.model_construct(metadata=metadata, line_items=items)
+
+class ValidationIssue(BaseModel):
+    """A failed check found while validating extracted invoice data"""
+    field: str  # suspected field, e.g. "total_amount" or "line_items[2].amount"
+    code: str
+    message: str
+    reextract: bool = False  # worth a targeted model re-extraction
+
+class ValidationReport(BaseModel):
+    """Result of validating (and locally repairing) invoice data"""
+    valid: bool
+    issues: List[ValidationIssue] = Field(default_factory=list)
+    fixes: List[str] = Field(default_factory=list)
+    confidence: Dict[str, float] = Field(default_factory=dict)
+    reextracted: List[str] = Field(default_factory=list)
+
+class PageClassification(BaseModel):
+    """Local (model-free) classification of a PDF page"""
+    label: str  # "invoice", "blank", "other" (non-invoice text) or "scanned" (image only, needs the model)
+    text_chars: int = 0
+    image_entropy: float = 0.0  # estimated bits per pixel of the page images
+    invoice_score: int = 0
+    other_score: int = 0
+    text: str = Field(default="", exclude=True)  # text layer, reused for text-only indexing
+
+class ImagePreprocessing(BaseModel):
+    """What image preprocessing did to an upload before it was sent to the model"""
+    mime_type: str  # of the bytes sent
+    bytes_in: int
+    bytes_out: int
+    size_in: List[int]  # [width, height]
+    size_out: List[int]
+    cropped: bool = False
+    skew_degrees: float = 0.0
+    preprocess_ms: float = 0.0
+    model_ms: Optional[float] = None  # upload + text extraction
+
 class Vendor(BaseModel):
     """Vendor master data"""
     vendor_id: str
@@ -1,18 +1,45 @@
 import os
+import gc
+import json
+import asyncio
 import shutil
 import uuid
 import io
-from typing import Optional, List
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Optional, List
+from email.utils import formatdate, parsedate_to_datetime
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 from invoice_agent import InvoiceAgent
+from tools.vector_indexer import VectorIndexer
+from tools.model_provider import create_model
+from tools.duplicate_index import file_sha256
+from tools.page_classifier import PageClassifier, group_invoice_pages
+from tools.image_preprocessor import ImagePreprocessor
+from tools.text_preprocessor import estimate_tokens
+from tools.scheduler import RequestScheduler, SchedulerSaturated
+from tools.failed_pages import FailedPageStore
+from tools.model_resilience import CircuitOpenError, breaker_stats
+from tools import compression
 from PyPDF2 import PdfReader, PdfWriter
 from config import Config
+from models import InvoiceData
 
 app = FastAPI(title="IDP AI Agent API")
 
+# Compression: brotli for clients that accept it (when installed), gzip otherwise
+app.add_middleware(GZipMiddleware, minimum_size=Config.COMPRESSION_MIN_SIZE)
+if compression.brotli is not None:
+    app.add_middleware(compression.BrotliMiddleware, minimum_size=Config.COMPRESSION_MIN_SIZE)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -21,8 +48,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Construction is cheap; tools are built by the warm-up hook or on first use
 agent = InvoiceAgent()
 
+if Config.AGENT_PRELOAD:
+    # Fork-friendly mode (e.g. gunicorn --preload): load read-only state once in
+    # the master, keep it out of GC bookkeeping so pages stay shared
+    # copy-on-write, and reopen per-process handles in each worker.
+    agent.warm_up(fork_safe=True)
+    gc.freeze()
+    os.register_at_fork(after_in_child=agent.reset_after_fork)
+
+# Agent work runs on the scheduler's threads: uploads in the bulk class,
+# corrections, field lookups and searches in the interactive class
+scheduler = RequestScheduler()
+
+
+async def schedule(priority: str, fn, *args):
+    """Run blocking agent work through the scheduler; 429 with Retry-After when its queue is full"""
+    try:
+        future = scheduler.submit(priority, fn, *args)
+    except SchedulerSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return await asyncio.wrap_future(future)
+
+
+@app.on_event("startup")
+async def start_agent_warm_up():
+    agent.start_warm_up()
+
 @app.get("/")
 async def root():
     return {"status": "ok", "service": "IDP AI Agent API"}
@@ -31,6 +85,18 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness: 200 once the agent is warmed up, 503 until then"""
+    if agent.ready.is_set():
+        return {"status": "ready", "warm_up_seconds": agent.warm_up_timings}
+    status = "failed" if agent.warm_up_error else "warming_up"
+    return JSONResponse(status_code=503, content={
+        "status": status,
+        "error": agent.warm_up_error,
+        "warm_up_seconds": agent.warm_up_timings,
+    })
+
 UPLOAD_DIR = "temp_uploads"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -41,31 +107,135 @@ ALLOWED_TYPES = {
     "image/jpeg": ".jpg",
 }
 
+def file_version(path: str) -> Optional[tuple]:
+    """(inode, mtime_ns, size) of a file: changes whenever it is rewritten, costs one stat"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+# Parsed session, reused until session_data.json changes on disk (e.g. written by another worker)
+_session_cache = {"version": None, "path": None, "data": (None, [])}
+
 # Track current uploaded file and results
 # Persistent storage helpers
 def save_session(file_path: Optional[str], results: List[dict]):
     import json
+    # Page text lives in the document store; /documents/{id}/text serves it
     data = {
         "current_file_path": file_path,
-        "page_results": results
+        "page_results": [{k: v for k, v in r.items() if k != "extracted_text"} for r in results]
     }
-    with open(Config.SESSION_DATA_PATH, "w") as f:
+    # Replace atomically so concurrent readers never see a partial file
+    tmp_path = f"{Config.SESSION_DATA_PATH}.tmp"
+    with open(tmp_path, "w") as f:
         json.dump(data, f)
+    os.replace(tmp_path, Config.SESSION_DATA_PATH)
+    _session_cache.update(
+        version=file_version(Config.SESSION_DATA_PATH),
+        path=Config.SESSION_DATA_PATH,
+        data=(data["current_file_path"], data["page_results"]),
+    )
 
 def load_session():
     import json
-    if not os.path.exists(Config.SESSION_DATA_PATH):
+    version = file_version(Config.SESSION_DATA_PATH)
+    if version is None:
         return None, []
+    if version == _session_cache["version"] and _session_cache["path"] == Config.SESSION_DATA_PATH:
+        return _session_cache["data"]
     try:
         with open(Config.SESSION_DATA_PATH, "r") as f:
             data = json.load(f)
-            return data.get("current_file_path"), data.get("page_results", [])
     except:
         return None, []
+    loaded = (data.get("current_file_path"), data.get("page_results", []))
+    _session_cache.update(version=version, path=Config.SESSION_DATA_PATH, data=loaded)
+    return loaded
 
 # Global variables for backward compatibility/quick access, but we'll sync with disk
 current_file_path, page_results = load_session()
 
+# Keys kept in every page when ?fields= selects a subset
+PAGE_KEYS = ("document_id", "page_number", "page_numbers", "error")
+
+
+def page_text(page: dict) -> str:
+    """Extracted text of a page result (older sessions stored it inline)"""
+    if page.get("extracted_text") is not None:
+        return page["extracted_text"]
+    if not page.get("document_id"):
+        return ""
+    return agent.vector_indexer.get_full_document(page["document_id"])
+
+
+# Per-document agent state carried between sessions and the shared agent
+SESSION_STATE = ("current_document_id", "current_text", "current_invoice_data", "current_validation")
+
+
+def adopt_session(session: InvoiceAgent):
+    """Make a session's document the agent's current document"""
+    for name in SESSION_STATE:
+        setattr(agent, name, getattr(session, name))
+
+
+def page_session(pages: List[dict], page_index: Optional[int]) -> InvoiceAgent:
+    """Agent session loaded with a page's state, or the current document's"""
+    session = agent.new_session()
+    for name in SESSION_STATE:
+        setattr(session, name, getattr(agent, name))
+    if page_index is not None and 0 <= page_index < len(pages):
+        pg = pages[page_index]
+        session.current_document_id = pg.get("document_id")
+        session.current_text = page_text(pg)
+        if pg.get("invoice_data"):
+            session.current_invoice_data = InvoiceData(**pg["invoice_data"])
+    return session
+
+
+def select_fields(obj: dict, paths: List[List[str]]) -> dict:
+    """Project a nested dict onto dotted paths (e.g. invoice_data.metadata.total_amount)"""
+    selected = {}
+    for path in paths:
+        source, target = obj, selected
+        for depth, key in enumerate(path):
+            if not isinstance(source, dict) or key not in source:
+                break
+            if depth == len(path) - 1 or source[key] is None:
+                target[key] = source[key]
+                break
+            source = source[key]
+            target = target.setdefault(key, {})
+    return selected
+
+
+def shape_pages(pages: List[dict], fields: Optional[str] = None, include_text: bool = True) -> List[dict]:
+    """
+    Shape page results for a response
+
+    Args:
+        pages: Page results
+        fields: Comma-separated dotted paths to return (document_id,
+            page_number and error are always kept)
+        include_text: Include extracted_text (loaded on demand if the page
+            no longer carries it)
+    """
+    paths = [f.strip().split(".") for f in fields.split(",") if f.strip()] if fields else None
+    if paths is not None:
+        include_text = include_text and any(path[0] == "extracted_text" for path in paths)
+
+    shaped = []
+    for result in pages:
+        page = {k: v for k, v in result.items() if k != "extracted_text"}
+        if include_text:
+            page["extracted_text"] = page_text(result)
+        if paths is not None:
+            page = {**{k: page[k] for k in PAGE_KEYS if k in page}, **select_fields(page, paths)}
+        shaped.append(page)
+    return shaped
+
 
 class CorrectionRequest(BaseModel):
     query: str
@@ -76,28 +246,234 @@ class ExtractionRequest(BaseModel):
     page_index: Optional[int] = None
     context: Optional[str] = None
 
-
-def split_pdf_pages(pdf_path: str) -> List[str]:
-    """Split a multi-page PDF into individual single-page PDF files."""
+class RetentionRequest(BaseModel):
+    max_age_days: Optional[float] = None
+    session: Optional[str] = None
+    session_max_age_hours: Optional[float] = None
+
+class DeleteDocumentsRequest(BaseModel):
+    document_ids: List[str]
+
+
+# Model calls process_invoice makes for a page at minimum (text extraction + parsing)
+PAGE_MODEL_CALLS = 2
+
+# Page groups whose processing failed, retried in the background
+failed_pages = FailedPageStore()
+
+# Failures a retry cannot fix: missing files, unrecorded requests in replay mode
+PERMANENT_ERRORS = (FileNotFoundError, LookupError)
+
+
+def failed_page_result(
+    document_id: str,
+    error: Exception,
+    pdf_path: str,
+    page_numbers: List[int],
+    session: Optional[str] = None,
+    page_type: Optional[str] = None
+) -> dict:
+    """Result of a failed page group; transient failures are queued for a later retry"""
+    result = {"document_id": document_id, "error": str(error), "error_type": type(error).__name__,
+              "invoice_data": None, "vendor": None, "retry_scheduled": False}
+    if not isinstance(error, PERMANENT_ERRORS):
+        failed_pages.add(document_id, pdf_path, page_numbers, str(error), session=session, page_type=page_type)
+        result["retry_scheduled"] = True
+    if isinstance(error, CircuitOpenError):
+        result["retry_after"] = round(error.retry_after)
+    return result
+
+
+def write_pdf_pages(reader: PdfReader, indexes: List[int]) -> str:
+    """Write the given pages of a PDF to a temporary PDF file."""
+    writer = PdfWriter()
+    for i in indexes:
+        writer.add_page(reader.pages[i])
+    path = os.path.join(UPLOAD_DIR, f"page_{indexes[0]}_{uuid.uuid4().hex[:6]}.pdf")
+    with open(path, "wb") as f:
+        writer.write(f)
+    return path
+
+
+def process_pdf_pages(
+    pdf_path: str,
+    doc_base: str,
+    session: Optional[str] = None,
+    on_event=None,
+    on_result=None
+) -> tuple:
+    """
+    Process a multi-page PDF as a set of logical invoices
+
+    Pages are classified locally first: blank pages are skipped and
+    non-invoice pages (cover letters, T&C, remittance slips) are indexed
+    from their text layer, so only invoice and scanned pages reach the model.
+    Continuation pages are grouped with the invoice they belong to (see
+    group_invoice_pages) and each group is extracted and parsed as one
+    document. Groups run concurrently on PAGE_GROUP_WORKERS threads, each
+    with its own agent session.
+
+    Args:
+        pdf_path: Multi-page PDF
+        doc_base: Document ID prefix ("-P<first>[-<last>]" is appended per group)
+        session: Session label for index retention
+        on_event: Streaming mode - progress events (with page_number)
+        on_result: Called with each group result as it completes
+
+    Returns:
+        Tuple of (results in page order, page classification summary)
+    """
     reader = PdfReader(pdf_path)
-    page_paths = []
-    for i, page in enumerate(reader.pages):
-        writer = PdfWriter()
-        writer.add_page(page)
-        page_path = os.path.join(UPLOAD_DIR, f"page_{i}_{uuid.uuid4().hex[:6]}.pdf")
-        with open(page_path, "wb") as f:
-            writer.write(f)
-        page_paths.append(page_path)
-    return page_paths
+    num_pages = len(reader.pages)
+    classes = []
+    if Config.CLASSIFY_PAGES or Config.GROUP_PAGES:
+        classes = PageClassifier().classify_pdf(pdf_path)
+        if not Config.CLASSIFY_PAGES:
+            # Every page goes to the model; text pages may still be grouped
+            classes = [c if c.label == "scanned" else c.model_copy(update={"label": "invoice"}) for c in classes]
+
+    if Config.GROUP_PAGES:
+        units = group_invoice_pages(classes)
+    else:
+        units = [[i] for i in range(num_pages) if not classes or classes[i].label in ("invoice", "scanned")]
+    grouped = {i for unit in units for i in unit}
+    units = sorted(units + [[i] for i in range(num_pages) if i not in grouped])
+
+    summary = {"invoice": 0, "scanned": 0, "blank": 0, "other": 0, "invoices": 0, "model_calls_avoided": 0}
+    for i in range(num_pages):
+        summary[classes[i].label if classes else "invoice"] += 1
+
+    # PdfReader is not thread-safe: write the group files before fanning out
+    paths = {}
+    for unit in units:
+        if not classes or classes[unit[0]].label in ("invoice", "scanned"):
+            paths[unit[0]] = write_pdf_pages(reader, unit)
+            summary["invoices"] += 1
+            summary["model_calls_avoided"] += PAGE_MODEL_CALLS * (len(unit) - 1)
+        else:
+            summary["model_calls_avoided"] += PAGE_MODEL_CALLS
+
+    def process_unit(unit: List[int]) -> tuple:
+        first, last = unit[0] + 1, unit[-1] + 1
+        page_id = f"{doc_base}-P{first}" if first == last else f"{doc_base}-P{first}-{last}"
+        page_class = classes[unit[0]] if classes else None
+        label = page_class.label if page_class else "invoice"
+        page_session = None
+        try:
+            if label == "blank":
+                print(f"[CLASSIFY] Page {first}: blank, skipped")
+                result = {"document_id": page_id, "skipped": "blank", "invoice_data": None, "vendor": None}
+            elif label == "other":
+                print(f"[CLASSIFY] Page {first}: not an invoice, indexed from its text layer")
+                agent.vector_indexer.index_document(page_id, page_class.text, session=session)
+                result = {"document_id": page_id, "skipped": "not_invoice", "invoice_data": None, "vendor": None}
+            else:
+                if first != last:
+                    print(f"[CLASSIFY] Pages {first}-{last}: one invoice")
+                page_emit = (lambda event: on_event({**event, "page_number": first})) if on_event else None
+                page_session = agent.new_session()
+                result = page_session.process_invoice(
+                    paths[unit[0]], page_id, session=session, on_event=page_emit, page_type=label
+                )
+        except Exception as e:
+            page_session = None
+            result = failed_page_result(page_id, e, pdf_path, [i + 1 for i in unit], session, label)
+        finally:
+            if unit[0] in paths:
+                try: os.remove(paths[unit[0]])
+                except: pass
 
+        result["page_number"] = first
+        result["page_numbers"] = [i + 1 for i in unit]
+        if page_class:
+            result["page_class"] = page_class.model_dump()
+        return result, page_session
+
+    workers = max(1, min(Config.PAGE_GROUP_WORKERS, len(units)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page-group") as pool:
+        futures = [pool.submit(process_unit, unit) for unit in units]
+        for future in as_completed(futures):
+            result, _ = future.result()
+            if on_result:
+                on_result(result)
+        results = [future.result() for future in futures]
+
+    # Leave the last processed invoice as the agent's current document
+    sessions = [page_session for _, page_session in results if page_session]
+    if sessions:
+        adopt_session(sessions[-1])
+
+    print(f"[CLASSIFY] {summary}")
+    return [result for result, _ in results], summary
+
+
+def retry_failed_pages(due_only: bool = True) -> dict:
+    """
+    Reprocess page groups from the failed-page store
+
+    Recovered groups replace their failed entry in the current session when
+    they belong to it. Retrying stops at the first open circuit; the
+    remaining groups stay queued.
+
+    Args:
+        due_only: Only retry groups whose backoff has elapsed
+
+    Returns:
+        Document IDs recovered, failed again and still pending
+    """
+    global current_file_path, page_results
+    entries = failed_pages.due() if due_only else failed_pages.list()
+    recovered, failed = [], []
+    for entry in entries:
+        document_id = entry["document_id"]
+        if not os.path.exists(entry["file_path"]):
+            print(f"[RETRY] {document_id}: {entry['file_path']} is gone, dropping")
+            failed_pages.resolve(document_id)
+            continue
+
+        path = write_pdf_pages(PdfReader(entry["file_path"]), [n - 1 for n in entry["page_numbers"]])
+        try:
+            print(f"[RETRY] {document_id}: attempt {entry['attempts'] + 1}")
+            result = agent.new_session().process_invoice(
+                path, document_id, session=entry["session"], page_type=entry["page_type"]
+            )
+        except CircuitOpenError as e:
+            print(f"[RETRY] {e}; retrying later")
+            break
+        except Exception as e:
+            failed_pages.add(document_id, entry["file_path"], entry["page_numbers"], str(e),
+                             session=entry["session"], page_type=entry["page_type"])
+            failed.append(document_id)
+            continue
+        finally:
+            try: os.remove(path)
+            except: pass
+
+        failed_pages.resolve(document_id)
+        recovered.append(document_id)
+        current_file_path, page_results = load_session()
+        if current_file_path == entry["file_path"]:
+            for i, page in enumerate(page_results):
+                if page.get("document_id") == document_id:
+                    keep = {k: page[k] for k in ("page_number", "page_numbers", "page_class") if k in page}
+                    page_results[i] = {**result, **keep}
+            save_session(current_file_path, page_results)
+
+    return {"recovered": recovered, "failed": failed, "pending": len(failed_pages.list())}
 
-def process_image_as_invoice(image_path: str, document_id: str) -> dict:
-    """Process a single image through the Gemini model as an invoice."""
-    import google.generativeai as genai
 
-    Config.validate()
-    genai.configure(api_key=Config.GOOGLE_API_KEY)
-    model = genai.GenerativeModel(Config.GEMINI_MODEL)
+def process_image_as_invoice(image_path: str, document_id: str) -> dict:
+    """
+    Process a single image through the Gemini model as an invoice.
+    Runs on its own agent session, adopted as the current document when done.
+    """
+    session = agent.new_session()
+    sha256 = file_sha256(image_path) if Config.DEDUPE_INVOICES else None
+    if sha256:
+        duplicate = session._find_duplicate("file", session.duplicate_index.find_file(sha256), document_id)
+        if duplicate:
+            adopt_session(session)
+            return duplicate
 
     with open(image_path, "rb") as f:
         image_data = f.read()
@@ -105,6 +481,10 @@ def process_image_as_invoice(image_path: str, document_id: str) -> dict:
     ext = os.path.splitext(image_path)[1].lower()
     mime_map = {".webp": "image/webp", ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
     mime = mime_map.get(ext, "image/png")
+    preprocessing = None
+    if Config.PREPROCESS_IMAGES:
+        image_data, preprocessing = ImagePreprocessor().preprocess(image_data, mime)
+        mime = preprocessing.mime_type
 
     prompt = """
     Extract all readable text from this invoice image.
@@ -112,8 +492,17 @@ def process_image_as_invoice(image_path: str, document_id: str) -> dict:
     Include all headers, tables, line items, totals, and footer information.
     """
 
-    response = model.generate_content([prompt, {"mime_type": mime, "data": image_data}])
-    extracted_text = response.text
+    start = time.perf_counter()
+    extracted_text = session._route(
+        "extract_text",
+        lambda model: (model or create_model()).generate_content([prompt, {"mime_type": mime, "data": image_data}]).text,
+        accept=lambda text: (bool(text.strip()), None),
+        page_type="image"
+    )
+    if preprocessing:
+        preprocessing.model_ms = round((time.perf_counter() - start) * 1000, 1)
+        print(f"[IMAGE] Sent {preprocessing.bytes_out:,} of {preprocessing.bytes_in:,} bytes; "
+              f"preprocessing {preprocessing.preprocess_ms:.0f} ms, model {preprocessing.model_ms:.0f} ms")
 
     # Save extracted text
     output_path = os.path.join(Config.EXTRACTED_TEXT_DIR, f"{document_id}_extracted.txt")
@@ -122,25 +511,44 @@ def process_image_as_invoice(image_path: str, document_id: str) -> dict:
         out.write(extracted_text)
 
     # Now index + parse + vendor (reuse agent internals)
-    agent.current_text = extracted_text
-    agent.current_document_id = document_id
-    agent.vector_indexer.index_document(document_id, extracted_text)
-    agent.current_invoice_data = agent.invoice_parser.parse_invoice(extracted_text)
-    vendor = agent._handle_vendor()
-
-    return {
+    session.current_text = extracted_text
+    session.current_document_id = document_id
+    session.vector_indexer.index_document(document_id, extracted_text)
+
+    def parse(model):
+        parser = session.invoice_parser.with_model(model)
+        session.current_invoice_data = parser.parse_invoice(extracted_text)
+        if not Config.VALIDATE_INVOICES:
+            return None
+        return session._validate_and_repair(max_reextractions=Config.VALIDATION_MAX_REEXTRACTIONS, parser=parser)
+
+    validation = session._route(
+        "parse", parse, accept=session._accept_validation, input_tokens=estimate_tokens(extracted_text)
+    )
+    vendor = session._handle_vendor()
+    session._update_index_metadata(vendor)
+
+    result = {
         "document_id": document_id,
         "extracted_text": extracted_text,
-        "invoice_data": agent.current_invoice_data.model_dump(),
+        "invoice_data": session.current_invoice_data.model_dump(),
         "vendor": vendor.model_dump() if vendor else None,
+        "validation": validation.model_dump() if validation else None,
+        "image_preprocessing": preprocessing.model_dump() if preprocessing else None,
     }
+    if sha256:
+        session.duplicate_index.add(document_id, result, sha256=sha256)
+    adopt_session(session)
+    return result
 
 
 @app.post("/process")
-async def process_invoice(file: UploadFile = File(...)):
+async def process_invoice(
+    file: UploadFile = File(...),
+    fields: Optional[str] = Query(None, description="Comma-separated dotted fields to return"),
+    include_text: bool = Query(True, description="Include each page's extracted_text"),
+):
     """Upload and process a PDF or image invoice. Multi-page PDFs return per-page results."""
-    global current_file_path, page_results
-
     content_type = file.content_type or ""
     filename = file.filename or ""
     ext_lower = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
@@ -152,66 +560,158 @@ async def process_invoice(file: UploadFile = File(...)):
     if not is_pdf and not is_image:
         raise HTTPException(status_code=400, detail="Supported formats: PDF, PNG, JPG, WebP")
 
-    doc_base = f"DOC-{uuid.uuid4().hex[:8].upper()}"
-    ext = ".pdf" if is_pdf else f".{ext_lower}"
-    file_path = os.path.join(UPLOAD_DIR, f"{doc_base}{ext}")
+    def work():
+        global current_file_path, page_results
 
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+        doc_base = f"DOC-{uuid.uuid4().hex[:8].upper()}"
+        ext = ".pdf" if is_pdf else f".{ext_lower}"
+        file_path = os.path.join(UPLOAD_DIR, f"{doc_base}{ext}")
 
-    current_file_path = file_path
-    page_results = []
-    save_session(current_file_path, page_results)
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
 
-    try:
-        if is_image:
-            # Single image → single result
-            result = process_image_as_invoice(file_path, doc_base)
-            page_results = [result]
+        current_file_path = file_path
+        page_results = []
+        save_session(current_file_path, page_results)
+
+        try:
+            if is_image:
+                # Single image → single result
+                result = process_image_as_invoice(file_path, doc_base)
+                page_results = [result]
+                save_session(current_file_path, page_results)
+                return {"pages": shape_pages(page_results, fields, include_text), "total_pages": 1}
+
+            # PDF — check page count
+            reader = PdfReader(file_path)
+            num_pages = len(reader.pages)
+
+            if num_pages == 1:
+                session = agent.new_session()
+                result = session.process_invoice(file_path, doc_base)
+                adopt_session(session)
+                page_results = [result]
+                save_session(current_file_path, page_results)
+                return {"pages": shape_pages(page_results, fields, include_text), "total_pages": 1}
+
+            # Multi-page: classify and group pages, then process each invoice
+            page_results, classification = process_pdf_pages(file_path, doc_base)
             save_session(current_file_path, page_results)
-            return {"pages": page_results, "total_pages": 1}
+            return {
+                "pages": shape_pages(page_results, fields, include_text),
+                "total_pages": num_pages,
+                "classification": classification,
+            }
 
-        # PDF — check page count
-        reader = PdfReader(file_path)
-        num_pages = len(reader.pages)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-        if num_pages == 1:
-            result = agent.process_invoice(file_path, doc_base)
-            page_results = [result]
-            save_session(current_file_path, page_results)
-            return {"pages": page_results, "total_pages": 1}
+    return await schedule("bulk", work)
+
+
+def stream_events(run, priority: str = "bulk"):
+    """
+    Queue run(emit) on the scheduler and return a generator of the emitted
+    events as NDJSON lines. Raises 429 before streaming when the queue is full.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def emit(event: dict):
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def finished(future):
+        if future.exception() is not None:
+            emit({"event": "error", "detail": str(future.exception())})
+        loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    try:
+        future = scheduler.submit(priority, run, emit)
+    except SchedulerSaturated as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    future.add_done_callback(finished)
+
+    async def events():
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield json.dumps(event) + "\n"
+
+    return events()
+
+
+@app.post("/process/stream")
+async def process_invoice_stream(
+    file: UploadFile = File(...),
+    fields: Optional[str] = Query(None, description="Comma-separated dotted fields to return"),
+    include_text: bool = Query(True, description="Include each page's extracted_text"),
+):
+    """
+    Upload and process an invoice, streaming progress as NDJSON events.
+    Metadata fields are sent as soon as the model has produced them
+    ("field" events), followed by a "page_result" per page and "done".
+    """
+    content_type = file.content_type or ""
+    filename = file.filename or ""
+    ext_lower = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+    is_pdf = content_type == "application/pdf" or ext_lower == "pdf"
+    is_image = content_type in ("image/webp", "image/png", "image/jpeg") or ext_lower in ("webp", "png", "jpg", "jpeg")
+
+    if not is_pdf and not is_image:
+        raise HTTPException(status_code=400, detail="Supported formats: PDF, PNG, JPG, WebP")
+
+    def run(emit):
+        global current_file_path, page_results
+
+        doc_base = f"DOC-{uuid.uuid4().hex[:8].upper()}"
+        ext = ".pdf" if is_pdf else f".{ext_lower}"
+        file_path = os.path.join(UPLOAD_DIR, f"{doc_base}{ext}")
 
-        # Multi-page: split and process each page
-        page_paths = split_pdf_pages(file_path)
-        for i, pp in enumerate(page_paths):
-            page_id = f"{doc_base}-P{i+1}"
+        with open(file_path, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+
+        current_file_path = file_path
+        page_results = []
+        save_session(current_file_path, page_results)
+
+        num_pages = 1 if is_image else len(PdfReader(file_path).pages)
+        if is_image:
+            result = process_image_as_invoice(file_path, doc_base)
+            page_results = [result]
+            emit({"event": "page_result", "page_number": 1, "result": shape_pages([result], fields, include_text)[0]})
+        elif num_pages == 1:
+            page_emit = lambda event: emit({**event, "page_number": 1})
             try:
-                result = agent.process_invoice(pp, page_id)
-                result["page_number"] = i + 1
-                page_results.append(result)
+                session = agent.new_session()
+                result = session.process_invoice(file_path, doc_base, on_event=page_emit)
+                adopt_session(session)
             except Exception as e:
-                page_results.append({
-                    "page_number": i + 1,
-                    "document_id": page_id,
-                    "error": str(e),
-                    "invoice_data": None,
-                    "vendor": None,
-                })
-            finally:
-                # cleanup single-page temp file
-                try: os.remove(pp)
-                except: pass
-
-        return {"pages": page_results, "total_pages": num_pages}
+                result = failed_page_result(doc_base, e, file_path, [1])
+            result["page_number"] = 1
+            page_results = [result]
+            emit({"event": "page_result", "page_number": 1, "result": shape_pages([result], fields, include_text)[0]})
+        else:
+            def on_result(result):
+                page_results.append(result)
+                emit({"event": "page_result", "page_number": result["page_number"],
+                      "result": shape_pages([result], fields, include_text)[0]})
+            page_results, classification = process_pdf_pages(file_path, doc_base, on_event=emit, on_result=on_result)
+            emit({"event": "classification", **classification})
+        save_session(current_file_path, page_results)
+        emit({"event": "done", "total_pages": num_pages})
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return StreamingResponse(stream_events(run), media_type="application/x-ndjson")
 
 
 @app.post("/process-sample")
-async def process_sample(sample_name: str = Form("sample.pdf")):
+async def process_sample(
+    sample_name: str = Form("sample.pdf"),
+    fields: Optional[str] = Query(None, description="Comma-separated dotted fields to return"),
+    include_text: bool = Query(True, description="Include each page's extracted_text"),
+):
     """Process a built-in sample PDF"""
-    global current_file_path, page_results
     allowed = {"sample.pdf", "test.pdf"}
     if sample_name not in allowed:
         raise HTTPException(status_code=400, detail=f"Choose from: {allowed}")
@@ -223,139 +723,631 @@ async def process_sample(sample_name: str = Form("sample.pdf")):
     if not os.path.exists(sample_path):
         raise HTTPException(status_code=404, detail=f"{sample_name} not found at {sample_path}")
 
-    doc_base = f"SAMPLE-{uuid.uuid4().hex[:6].upper()}"
-    dest = os.path.join(UPLOAD_DIR, f"{doc_base}.pdf")
-    shutil.copy2(sample_path, dest)
-    current_file_path = dest
-    page_results = []
-    save_session(current_file_path, page_results)
+    def work():
+        global current_file_path, page_results
 
-    try:
-        reader = PdfReader(dest)
-        num_pages = len(reader.pages)
+        doc_base = f"SAMPLE-{uuid.uuid4().hex[:6].upper()}"
+        dest = os.path.join(UPLOAD_DIR, f"{doc_base}.pdf")
+        shutil.copy2(sample_path, dest)
+        current_file_path = dest
+        page_results = []
+        save_session(current_file_path, page_results)
 
-        if num_pages == 1:
-            result = agent.process_invoice(dest, doc_base)
-            page_results = [result]
+        try:
+            reader = PdfReader(dest)
+            num_pages = len(reader.pages)
+
+            if num_pages == 1:
+                session = agent.new_session()
+                result = session.process_invoice(dest, doc_base, session="sample")
+                adopt_session(session)
+                page_results = [result]
+                save_session(current_file_path, page_results)
+                return {"pages": shape_pages(page_results, fields, include_text), "total_pages": 1}
+
+            page_results, classification = process_pdf_pages(dest, doc_base, session="sample")
             save_session(current_file_path, page_results)
-            return {"pages": page_results, "total_pages": 1}
+            return {
+                "pages": shape_pages(page_results, fields, include_text),
+                "total_pages": num_pages,
+                "classification": classification,
+            }
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-        page_paths = split_pdf_pages(dest)
-        for i, pp in enumerate(page_paths):
-            page_id = f"{doc_base}-P{i+1}"
-            try:
-                result = agent.process_invoice(pp, page_id)
-                result["page_number"] = i + 1
-                page_results.append(result)
-            except Exception as e:
-                page_results.append({"page_number": i+1, "document_id": page_id, "error": str(e), "invoice_data": None, "vendor": None})
-            finally:
-                try: os.remove(pp)
-                except: pass
-        
-        save_session(current_file_path, page_results)
-        return {"pages": page_results, "total_pages": num_pages}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await schedule("bulk", work)
 
 
 @app.get("/pdf")
-async def get_current_pdf():
-    """Serve the uploaded file for preview"""
+async def get_current_pdf(request: Request):
+    """
+    Serve the uploaded file for preview. Honours If-None-Match /
+    If-Modified-Since (304) and single "Range: bytes=a-b" requests (206),
+    e.g. from a PDF viewer loading the file in chunks.
+    """
     path, _ = load_session()
-    if not path or not os.path.exists(path):
+    headers = http_validators(path) if path else None
+    if headers is None:
         raise HTTPException(status_code=404, detail="No file currently loaded")
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+
     ext = os.path.splitext(path)[1].lower()
     mime_map = {".pdf": "application/pdf", ".webp": "image/webp", ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg"}
-    return FileResponse(path, media_type=mime_map.get(ext, "application/octet-stream"))
+    media_type = mime_map.get(ext, "application/octet-stream")
+    headers["Accept-Ranges"] = "bytes"
+
+    # Ranges in other units are ignored and the whole file is sent (RFC 9110)
+    header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if header and range_unit(header) == "bytes" and if_range in (None, headers["ETag"], headers["Last-Modified"]):
+        size = os.path.getsize(path)
+        try:
+            parsed = parse_range(header, size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        if parsed is not None:
+            _, start, end = parsed
+            with open(path, "rb") as f:
+                f.seek(start)
+                data = f.read(end - start)
+            return Response(data, status_code=206, media_type=media_type, headers={
+                **headers,
+                "Content-Range": f"bytes {start}-{end - 1}/{size}",
+            })
+    return WholeFileResponse(path, media_type=media_type, headers=headers)
 
 
 @app.post("/correct")
 async def apply_correction(request: CorrectionRequest):
     """Apply correction. If multi-page, optionally specify page_index."""
-    global current_file_path, page_results
-    current_file_path, page_results = load_session()
-    
-    try:
-        # Reload state from page_results if available
-        if request.page_index is not None and 0 <= request.page_index < len(page_results):
-            pg = page_results[request.page_index]
-            agent.current_document_id = pg.get("document_id")
-            agent.current_text = pg.get("extracted_text")
-            if pg.get("invoice_data"):
-                from models import InvoiceData
-                agent.current_invoice_data = InvoiceData(**pg["invoice_data"])
-
-        result = agent.apply_correction(request.query)
-
-        # Update page_results
-        if request.page_index is not None and 0 <= request.page_index < len(page_results):
-            page_results[request.page_index]["invoice_data"] = result.get("invoice_data")
-            page_results[request.page_index]["vendor"] = result.get("vendor")
-            save_session(current_file_path, page_results)
+    def work():
+        global current_file_path, page_results
+        current_file_path, page_results = load_session()
 
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        try:
+            # Work on a session so a running upload cannot swap the document mid-correction
+            session = page_session(page_results, request.page_index)
+            result = session.apply_correction(request.query)
+            adopt_session(session)
+
+            # Update page_results
+            if request.page_index is not None and 0 <= request.page_index < len(page_results):
+                page_results[request.page_index]["invoice_data"] = result.get("invoice_data")
+                page_results[request.page_index]["vendor"] = result.get("vendor")
+                save_session(current_file_path, page_results)
+
+            return result
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await schedule("interactive", work)
 
 
 @app.post("/extract")
 async def extract_field(request: ExtractionRequest):
-    global current_file_path, page_results
-    current_file_path, page_results = load_session()
-    
-    try:
-        # Reload state from page_results if available
-        if request.page_index is not None and 0 <= request.page_index < len(page_results):
-            pg = page_results[request.page_index]
-            agent.current_document_id = pg.get("document_id")
-            agent.current_text = pg.get("extracted_text")
-            if pg.get("invoice_data"):
-                from models import InvoiceData
-                agent.current_invoice_data = InvoiceData(**pg["invoice_data"])
-
-        result = agent.extract_field(request.field_name, request.context)
-        # Note: extraction doesn't usually change the state of the document data, 
-        # but if we were to save the result into page_results, we'd do it here.
-        # For now, we just return the result.
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    def work():
+        global current_file_path, page_results
+        current_file_path, page_results = load_session()
+
+        try:
+            session = page_session(page_results, request.page_index)
+            result = session.extract_field(request.field_name, request.context)
+            adopt_session(session)
+            # Note: extraction doesn't usually change the state of the document data, 
+            # but if we were to save the result into page_results, we'd do it here.
+            # For now, we just return the result.
+            return result
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await schedule("interactive", work)
+
+
+@app.get("/search")
+async def search_corpus(
+    q: str,
+    vendor_id: Optional[str] = None,
+    currency: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    top_k: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Search across all indexed invoices with metadata filters and pagination"""
+    def work():
+        try:
+            return agent.search(
+                q,
+                vendor_id=vendor_id,
+                currency=currency,
+                date_from=date_from,
+                date_to=date_to,
+                top_k=top_k,
+                offset=offset,
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await schedule("interactive", work)
 
 
 @app.get("/current")
-async def get_current():
-    """Get current results (all pages)"""
-    _, results = load_session()
-    if not results:
-        raise HTTPException(status_code=404, detail="No invoice currently loaded")
-    return {"pages": results, "total_pages": len(results)}
+async def get_current(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma-separated dotted fields to return"),
+    include_text: bool = Query(True, description="Include each page's extracted_text"),
+):
+    """Get current results (all pages); 304 while the session is unchanged"""
+    def build():
+        _, results = load_session()
+        if not results:
+            raise HTTPException(status_code=404, detail="No invoice currently loaded")
+        return {"pages": shape_pages(results, fields, include_text), "total_pages": len(results)}
+
+    return cached_json(request, Config.SESSION_DATA_PATH, build, ("current", fields, include_text))
+
+
+class WholeFileResponse(FileResponse):
+    """FileResponse that always sends the whole file; the endpoint has already handled Range"""
+
+    async def __call__(self, scope, receive, send):
+        headers = [(name, value) for name, value in scope["headers"] if name not in (b"range", b"if-range")]
+        await super().__call__({**scope, "headers": headers}, receive, send)
+
+
+def http_validators(path: str, weak: bool = False) -> Optional[dict]:
+    """
+    Cache validators of a file-backed resource, from the file's stat
+
+    Returns:
+        ETag, Last-Modified and Cache-Control headers (clients revalidate on
+        every use), or None if the file does not exist
+    """
+    version = file_version(path)
+    if version is None:
+        return None
+    inode, mtime_ns, size = version
+    etag = f'"{inode:x}-{mtime_ns:x}-{size:x}"'
+    return {
+        "ETag": f"W/{etag}" if weak else etag,
+        "Last-Modified": formatdate(mtime_ns / 1e9, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+
+
+def is_not_modified(request: Request, headers: dict) -> bool:
+    """Whether the client's cached copy is current (If-None-Match, else If-Modified-Since)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = headers["ETag"].removeprefix("W/")
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return parsedate_to_datetime(headers["Last-Modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+# Serialized JSON bodies by (resource variant) -> (ETag, body), reused while the backing file is unchanged
+_json_bodies = {}
+JSON_BODY_CACHE_SIZE = 64
+
+
+def cached_json(request: Request, path: str, build: Callable[[], object], variant: tuple) -> Response:
+    """
+    JSON response for a resource backed by a file
+
+    Answers 304 when the client's copy is current; otherwise the body is
+    built and serialized once per file version and variant (e.g. the query
+    parameters) and reused until the file changes.
+    """
+    headers = http_validators(path, weak=True)
+    if headers is None:
+        return JSONResponse(build())
+    if is_not_modified(request, headers):
+        return Response(status_code=304, headers=headers)
+    cached = _json_bodies.get(variant)
+    if cached is None or cached[0] != headers["ETag"]:
+        if len(_json_bodies) >= JSON_BODY_CACHE_SIZE:
+            _json_bodies.clear()
+        cached = (headers["ETag"], JSONResponse(build()).body)
+        _json_bodies[variant] = cached
+    return Response(cached[1], media_type="application/json", headers=headers)
+
+
+def range_unit(header: str) -> str:
+    """Lower-cased unit of a Range header value, e.g. "bytes" for bytes=0-99"""
+    return header.partition("=")[0].strip().lower()
+
+
+class RangeNotSatisfiable(Exception):
+    """A valid Range that selects nothing in the resource (416)"""
+
+
+def parse_range(header: str, length: int) -> Optional[tuple]:
+    """
+    Parse a single-range Range header
+
+    Args:
+        header: Header value, e.g. "chars=0-999", "bytes=500-" or "chars=-200"
+        length: Size of the resource in the header's unit
+
+    Returns:
+        (unit, start, end) with end exclusive, or None if the header is
+        malformed, reversed, multi-range or in another unit; such headers
+        are ignored and the full response is sent (RFC 9110)
+
+    Raises:
+        RangeNotSatisfiable: If the range is valid but starts past the end
+            (or is an empty suffix)
+    """
+    unit, _, spec = header.partition("=")
+    unit = unit.strip().lower()
+    if unit not in ("bytes", "chars") or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None
+    if not first:
+        if int(last) == 0 or length == 0:
+            raise RangeNotSatisfiable()
+        return unit, max(0, length - int(last)), length
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= length:
+        raise RangeNotSatisfiable()
+    return unit, start, min(int(last) + 1, length) if last else length
+
+
+@app.get("/documents/{document_id}/text")
+async def get_document_text(document_id: str, request: Request):
+    """
+    Serve a page's extracted text. Supports "Range: chars=a-b" (served from
+    the compressed document store without loading the whole text) and
+    "Range: bytes=a-b" over the UTF-8 encoding.
+    """
+    store = agent.vector_indexer.document_store
+    length = store.length(document_id)
+    text = None
+    if length is None:
+        text = agent.vector_indexer.get_full_document(document_id)
+        if not text:
+            raise HTTPException(status_code=404, detail=f"Document {document_id} not found")
+        length = len(text)
+
+    # Invalid ranges and other units are ignored and the whole text is sent (RFC 9110)
+    header = request.headers.get("range") or ""
+    if range_unit(header) == "bytes":
+        data = (text if text is not None else agent.vector_indexer.get_full_document(document_id)).encode("utf-8")
+        try:
+            parsed = parse_range(header, len(data))
+        except RangeNotSatisfiable:
+            return PlainTextResponse("", status_code=416, headers={"Content-Range": f"bytes */{len(data)}"})
+        if parsed is not None:
+            _, start, end = parsed
+            return PlainTextResponse(data[start:end], status_code=206, headers={
+                "Accept-Ranges": "chars, bytes",
+                "Content-Range": f"bytes {start}-{end - 1}/{len(data)}",
+            })
+        parsed = None
+    elif range_unit(header) == "chars":
+        try:
+            parsed = parse_range(header, length)
+        except RangeNotSatisfiable:
+            return PlainTextResponse("", status_code=416, headers={"Content-Range": f"chars */{length}"})
+    else:
+        parsed = None
+    if parsed is None:
+        if text is None:
+            text = agent.vector_indexer.get_full_document(document_id)
+        return PlainTextResponse(text, headers={"Accept-Ranges": "chars, bytes"})
+    _, start, end = parsed
+    part = text[start:end] if text is not None else agent.vector_indexer.get_document_range(document_id, start, end)
+    return PlainTextResponse(part, status_code=206, headers={
+        "Accept-Ranges": "chars, bytes",
+        "Content-Range": f"chars {start}-{end - 1}/{length}",
+    })
 
 
 @app.get("/vendors")
-async def list_vendors():
+async def list_vendors(request: Request):
+    """List all vendors; 304 while the vendor database is unchanged"""
     try:
-        vendors = agent.vendor_manager.list_vendors()
-        return [v.model_dump() for v in vendors]
+        vendor_manager = agent.vendor_manager
+        return cached_json(
+            request,
+            vendor_manager.db_path,
+            lambda: [v.model_dump() for v in vendor_manager.list_vendors()],
+            ("vendors",),
+        )
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/download")
-async def download_json():
+async def download_json(
+    fields: Optional[str] = Query(None, description="Comma-separated dotted fields to return"),
+    include_text: bool = Query(True, description="Include each page's extracted_text"),
+):
     _, results = load_session()
     if not results:
         raise HTTPException(status_code=404, detail="No invoice currently loaded")
-    return JSONResponse(content={"pages": results}, headers={
+    return JSONResponse(content={"pages": shape_pages(results, fields, include_text)}, headers={
         "Content-Disposition": "attachment; filename=invoice_data.json",
         "Access-Control-Expose-Headers": "Content-Disposition"
     })
 
 
+@app.get("/export")
+async def export_columnar(
+    table: str = Query("invoices", pattern="^(invoices|line_items)$"),
+    format: str = Query("parquet", pattern="^(parquet|arrow)$"),
+):
+    """Download the current session as a normalized Parquet / Arrow IPC table."""
+    from tools.invoice_exporter import InvoiceExporter
+
+    _, results = load_session()
+    if not results:
+        raise HTTPException(status_code=404, detail="No invoice currently loaded")
+
+    def write():
+        with InvoiceExporter(export_dir, format) as exporter:
+            exporter.add_all(results)
+        return exporter
+
+    export_dir = tempfile.mkdtemp(prefix="export_")
+    streamed = False
+    try:
+        try:
+            # pyarrow writes are bulk work; they must not block the event loop
+            exporter = await schedule("bulk", write)
+        except ImportError as e:
+            raise HTTPException(status_code=501, detail=str(e))
+        if table not in exporter.paths:
+            raise HTTPException(status_code=404, detail=f"No {table} rows to export")
+
+        filename = f"{table}{os.path.splitext(exporter.paths[table])[1]}"
+        media_type = "application/vnd.apache.parquet" if format == "parquet" else "application/vnd.apache.arrow.stream"
+        response = FileResponse(
+            exporter.paths[table],
+            media_type=media_type,
+            filename=filename,
+            headers={"Access-Control-Expose-Headers": "Content-Disposition"},
+            background=BackgroundTask(shutil.rmtree, export_dir, ignore_errors=True),
+        )
+        streamed = True  # the background task removes the directory once the file is sent
+        return response
+    finally:
+        if not streamed:
+            shutil.rmtree(export_dir, ignore_errors=True)
+
+
+@app.post("/export/append")
+async def export_append(format: str = Query("parquet", pattern="^(parquet|arrow)$")):
+    """Append the current session to the export dataset under EXPORT_DIR."""
+    from tools.invoice_exporter import InvoiceExporter
+
+    _, results = load_session()
+    if not results:
+        raise HTTPException(status_code=404, detail="No invoice currently loaded")
+    def write():
+        with InvoiceExporter(os.path.join(Config.EXPORT_DIR, format), format) as exporter:
+            exporter.add_all(results)
+        return exporter
+
+    try:
+        exporter = await schedule("bulk", write)
+    except ImportError as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    return {"paths": exporter.paths, "rows": exporter.counts}
+
+
+# ── Index lifecycle administration ──
+
+tenant_indexers = OrderedDict()  # least recently used first, at most TENANT_INDEXER_CACHE
+tenant_indexers_lock = threading.Lock()
+
+def get_indexer(tenant: Optional[str] = None) -> VectorIndexer:
+    """
+    Return the agent's indexer, or an indexer for another existing tenant
+
+    Admin endpoints never create tenants: unknown tenants are 404 and ids
+    that are not valid collection names are 400.
+    """
+    if tenant is None or tenant == agent.vector_indexer.tenant_id:
+        return agent.vector_indexer
+    try:
+        exists = agent.vector_indexer.tenant_exists(tenant)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not exists:
+        raise HTTPException(status_code=404, detail=f"Tenant {tenant} not found")
+
+    with tenant_indexers_lock:
+        indexer = tenant_indexers.get(tenant)
+        if indexer is not None:
+            tenant_indexers.move_to_end(tenant)
+            return indexer
+    indexer = VectorIndexer(tenant_id=tenant)
+    with tenant_indexers_lock:
+        tenant_indexers[tenant] = indexer
+        while len(tenant_indexers) > Config.TENANT_INDEXER_CACHE:
+            tenant_indexers.popitem(last=False)
+    return indexer
+
+
+def run_index_maintenance():
+    """Apply retention policies, then compact if anything was deleted."""
+    deleted = agent.vector_indexer.apply_retention()
+    if deleted:
+        agent.vector_indexer.compact()
+    return deleted
+
+
+async def index_maintenance_loop():
+    interval = Config.INDEX_MAINTENANCE_INTERVAL_HOURS * 3600
+    await asyncio.to_thread(agent.ready.wait)
+    while True:
+        try:
+            # Queued as bulk work so it does not run beside uploads outside the scheduler
+            await asyncio.wrap_future(scheduler.submit("bulk", run_index_maintenance))
+        except SchedulerSaturated:
+            print("[WARNING] Index maintenance skipped: bulk queue full")
+        except Exception as e:
+            print(f"[WARNING] Index maintenance failed: {e}")
+        await asyncio.sleep(interval)
+
+
+@app.on_event("startup")
+async def start_index_maintenance():
+    if Config.INDEX_MAINTENANCE_INTERVAL_HOURS > 0:
+        asyncio.create_task(index_maintenance_loop())
+
+
+@app.get("/admin/prompt-stats")
+async def prompt_stats():
+    """Estimated input tokens sent vs. uncompacted prompts (cumulative and last request)"""
+    parser = agent.invoice_parser
+    return {"total": parser.prompt_stats, "last": parser.last_prompt_stats}
+
+
+@app.get("/admin/model-router")
+async def model_router_stats():
+    """Per-tier model cost/latency and per-task escalation statistics"""
+    if agent.model_router is None:
+        return {"enabled": False}
+    return {"enabled": True, **agent.model_router.stats()}
+
+
+@app.get("/admin/model-health")
+async def model_health():
+    """Circuit state, recent failure rate, latency percentiles and hedges per model"""
+    return {"models": breaker_stats(), "failed_pages": len(failed_pages.list())}
+
+
+@app.get("/admin/failed-pages")
+async def list_failed_pages():
+    """Page groups waiting to be retried"""
+    return {"failed_pages": failed_pages.list()}
+
+
+@app.post("/admin/failed-pages/retry")
+async def retry_failed_pages_now():
+    """Retry every failed page group now, ignoring its backoff"""
+    return await schedule("bulk", retry_failed_pages, False)
+
+
+async def failed_page_retry_loop():
+    await asyncio.to_thread(agent.ready.wait)
+    while True:
+        await asyncio.sleep(Config.RETRY_FAILED_INTERVAL_S)
+        if not failed_pages.due():
+            continue
+        try:
+            await asyncio.wrap_future(scheduler.submit("bulk", retry_failed_pages))
+        except SchedulerSaturated:
+            pass
+        except Exception as e:
+            print(f"[WARNING] Failed page retry failed: {e}")
+
+
+@app.on_event("startup")
+async def start_failed_page_retries():
+    if Config.RETRY_FAILED_INTERVAL_S > 0:
+        asyncio.create_task(failed_page_retry_loop())
+
+
+async def router_stats_flush_loop():
+    while True:
+        await asyncio.sleep(Config.ROUTER_STATS_FLUSH_S)
+        try:
+            await asyncio.to_thread(agent.model_router.flush)
+        except Exception as e:
+            print(f"[WARNING] Model router stats flush failed: {e}")
+
+
+@app.on_event("startup")
+async def start_router_stats_flush():
+    if Config.MODEL_ROUTING and Config.ROUTER_STATS_FLUSH_S > 0:
+        asyncio.create_task(router_stats_flush_loop())
+
+
+@app.get("/admin/scheduler")
+async def scheduler_stats():
+    """Queue depth, active jobs, rejections and latency per priority class"""
+    return scheduler.stats()
+
+
+@app.get("/admin/index/stats")
+async def index_stats(tenant: Optional[str] = None):
+    """Report collection size, document counts per session and disk usage"""
+    def work():
+        indexer = get_indexer(tenant)
+        try:
+            return indexer.stats()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await schedule("interactive", work)
+
+
+@app.post("/admin/index/retention")
+async def apply_index_retention(request: RetentionRequest, tenant: Optional[str] = None):
+    """Delete documents outside the retention policy (defaults from config)"""
+    def work():
+        indexer = get_indexer(tenant)
+        try:
+            deleted = indexer.apply_retention(
+                max_age_days=request.max_age_days,
+                session=request.session,
+                session_max_age_hours=request.session_max_age_hours,
+            )
+            return {"deleted": deleted, "count": len(deleted)}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await schedule("bulk", work)
+
+
+@app.delete("/admin/index/documents")
+async def delete_index_documents(request: DeleteDocumentsRequest, tenant: Optional[str] = None):
+    """Bulk-delete whole documents from the index"""
+    def work():
+        indexer = get_indexer(tenant)
+        try:
+            count = indexer.delete_documents(request.document_ids)
+            return {"deleted": request.document_ids, "count": count}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await schedule("bulk", work)
+
+
+@app.post("/admin/index/compact")
+async def compact_index(tenant: Optional[str] = None):
+    """Rebuild the collection to drop deleted vectors from the HNSW graph"""
+    def work():
+        indexer = get_indexer(tenant)
+        try:
+            chunks = indexer.compact()
+            return {"chunks": chunks}
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    return await schedule("bulk", work)
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -1 +1,5 @@
 # Tests package
+import os
+
+# Tests run against the offline fake model, whatever the shell or .env selects
+os.environ["MODEL_BACKEND"] = "fake"
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the lexical BM25 index and rank fusion
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from tools.bm25_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+class TestBM25Index(unittest.TestCase):
+    """Test lexical retrieval over document chunks"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index = BM25Index(os.path.join(self.tmp_dir, "bm25.sqlite3"))
+        self.index.add_chunks("DOC1", ["DOC1_chunk_0", "DOC1_chunk_1"], [
+            "Acme Supplies Ltd GSTIN 27AAPFU0939F1ZV",
+            "Purchase order PO-12345 total 500.00",
+        ])
+        self.index.add_chunks("DOC2", ["DOC2_chunk_0"], [
+            "Purchase order PO-99999 total 120.00",
+        ])
+
+    def tearDown(self):
+        self.index.conn.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_tokenize_keeps_identifiers(self):
+        """Compound identifiers are kept whole and split into parts"""
+        tokens = tokenize("PO-12345 for GSTIN 27AAPFU0939F1ZV")
+        self.assertIn("po-12345", tokens)
+        self.assertIn("12345", tokens)
+        self.assertIn("27aapfu0939f1zv", tokens)
+
+    def test_exact_token_ranks_first(self):
+        """Exact identifier matches rank above generic matches"""
+        hits = self.index.query("PO-12345", n_results=3)
+        self.assertEqual(hits[0][0], "DOC1_chunk_1")
+
+    def test_document_filter(self):
+        """Results are restricted to the requested document"""
+        hits = self.index.query("purchase order", document_id="DOC2")
+        self.assertEqual([chunk_id for chunk_id, _ in hits], ["DOC2_chunk_0"])
+
+    def test_reindex_replaces_document(self):
+        """Re-indexing a document drops its previous chunks"""
+        self.index.add_chunks("DOC1", ["DOC1_chunk_0"], ["Credit note"])
+        self.assertEqual(self.index.query("PO-12345", document_id="DOC1"), [])
+        self.index.remove_document("DOC2")
+        self.assertEqual(self.index.query("PO-99999"), [])
+
+    def test_reciprocal_rank_fusion(self):
+        """Items ranked well by both lists come first"""
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])
+        self.assertEqual(fused[0], "b")
+        self.assertEqual(set(fused), {"a", "b", "c", "d"})
+
+if __name__ == '__main__':
+    unittest.main()
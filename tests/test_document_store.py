@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the compressed document text store
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from config import Config
+from tools.document_store import DocumentStore
+
+class TestDocumentStore(unittest.TestCase):
+    """Test exact text and range retrieval"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store = DocumentStore(self.tmp_dir)
+        # Multi-block text with non-ASCII characters
+        self.text = "".join(f"Zeile {i}: Größe €{i}\n" for i in range(3000))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_roundtrip(self):
+        """Stored text is returned unchanged"""
+        self.store.put("DOC1", self.text)
+        self.assertEqual(self.store.get("DOC1"), self.text)
+        self.assertEqual(self.store.length("DOC1"), len(self.text))
+
+    def test_ranges_across_blocks(self):
+        """Character ranges spanning block boundaries are exact"""
+        self.store.put("DOC1", self.text)
+        block = DocumentStore.BLOCK_CHARS
+        for start, end in [(0, 10), (block - 5, block + 5), (block * 2 + 1, block * 3 + 7), (len(self.text) - 3, len(self.text) + 50)]:
+            with self.subTest(start=start, end=end):
+                self.assertEqual(self.store.get_range("DOC1", start, end), self.text[start:end])
+
+    def test_mmap_reads(self):
+        """Large blobs are read through mmap with the same result"""
+        self.store.put("DOC1", self.text)
+        with mock.patch.object(Config, "DOCUMENT_STORE_MMAP_THRESHOLD", 0):
+            self.assertEqual(self.store.get_range("DOC1", 100, 40000), self.text[100:40000])
+
+    def test_missing_and_delete(self):
+        """Unknown or deleted documents return None"""
+        self.assertIsNone(self.store.get("NOPE"))
+        self.store.put("DOC1", "abc")
+        self.store.delete("DOC1")
+        self.assertFalse(self.store.exists("DOC1"))
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_reput_seen_by_other_instances(self):
+        """A store in another process sees a re-put instead of its cached offsets"""
+        other = DocumentStore(self.tmp_dir)
+        self.store.put("DOC1", self.text)
+        self.assertEqual(other.get_range("DOC1", 0, 20), self.text[:20])
+
+        self.store.put("DOC1", "replaced text")
+        self.assertEqual(other.get("DOC1"), "replaced text")
+        self.assertEqual(len([name for name in os.listdir(self.tmp_dir) if name.endswith(".blob")]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
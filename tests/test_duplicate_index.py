@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Unit tests for ingest-time duplicate detection
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from config import Config
+from invoice_agent import InvoiceAgent
+from tools.duplicate_index import DuplicateIndex, invoice_key, simhash, text_mentions_invoice
+from tools.fake_model import FakeEmbeddingFunction, FakeGenerativeModel
+from tools.invoice_parser import InvoiceParser
+from tools.pdf_extractor import PDFExtractor
+from tools.vector_indexer import VectorIndexer
+from tools.vendor_manager import VendorManager
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.pdf")
+TEXT = " ".join(f"line {i} widget part number {i * 7} quantity {i % 5} amount {i * 3}.50" for i in range(40))
+
+class TestDuplicateIndex(unittest.TestCase):
+    """Test the three duplicate lookups"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.index = DuplicateIndex(os.path.join(self.tmp_dir, "dedupe.sqlite3"))
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_simhash_tolerates_small_edits(self):
+        """A rescan with a few changed words stays within the distance; other text does not"""
+        self.index.add("DOC-1", {"document_id": "DOC-1"}, fingerprint=simhash(TEXT))
+        rescan = TEXT.replace("line 3 ", "line 3. ").replace("amount 9.50", "amount 9.5O")
+        match = self.index.find_near(simhash(rescan))
+        self.assertEqual(match[0], "DOC-1")
+        self.assertIsNone(self.index.find_near(simhash(TEXT.upper().replace("WIDGET", "gadget kit"))))
+        self.assertIsNone(simhash("Page 2 of 3"))
+
+    def test_shared_template_is_not_confirmed(self):
+        """Invoices from one template are near in SimHash but differ in number, so they are not duplicates"""
+        def invoice(number, date):
+            return f"Invoice #: {number}\nDate: {date}\n{TEXT}\nTotal: 1,234.50"
+        self.index.add("DOC-1", {"document_id": "DOC-1"}, fingerprint=simhash(invoice("INV-0101", "2024-03-01")))
+        next_month = invoice("INV-0102", "2024-04-01")
+        self.assertEqual(self.index.find_near(simhash(next_month))[0], "DOC-1")
+        self.assertFalse(text_mentions_invoice(next_month, "INV-0101", 1234.5))
+        self.assertTrue(text_mentions_invoice(invoice("inv-0101", "2024-03-01"), "INV # -0101", 1234.5))
+        self.assertFalse(text_mentions_invoice(next_month, None, 1234.5))
+
+    def test_file_and_key_lookups(self):
+        """Exact hashes and business keys map to the stored result"""
+        key = invoice_key("VEN-1", "inv # 001", 118.0)
+        self.assertEqual(key, invoice_key("VEN-1", "INV001", "118.00"))
+        self.index.add("DOC-1", {"document_id": "DOC-1", "extracted_text": "x"}, sha256="abc", key=key)
+        self.assertEqual(self.index.find_file("abc"), "DOC-1")
+        self.assertEqual(self.index.find_key(key), "DOC-1")
+        self.assertEqual(self.index.result("DOC-1"), {"document_id": "DOC-1"})
+        self.index.remove(["DOC-1"])
+        self.assertIsNone(self.index.find_file("abc"))
+
+class TestAgentDeduplication(unittest.TestCase):
+    """Test that known duplicates short-circuit the pipeline"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patcher = mock.patch.multiple(
+            Config,
+            VECTOR_DB_DIR=self.tmp_dir,
+            VENDOR_DB_PATH=f"{self.tmp_dir}/vendors.json",
+            BM25_INDEX_PATH=f"{self.tmp_dir}/bm25.sqlite3",
+            DOCUMENT_STORE_DIR=f"{self.tmp_dir}/documents",
+            EXTRACTED_TEXT_DIR=f"{self.tmp_dir}/texts",
+            DEDUPE_INVOICES=True,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+
+        self.model = FakeGenerativeModel()
+        self.agent = InvoiceAgent(
+            pdf_extractor=PDFExtractor(model=self.model),
+            vector_indexer=VectorIndexer(embedding_function=FakeEmbeddingFunction()),
+            invoice_parser=InvoiceParser(model=self.model),
+            vendor_manager=VendorManager(),
+            duplicate_index=DuplicateIndex(f"{self.tmp_dir}/dedupe.sqlite3"),
+        )
+
+    def test_resubmitted_file_reuses_result(self):
+        """A byte-identical copy makes no model calls and indexes nothing new"""
+        first = self.agent.process_invoice(SAMPLE_PDF, "DOC-1")
+        calls = len(self.model.calls)
+
+        copy_path = shutil.copy(SAMPLE_PDF, os.path.join(self.tmp_dir, "copy.pdf"))
+        second = self.agent.process_invoice(copy_path, "DOC-2")
+
+        self.assertEqual(len(self.model.calls), calls)
+        self.assertEqual(second["duplicate"], {"of": "DOC-1", "match": "file"})
+        self.assertEqual(second["invoice_data"], first["invoice_data"])
+        self.assertEqual(self.agent.current_document_id, "DOC-1")
+        self.assertFalse(self.agent.vector_indexer.document_store.exists("DOC-2"))
+
+        # Re-processing under the original ID runs the pipeline again
+        self.assertNotIn("duplicate", self.agent.process_invoice(SAMPLE_PDF, "DOC-1"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Unit tests for invoice image preprocessing
+"""
+
+import io
+import random
+import unittest
+from tools import image_preprocessor
+from tools.image_preprocessor import ImagePreprocessor
+
+Image = image_preprocessor.Image
+if Image is not None:
+    from PIL import ImageDraw
+
+def document_photo(angle: float = 0.0) -> bytes:
+    """JPEG 'photo' of a text page on a dark desk, rotated by angle degrees"""
+    rng = random.Random(0)
+    paper = Image.new("RGB", (850, 1100), "white")
+    draw = ImageDraw.Draw(paper)
+    for y in range(120, 980, 30):
+        x = 80
+        while x < 760:
+            width = rng.randint(20, 80)
+            draw.rectangle([x, y, x + width, y + 12], fill=(20, 20, 20))
+            x += width + 12
+    photo = Image.new("RGB", (1200, 1600), (70, 60, 50))
+    photo.paste(paper.rotate(angle, expand=True, fillcolor=(70, 60, 50)), (120, 150))
+    out = io.BytesIO()
+    photo.save(out, "JPEG", quality=92)
+    return out.getvalue()
+
+@unittest.skipUnless(Image, "Pillow not installed")
+class TestImagePreprocessor(unittest.TestCase):
+    """Test cropping, deskewing, downscaling and the fallbacks"""
+
+    def test_photo_is_cropped_deskewed_and_shrunk(self):
+        """The desk is cropped away, the page levelled and the upload shrinks"""
+        data, report = ImagePreprocessor(target_dpi=100).preprocess(document_photo(angle=3), "image/jpeg")
+        self.assertLess(report.bytes_out, report.bytes_in)
+        self.assertEqual(report.bytes_out, len(data))
+        self.assertAlmostEqual(report.skew_degrees, -3.0, delta=0.5)
+
+        image = Image.open(io.BytesIO(data))
+        self.assertEqual(image.mode, "L")
+        self.assertLessEqual(max(image.size), 11.7 * 100 + 1)
+        # No desk left: the border of the result is paper
+        border = [image.getpixel((x, y)) for x in (0, image.width - 1) for y in range(0, image.height, 50)]
+        self.assertGreater(min(border), 200)
+
+    def test_level_scan_keeps_angle(self):
+        """A straight page is not rotated"""
+        _, report = ImagePreprocessor(target_dpi=100, output_format="png").preprocess(document_photo(), "image/jpeg")
+        self.assertEqual(report.skew_degrees, 0.0)
+        self.assertEqual(report.mime_type, "image/png")
+
+    def test_fallback_to_original(self):
+        """Small or unreadable images are sent unchanged"""
+        tiny = io.BytesIO()
+        Image.new("L", (8, 8), 255).save(tiny, "PNG")
+        for data in (tiny.getvalue(), b"not an image"):
+            sent, report = ImagePreprocessor().preprocess(data, "image/png")
+            self.assertEqual(sent, data)
+            self.assertEqual(report.mime_type, "image/png")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the invoice agent orchestration
+"""
+
+import unittest
+from invoice_agent import InvoiceAgent
+
+class TestInvoiceAgentStartup(unittest.TestCase):
+    """Test lazy construction of agent tools"""
+
+    def test_construction_is_lazy(self):
+        """Creating the agent builds no tools"""
+        agent = InvoiceAgent()
+        self.assertIsNone(agent._pdf_extractor)
+        self.assertIsNone(agent._vector_indexer)
+        self.assertIsNone(agent._invoice_parser)
+        self.assertIsNone(agent._vendor_manager)
+        self.assertFalse(agent.ready.is_set())
+
+    def test_injected_tools_are_used(self):
+        """Tools passed to the constructor are returned as-is"""
+        sentinel = object()
+        agent = InvoiceAgent(vendor_manager=sentinel)
+        self.assertIs(agent.vendor_manager, sentinel)
+
+if __name__ == '__main__':
+    unittest.main()
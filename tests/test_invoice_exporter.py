@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Unit tests for columnar (Parquet / Arrow) invoice export
+"""
+
+import shutil
+import tempfile
+import unittest
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+from tools.invoice_exporter import InvoiceExporter, read_table
+
+def make_result(i: int) -> dict:
+    return {
+        "document_id": f"doc-{i}",
+        "page_number": 1,
+        "invoice_data": {
+            "metadata": {"invoice_number": f"INV-{i}", "invoice_date": "2024-03-05",
+                         "currency": "usd" if i % 2 else "EUR", "total_amount": 10.0 * i},
+            "line_items": [{"description": f"Item {n}", "amount": 1.0} for n in range(3)],
+        },
+        "vendor": {"vendor_id": f"V{i % 3}"},
+    }
+
+@unittest.skipUnless(pyarrow, "pyarrow not installed")
+class TestInvoiceExporter(unittest.TestCase):
+    """Test normalized table export and incremental append"""
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir, ignore_errors=True)
+
+    def test_tables_round_trip(self):
+        """Invoices and line items are written in batches and read back in order"""
+        for format in ("parquet", "arrow"):
+            with self.subTest(format=format):
+                out_dir = f"{self.out_dir}/{format}"
+                with InvoiceExporter(out_dir, format, batch_rows=4) as exporter:
+                    exporter.add_all([make_result(i) for i in range(10)] + [{"document_id": "failed", "invoice_data": None}])
+                self.assertEqual(exporter.counts, {"invoices": 10, "line_items": 30})
+
+                invoices = read_table(out_dir, "invoices", format)
+                self.assertEqual(invoices.column("invoice_number").to_pylist(), [f"INV-{i}" for i in range(10)])
+                self.assertEqual(invoices.column("invoice_date_key").to_pylist()[0], 20240305)
+                self.assertTrue(pyarrow.types.is_dictionary(invoices.schema.field("currency").type))
+                self.assertEqual(set(invoices.column("currency").to_pylist()), {"USD", "EUR"})
+
+                items = read_table(out_dir, "line_items", format)
+                self.assertEqual(items.column("line_number").to_pylist()[:3], [1, 2, 3])
+
+    def test_append_adds_part_files(self):
+        """A second export into the same directory appends rows"""
+        for batch in (range(0, 5), range(5, 8)):
+            with InvoiceExporter(self.out_dir) as exporter:
+                exporter.add_all(make_result(i) for i in batch)
+        self.assertEqual(read_table(self.out_dir, "invoices").num_rows, 8)
+
+    def test_unknown_format(self):
+        """Unsupported formats are rejected"""
+        with self.assertRaises(ValueError):
+            InvoiceExporter(self.out_dir, "csv")
+
+if __name__ == '__main__':
+    unittest.main()
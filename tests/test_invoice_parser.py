@@ -5,6 +5,10 @@ Unit tests for invoice parsing edge cases
 
 import unittest
 import json
+import re
+from unittest import mock
+from config import Config
+from tools.fake_model import FakeGenerativeModel, FakeModelError
 from tools.invoice_parser import InvoiceParser
 from models import InvoiceData
 
@@ -86,6 +90,18 @@ class TestInvoiceParserEdgeCases(unittest.TestCase):
                 except Exception as e:
                     self.fail(f"JSON extraction failed for case '{case[:30]}': {e}")
     
+    def test_extract_json_nested_schema(self):
+        """Test JSON extraction returns the outermost object of the full schema"""
+        response = (
+            'Here is the data:\n```json\n'
+            '{"metadata": {"invoice_number": "A{1}", "vendor_name": "Say \\"Hi\\" Ltd"}, '
+            '"line_items": [{"description": "Bolt [M8]", "amount": 1.5}, {"description": "Nut", "amount": 0.5}]}'
+            '\n```'
+        )
+        parsed = json.loads(self.parser._extract_json(response))
+        self.assertEqual(parsed["metadata"]["invoice_number"], "A{1}")
+        self.assertEqual(len(parsed["line_items"]), 2)
+    
     def test_field_extraction_edge_cases(self):
         """Test specific field extraction edge cases"""
         test_text = "Invoice #12345 dated 2024-01-01 total $100.00"
@@ -108,6 +124,54 @@ class TestInvoiceParserEdgeCases(unittest.TestCase):
                 except Exception as e:
                     self.fail(f"Field extraction failed for '{field_name}': {e}")
 
+def table_responder(contents, config):
+    """Answer metadata and line-item requests from a generated invoice table"""
+    text = contents[-1]
+    schema = config.get("response_schema", {})
+    if "line_items" in schema.get("properties", {}) and "metadata" not in schema["properties"]:
+        rows = re.findall(r"(?m)^(Part \d+)\s+(\d+)\s+([\d.]+)\s+([\d.]+)$", text)
+        return json.dumps({"line_items": [
+            {"description": d, "quantity": int(q), "unit_price": float(p), "amount": float(a)} for d, q, p, a in rows
+        ]})
+    subtotal = re.search(r"Subtotal:\s*([\d.]+)", text)
+    return json.dumps({"metadata": {"invoice_number": "BIG-1", "subtotal": float(subtotal.group(1)) if subtotal else None}})
+
+def make_table(rows: int) -> str:
+    lines = ["INVOICE", "Invoice Number: BIG-1", "", "Description    Qty    Unit Price    Amount"]
+    lines += [f"Part {i}    1    2.50    2.50" for i in range(rows)]
+    lines += [f"Subtotal: {rows * 2.5:.2f}", f"Total: {rows * 2.5:.2f}"]
+    return "\n".join(lines)
+
+class TestMapReduceParsing(unittest.TestCase):
+    """Test segmented parsing of long line-item tables"""
+
+    def test_long_table_is_parsed_in_segments(self):
+        """Every row is recovered, in order, from several segment requests"""
+        model = FakeGenerativeModel(responder=table_responder)
+        parser = InvoiceParser(model=model)
+        with mock.patch.multiple(Config, MAP_REDUCE_MIN_CHARS=2000, PARSE_SEGMENT_CHARS=1000):
+            result = parser.parse_invoice(make_table(300))
+
+        self.assertEqual(len(result.line_items), 300)
+        self.assertEqual([item.description for item in result.line_items], [f"Part {i}" for i in range(300)])
+        self.assertEqual(result.metadata.subtotal, 750.0)
+        self.assertGreater(len(model.calls), 5)
+        metadata_call = next(c for c in model.calls if "metadata" in c["generation_config"]["response_schema"]["properties"])
+        self.assertNotIn("Part 5", metadata_call["contents"][-1])
+
+    def test_truncated_response_falls_back_to_segments(self):
+        """A single-pass response cut off mid-JSON is re-parsed in segments"""
+        def responder(contents, config):
+            schema = config.get("response_schema", {})
+            if "metadata" in schema.get("properties", {}) and "line_items" in schema["properties"]:
+                return '{"metadata": {"invoice_number": "BIG-1"}, "line_items": [{"description": "Part 0", '
+            return table_responder(contents, config)
+
+        parser = InvoiceParser(model=FakeGenerativeModel(responder=responder))
+        with mock.patch.object(Config, "PARSE_SEGMENT_CHARS", 200):
+            result = parser.parse_invoice(make_table(40))
+        self.assertEqual(len(result.line_items), 40)
+
 class TestVendorManagerEdgeCases(unittest.TestCase):
     """Test edge cases for vendor management"""
     
@@ -149,5 +213,35 @@ class TestVendorManagerEdgeCases(unittest.TestCase):
                 except Exception as e:
                     self.fail(f"Vendor search should handle '{search_term}' gracefully: {e}")
 
+class TestFakeModelFaults(unittest.TestCase):
+    """Test latency and error injection of the fake backend"""
+
+    def test_injected_errors_are_repeatable(self):
+        """The same seed fails the same calls; failures reach the caller"""
+        def failed_calls(seed):
+            model = FakeGenerativeModel(error_rate=0.5, seed=seed)
+            failed = []
+            for i in range(20):
+                try:
+                    model.generate_content(["prompt"])
+                except FakeModelError:
+                    failed.append(i)
+            self.assertEqual(model.failures, len(failed))
+            return failed
+
+        self.assertEqual(failed_calls(1), failed_calls(1))
+        self.assertTrue(0 < len(failed_calls(1)) < 20)
+
+        parser = InvoiceParser(model=FakeGenerativeModel(error_rate=1.0))
+        with self.assertRaises(FakeModelError):
+            parser.parse_invoice("Invoice Number: INV-1")
+
+    def test_injected_model_needs_no_api_key(self):
+        """Only a parser that creates its own Gemini model requires GOOGLE_API_KEY"""
+        with mock.patch.multiple(Config, MODEL_BACKEND="gemini", MODEL_CACHE="off", GOOGLE_API_KEY=None):
+            InvoiceParser(model=FakeGenerativeModel())
+            with self.assertRaises(ValueError):
+                InvoiceParser()
+
 if __name__ == '__main__':
     unittest.main()
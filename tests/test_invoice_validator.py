@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Unit tests for invoice validation and local repair
+"""
+
+import json
+import unittest
+from invoice_agent import InvoiceAgent
+from models import InvoiceData, InvoiceMetadata, LineItem
+from tools.fake_model import FakeGenerativeModel
+from tools.invoice_parser import InvoiceParser
+from tools.invoice_validator import InvoiceValidator
+
+def make_invoice(**metadata) -> InvoiceData:
+    return InvoiceData(
+        metadata=InvoiceMetadata(**metadata),
+        line_items=[
+            LineItem(description="Widget", quantity=2, unit_price=25.0, amount=50.0),
+            LineItem(description="Gadget", quantity=1, unit_price=50.0, amount=50.0),
+        ],
+    )
+
+class TestInvoiceValidator(unittest.TestCase):
+    """Test arithmetic, date and currency checks"""
+
+    def setUp(self):
+        self.validator = InvoiceValidator()
+
+    def test_consistent_invoice_is_valid(self):
+        """Matching totals give full confidence to the checked fields"""
+        invoice = make_invoice(subtotal=100.0, tax_total=10.0, total_amount=110.0, currency="USD",
+                               invoice_date="2024-03-01", due_date="31/03/2024")
+        report = self.validator.validate(invoice)
+        self.assertTrue(report.valid, report.issues)
+        self.assertEqual(report.confidence["total_amount"], 1.0)
+        self.assertEqual(report.confidence["po_number"], 0.0)
+
+    def test_missing_values_are_derived(self):
+        """Missing amounts, subtotal and tax are derived locally"""
+        invoice = make_invoice(total_amount=110.0, currency="US$")
+        invoice.line_items[0].amount = None
+        repaired, report = self.validator.repair(invoice)
+        self.assertEqual(repaired.line_items[0].amount, 50.0)
+        self.assertEqual(repaired.metadata.subtotal, 100.0)
+        self.assertEqual(repaired.metadata.tax_total, 10.0)
+        self.assertEqual(repaired.metadata.currency, "USD")
+        self.assertTrue(report.valid)
+        self.assertEqual(report.confidence["subtotal"], 0.9)
+        self.assertIs(repaired.line_items[1], invoice.line_items[1])
+
+    def test_total_mismatch_names_suspect(self):
+        """A total that disagrees with subtotal + tax is flagged for re-extraction"""
+        invoice = make_invoice(subtotal=100.0, tax_total=10.0, total_amount=101.0)
+        report = self.validator.validate(invoice)
+        self.assertFalse(report.valid)
+        self.assertEqual(report.issues[0].field, "total_amount")
+        self.assertTrue(report.issues[0].reextract)
+
+    def test_date_and_currency_checks(self):
+        """Unparseable dates, due-before-issue and unknown currencies are reported"""
+        report = self.validator.validate(make_invoice(invoice_date="sometime", currency="XYZ"))
+        self.assertEqual({i.code for i in report.issues}, {"unparseable_date", "unknown_currency"})
+
+        for code in ("XOF", "UAH", "MAD"):
+            self.assertTrue(self.validator.validate(make_invoice(currency=code)).valid, code)
+
+        repaired, report = self.validator.repair(make_invoice(currency="$"))
+        self.assertEqual(repaired.metadata.currency, "$")
+        self.assertEqual([(i.code, i.reextract) for i in report.issues], [("ambiguous_currency", False)])
+        repaired, _ = self.validator.repair(make_invoice(currency="$"), text="Amounts in CAD. Total $110")
+        self.assertEqual(repaired.metadata.currency, "CAD")
+
+        report = self.validator.validate(make_invoice(invoice_date="2024-03-10", due_date="2024-03-01"))
+        self.assertEqual([i.code for i in report.issues], ["due_before_issue"])
+
+class TestTargetedReextraction(unittest.TestCase):
+    """Test that only failing fields are re-asked"""
+
+    def test_reextracts_only_the_suspect_field(self):
+        """A wrong total is re-extracted alone and kept once it reconciles"""
+        model = FakeGenerativeModel(responder=lambda contents, config: json.dumps({"total_amount": 110.0}))
+
+        class NoChunks:
+            def query_document(self, document_id, query, n_results=3):
+                return []
+
+        agent = InvoiceAgent(invoice_parser=InvoiceParser(model=model), vector_indexer=NoChunks())
+        agent.current_document_id = "doc"
+        agent.current_text = "Subtotal: 100.00\nTax: 10.00\nTotal: 110.00"
+        agent.current_invoice_data = make_invoice(subtotal=100.0, tax_total=10.0, total_amount=11.0)
+
+        report = agent._validate_and_repair(max_reextractions=2)
+
+        self.assertTrue(report.valid, report.issues)
+        self.assertEqual(report.reextracted, ["total_amount"])
+        self.assertEqual(agent.current_invoice_data.metadata.total_amount, 110.0)
+        self.assertEqual(len(model.calls), 1)
+
+if __name__ == '__main__':
+    unittest.main()
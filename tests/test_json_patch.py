@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Unit tests for patch-based invoice corrections
+"""
+
+import json
+import unittest
+from models import InvoiceData, InvoiceMetadata, LineItem
+from tools.fake_model import FakeGenerativeModel
+from tools.invoice_parser import InvoiceParser
+from tools.json_patch import apply_patch
+
+def make_invoice(rows: int = 50) -> InvoiceData:
+    return InvoiceData(
+        metadata=InvoiceMetadata(invoice_number="INV-1", vendor_name="Acme Ltd", currency="USD", total_amount=100.0),
+        line_items=[LineItem(description=f"Part {i}", quantity=1, amount=float(i)) for i in range(rows)],
+    )
+
+class TestApplyPatch(unittest.TestCase):
+    """Test JSON-Patch style operations"""
+
+    def test_replace_add_remove(self):
+        """Ops address metadata fields and line items by index"""
+        doc = {"metadata": {"po_number": None}, "line_items": [{"a": 0}, {"a": 1}, {"a": 2}]}
+        patched, errors = apply_patch(doc, [
+            {"op": "remove", "path": "/line_items/0"},
+            {"op": "replace", "path": "/metadata/po_number", "value": "PO-9"},
+            {"op": "replace", "path": "/line_items/2/a", "value": 20},
+            {"op": "add", "path": "/line_items/-", "value": {"a": 3}},
+            {"op": "remove", "path": "/line_items/1"},
+        ])
+        self.assertEqual(errors, [])
+        self.assertEqual(patched["metadata"]["po_number"], "PO-9")
+        self.assertEqual(patched["line_items"], [{"a": 20}, {"a": 3}])
+        self.assertIsNone(doc["metadata"]["po_number"])
+
+    def test_mixed_add_and_remove_use_original_indices(self):
+        """Inserts and removals do not shift the items later ops address"""
+        doc = {"line_items": [{"a": 0}, {"a": 1}, {"a": 2}]}
+        patched, errors = apply_patch(doc, [
+            {"op": "add", "path": "/line_items/0", "value": {"a": "new"}},
+            {"op": "remove", "path": "/line_items/2"},
+            {"op": "replace", "path": "/line_items/1/a", "value": 10},
+            {"op": "add", "path": "/line_items/3", "value": {"a": "end"}},
+            {"op": "replace", "path": "/line_items/2/a", "value": 20},
+        ])
+        self.assertEqual(patched["line_items"], [{"a": "new"}, {"a": 0}, {"a": 10}, {"a": "end"}])
+        self.assertEqual(len(errors), 1)  # item 2 was already removed
+
+    def test_invalid_ops_are_reported(self):
+        """Out-of-range indices and unknown ops are skipped with an error"""
+        patched, errors = apply_patch({"line_items": []}, [
+            {"op": "replace", "path": "/line_items/4/a", "value": 1},
+            {"op": "move", "path": "/line_items/0"},
+        ])
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(patched, {"line_items": []})
+
+class TestPatchCorrections(unittest.TestCase):
+    """Test the delta-only correction protocol"""
+
+    def test_context_is_limited_to_relevant_fields(self):
+        """Only the fields and rows named by the query are sent"""
+        parser = InvoiceParser(model=FakeGenerativeModel())
+        invoice = make_invoice()
+
+        context = parser._correction_context(invoice, "Line 3 amount should be 250.00")
+        self.assertEqual([row["i"] for row in context["line_items"]], [2])
+        self.assertEqual(context["line_item_count"], 50)
+
+        context = parser._correction_context(invoice, "PO number is missing")
+        self.assertEqual(context["metadata"], {"po_number": None})
+        self.assertEqual(context["line_items"], [])
+
+    def test_reprompt_applies_ops(self):
+        """Returned ops are merged without replacing the whole table"""
+        ops = {"ops": [
+            {"op": "replace", "path": "/line_items/2/amount", "value": "$1,250.00"},
+            {"op": "add", "path": "/line_items/-", "item": {"description": "Freight", "amount": 5}},
+            {"op": "replace", "path": "/metadata/po_number", "value": "PO-7"},
+            {"op": "replace", "path": "/metadata/not_a_field", "value": "x"},
+        ]}
+        model = FakeGenerativeModel(responder=lambda contents, config: json.dumps(ops))
+        parser = InvoiceParser(model=model)
+        invoice = make_invoice()
+
+        updated = parser.reprompt_correction("Line 3: 1,250.00", invoice, "Line 3 amount should be 1250")
+
+        self.assertEqual(updated.line_items[2].amount, 1250.0)
+        self.assertEqual(updated.line_items[-1].description, "Freight")
+        self.assertEqual(len(updated.line_items), 51)
+        self.assertEqual(updated.metadata.po_number, "PO-7")
+        self.assertIs(updated.line_items[10], invoice.line_items[10])
+
+        prompt = model.calls[0]["contents"][0]
+        self.assertNotIn("Part 10", prompt)
+        self.assertLess(parser.last_prompt_stats["sent_tokens"], parser.last_prompt_stats["baseline_tokens"])
+
+    def test_legacy_response_still_applied(self):
+        """A partial-object response is merged the old way"""
+        legacy = {"metadata": {"currency": "GBP"}}
+        model = FakeGenerativeModel(responder=lambda contents, config: json.dumps(legacy))
+        updated = InvoiceParser(model=model).reprompt_correction("text", make_invoice(3), "Currency is GBP")
+        self.assertEqual(updated.metadata.currency, "GBP")
+        self.assertEqual(len(updated.line_items), 3)
+
+if __name__ == '__main__':
+    unittest.main()
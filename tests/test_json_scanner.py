@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Unit tests for incremental JSON scanning of model output
+"""
+
+import json
+import unittest
+from tools.json_scanner import JSONStreamScanner, StreamingObjectReader, extract_json
+
+class TestJSONStreamScanner(unittest.TestCase):
+    """Test scanning of streamed and wrapped JSON"""
+
+    def test_streamed_chunks(self):
+        """A value split across chunks is emitted once its last chunk arrives"""
+        text = '```json\n{"metadata": {"a": "}"}, "line_items": [{"b": [1, 2]}]}\n```'
+        scanner = JSONStreamScanner()
+        emitted = []
+        for i in range(0, len(text), 7):
+            emitted.extend(scanner.feed(text[i:i + 7]))
+        self.assertEqual(len(emitted), 1)
+        self.assertEqual(json.loads(emitted[0])["line_items"][0]["b"], [1, 2])
+
+    def test_in_progress(self):
+        """An unfinished value is reported as in progress"""
+        scanner = JSONStreamScanner()
+        self.assertEqual(scanner.feed('{"metadata": {"a": 1'), [])
+        self.assertTrue(scanner.in_progress)
+        self.assertEqual(scanner.feed('}}'), ['{"metadata": {"a": 1}}'])
+
+    def test_skips_invalid_candidates(self):
+        """Bracketed prose before the payload is skipped"""
+        self.assertEqual(extract_json('Note [see below]: {"x": 1}'), '{"x": 1}')
+        self.assertEqual(extract_json('{not json} then {"x": {"y": 2}}'), '{"x": {"y": 2}}')
+
+    def test_unclosed_bracket_in_prose(self):
+        """A bracket that never closes does not hide a later value"""
+        self.assertEqual(extract_json('Totals (see [1: {"x": 1} and [2, 3]'), '{"x": 1}')
+        self.assertEqual(extract_json('Fields {incl. tax:\n```json\n{"a": [1]}\n```'), '{"a": [1]}')
+        scanner = JSONStreamScanner()
+        self.assertEqual(scanner.feed('note { then [1, 2'), [])
+        self.assertEqual(scanner.finish(), [])
+        self.assertTrue(scanner.in_progress)  # "[1, 2" is cut-off JSON, not prose
+        self.assertIsNone(extract_json('{"metadata": {"invoice_number": "A1"}, "line_items": [{"d": "x'))
+
+    def test_no_json(self):
+        """Text without a complete value yields None"""
+        self.assertIsNone(extract_json("no data here"))
+        self.assertIsNone(extract_json('{"truncated": ['))
+
+class TestStreamingObjectReader(unittest.TestCase):
+    """Test early emission of metadata fields"""
+
+    def test_fields_emitted_when_complete(self):
+        """Each member is emitted once a delimiter follows its value"""
+        reader = StreamingObjectReader("metadata")
+        self.assertEqual(reader.feed('{"metadata": {"invoice_number": "INV-1'), [])
+        self.assertEqual(reader.feed('", "total_amount": 12'), [("invoice_number", "INV-1")])
+        self.assertEqual(reader.feed('3.5}, "line_items": ['), [("total_amount", 123.5)])
+        self.assertTrue(reader.done)
+        self.assertEqual(reader.feed('{"metadata": {"x": 1}}]}'), [])
+
+if __name__ == '__main__':
+    unittest.main()
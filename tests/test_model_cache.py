@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the record/replay model cache
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from tools.fake_model import FakeGenerativeModel, FakeResponse
+from tools.model_cache import CachedModel, ModelCacheMiss, ModelCacheStore, open_store
+
+PDF_REQUEST = ["Extract all text", {"mime_type": "application/pdf", "data": b"%PDF-1.4 fake"}]
+JSON_CONFIG = {"response_mime_type": "application/json", "response_schema": {"type": "object"}}
+
+class CountingStream:
+    """Model whose streamed chunks are counted as they are produced"""
+
+    model_name = "counting"
+
+    def __init__(self):
+        self.produced = 0
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        def chunks():
+            for _ in range(10):
+                self.produced += 1
+                yield FakeResponse("x" * 50)
+        return chunks()
+
+class TestModelCache(unittest.TestCase):
+    """Test recording, replay and persistence"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "model_cache.bin")
+        self.model = FakeGenerativeModel(responder=lambda contents, config: f"answer to {contents[0]} ({len(config)})")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_record_then_replay_offline(self):
+        """Recorded responses (plain and streamed) are replayed without a model"""
+        recorder = CachedModel(self.model, ModelCacheStore(self.path), "record")
+        plain = recorder.generate_content(PDF_REQUEST).text
+        streamed = "".join(chunk.text for chunk in recorder.generate_content(["Parse"], stream=True, generation_config=JSON_CONFIG))
+        recorder.generate_content(PDF_REQUEST)
+        self.assertEqual(len(self.model.calls), 2)
+        self.assertEqual((recorder.hits, recorder.misses), (1, 2))
+
+        replayer = CachedModel(None, ModelCacheStore(self.path), "replay", model_name="fake")
+        self.assertEqual(replayer.generate_content(PDF_REQUEST).text, plain)
+        self.assertEqual("".join(c.text for c in replayer.generate_content(["Parse"], stream=True, generation_config=JSON_CONFIG)), streamed)
+
+        with self.assertRaises(ModelCacheMiss):
+            replayer.generate_content(["Parse"], generation_config={"response_mime_type": "application/json"})
+        with self.assertRaises(ModelCacheMiss):
+            replayer.generate_content(["Extract all text", {"mime_type": "application/pdf", "data": b"other"}])
+
+    def test_stream_abandoned_early_is_recorded(self):
+        """A stream the consumer stops reading records what was read and is not drained"""
+        model = CountingStream()
+        recorder = CachedModel(model, ModelCacheStore(self.path), "record")
+        stream = recorder.generate_content(["Parse"], stream=True)
+        next(stream)
+        next(stream)
+        stream.close()
+        self.assertEqual(model.produced, 2)
+        self.assertEqual(recorder.generate_content(["Parse"]).text, "x" * 100)
+        self.assertEqual(recorder.hits, 1)
+
+    @unittest.skipUnless(hasattr(os, "fork"), "fork not available")
+    def test_forked_worker_has_own_file_offsets(self):
+        """Reads in a forked worker do not move the parent's file offset"""
+        store = open_store(self.path)
+        CachedModel(self.model, store, "record").generate_content(["first"])
+        store._reader.seek(0)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child = open_store(self.path)
+                child.get(next(iter(child._index)))
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        self.assertEqual(store._reader.tell(), 0)
+
+    def test_torn_record_is_dropped(self):
+        """A partially written last record is cut off on open"""
+        store = ModelCacheStore(self.path)
+        CachedModel(self.model, store, "record").generate_content(["first"])
+        store.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\x00" * 20)
+
+        store = ModelCacheStore(self.path)
+        self.assertEqual(len(store), 1)
+        CachedModel(self.model, store, "record").generate_content(["second"])
+        self.assertEqual(len(ModelCacheStore(self.path)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
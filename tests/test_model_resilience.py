@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Unit tests for the model circuit breaker, hedged requests and failed-page retries
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from config import Config
+from tools.failed_pages import FailedPageStore
+from tools.fake_model import FakeGenerativeModel, FakeModelError, FakeResponse
+from tools.model_resilience import CircuitBreaker, CircuitOpenError, ResilientModel
+
+class SlowFirstCall:
+    """Model whose first call hangs; later calls answer at once"""
+
+    model_name = "slow-first"
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if stream:
+            return self._stream(call)
+        if call == 1:
+            time.sleep(1)
+        return FakeResponse(f"call {call}")
+
+    def _stream(self, call: int):
+        if call == 1:
+            time.sleep(1)  # slow to the first chunk
+        yield FakeResponse(f"call {call} ")
+        yield FakeResponse("done")
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Test opening, failing fast and recovering through a trial call"""
+
+    def test_opens_and_recovers(self):
+        """A high error rate opens the circuit; a successful trial closes it"""
+        model = FakeGenerativeModel("flaky", error_rate=1.0)
+        breaker = CircuitBreaker("flaky", window=10, failure_rate=0.5, min_calls=4, cooldown_s=60, enabled=True)
+        resilient = ResilientModel(model, breaker, hedge=False)
+        for _ in range(4):
+            with self.assertRaises(FakeModelError):
+                resilient.generate_content(["x"])
+        self.assertEqual(breaker.state, "open")
+
+        with self.assertRaises(CircuitOpenError):
+            resilient.generate_content(["x"])
+        self.assertEqual(len(model.calls), 4)  # failed fast, no call made
+
+        breaker.cooldown_s = 0
+        model.error_rate = 0.0
+        resilient.generate_content(["x"])
+        self.assertEqual(breaker.state, "closed")
+        self.assertEqual(breaker.stats()["opened"], 1)
+
+    def test_failed_trial_reopens(self):
+        """Only one trial call goes out while half-open"""
+        breaker = CircuitBreaker("m", window=4, failure_rate=0.5, min_calls=2, cooldown_s=0, enabled=True)
+        breaker.record(False)
+        breaker.record(False)
+        breaker.before_call()  # the trial
+        with self.assertRaises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record(False)
+        self.assertEqual(breaker.state, "open")
+        self.assertEqual(breaker.opened, 2)
+
+class TestHedgedRequests(unittest.TestCase):
+    """Test that a call slower than the latency quantile is duplicated"""
+
+    def test_hedge_wins(self):
+        """The duplicate answers first and its response is returned"""
+        breaker = CircuitBreaker("slow-first", enabled=True)
+        for _ in range(Config.HEDGE_MIN_SAMPLES):
+            breaker.record(True, 0.02)
+        model = SlowFirstCall()
+
+        start = time.perf_counter()
+        response = ResilientModel(model, breaker, hedge=True).generate_content(["x"])
+        self.assertEqual(response.text, "call 2")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual((breaker.hedges, breaker.hedge_wins), (1, 1))
+
+    def test_streamed_call_is_hedged_on_first_chunk(self):
+        """A stream slower than usual to its first chunk is duplicated and the faster one is read"""
+        breaker = CircuitBreaker("slow-first", enabled=True)
+        for _ in range(Config.HEDGE_MIN_SAMPLES):
+            breaker.record_first_chunk(0.02)
+        model = SlowFirstCall()
+
+        start = time.perf_counter()
+        chunks = ResilientModel(model, breaker, hedge=True).generate_content(["x"], stream=True)
+        self.assertEqual("".join(chunk.text for chunk in chunks), "call 2 done")
+        self.assertLess(time.perf_counter() - start, 0.5)
+        self.assertEqual((breaker.hedges, breaker.hedge_wins), (1, 1))
+
+    def test_no_hedge_without_history(self):
+        """Calls are not hedged until enough latencies are known"""
+        breaker = CircuitBreaker("slow-first", enabled=True)
+        model = SlowFirstCall()
+        self.assertEqual(ResilientModel(model, breaker, hedge=True).generate_content(["x"]).text, "call 1")
+        self.assertEqual(breaker.hedges, 0)
+
+class TestFailedPageStore(unittest.TestCase):
+    """Test retry backoff, persistence and giving up"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, "failed_pages.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_backoff_and_give_up(self):
+        """Entries become due after their backoff and are dropped after the last attempt"""
+        with mock.patch.multiple(Config, RETRY_BACKOFF_S=10, RETRY_MAX_ATTEMPTS=2):
+            store = FailedPageStore(self.path)
+            store.add("DOC-P2", "doc.pdf", [2, 3], "503")
+            self.assertEqual(store.due(), [])
+            due = FailedPageStore(self.path).due(now=time.time() + 11)  # read back from disk
+            self.assertEqual([(e["document_id"], e["page_numbers"]) for e in due], [("DOC-P2", [2, 3])])
+
+            store.add("DOC-P2", "doc.pdf", [2, 3], "503")
+            self.assertEqual(store.due(now=time.time() + 11), [])  # backoff doubled
+            self.assertEqual(len(store.due(now=time.time() + 21)), 1)
+            store.add("DOC-P2", "doc.pdf", [2, 3], "503")
+            self.assertEqual(store.list(), [])
+
+            store.add("DOC-P4", "doc.pdf", [4], "503")
+            store.resolve("DOC-P4")
+            self.assertEqual(FailedPageStore(self.path).list(), [])
+
+if __name__ == '__main__':
+    unittest.main()
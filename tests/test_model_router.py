@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Unit tests for model tier routing and escalation
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from config import Config
+from invoice_agent import InvoiceAgent
+from tools.fake_model import FakeEmbeddingFunction, FakeGenerativeModel, FakeModelError
+from tools.invoice_parser import InvoiceParser
+from models import ValidationIssue, ValidationReport
+from tools.model_router import ModelRouter
+from tools.pdf_extractor import PDFExtractor
+from tools.vector_indexer import VectorIndexer
+from tools.vendor_manager import VendorManager
+
+SAMPLE_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample.pdf")
+TIERS = ["lite", "flash", "pro"]
+
+class TestModelRouter(unittest.TestCase):
+    """Test tier choice, escalation and statistics"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.stats_path = os.path.join(self.tmp_dir, "router_stats.json")
+        self.models = {name: FakeGenerativeModel(name, responder=lambda c, g, name=name: name) for name in TIERS}
+        self.router = self.make_router()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def make_router(self) -> ModelRouter:
+        return ModelRouter(TIERS, [(0.1, 0.4), (0.3, 2.5), (1.25, 10.0)], self.stats_path, self.models.__getitem__)
+
+    def test_escalates_until_accepted(self):
+        """Rejected results and errors move the task up one tier at a time"""
+        self.models["lite"].error_rate = 1.0
+        result = self.router.run(
+            "field",
+            lambda model: model.generate_content(["PO number?"]).text,
+            accept=lambda text: (text == "pro", 0.9 if text == "pro" else None),
+        )
+        self.assertEqual(result, "pro")
+
+        stats = self.router.stats()
+        self.assertEqual(stats["tiers"]["lite"]["errors"], 1)
+        self.assertEqual(stats["tiers"]["flash"]["calls"], 1)
+        self.assertGreater(stats["tiers"]["pro"]["cost_usd"], stats["tiers"]["flash"]["cost_usd"])
+        self.assertEqual(stats["tasks"]["field"]["flash"]["escalation_rate"], 1.0)
+        self.assertEqual(stats["tasks"]["field"]["pro"]["mean_confidence"], 0.9)
+
+        # The last tier's error is raised
+        for model in self.models.values():
+            model.error_rate = 1.0
+        with self.assertRaises(FakeModelError):
+            self.router.run("field", lambda model: model.generate_content(["x"]).text)
+
+    def test_choose_from_inputs_and_history(self):
+        """Large parses and scanned pages start higher; a tier that keeps escalating is skipped"""
+        self.assertEqual(self.router.choose("parse", input_tokens=100), 0)
+        self.assertEqual(self.router.choose("parse", input_tokens=Config.ROUTER_LARGE_INPUT_TOKENS + 1), 1)
+        self.assertEqual(self.router.choose("extract_text", page_type="scanned"), 1)
+
+        with mock.patch.object(Config, "ROUTER_MIN_SAMPLES", 3):
+            for _ in range(3):
+                self.router.run("correct", lambda model: model.generate_content(["x"]).text,
+                                accept=lambda text: (text != "lite", None))
+            self.assertFalse(os.path.exists(self.stats_path))  # nothing written on the request path
+            self.router.flush()
+            self.assertEqual(self.make_router().choose("correct"), 1)  # read back from ROUTER_STATS_PATH
+            self.assertEqual(self.router.choose("field"), 0)
+
+    def test_skipped_tier_is_probed_and_outcomes_decay(self):
+        """A skipped tier still gets a share of tasks, and old outcomes lose weight"""
+        with mock.patch.multiple(Config, ROUTER_MIN_SAMPLES=3, ROUTER_PROBE_EVERY=4, ROUTER_STATS_WINDOW=6):
+            for _ in range(3):
+                self.router.record_task("correct", 0, 0.1, escalated=True)
+            self.assertEqual([self.router.choose("correct") for _ in range(8)], [1, 1, 1, 0, 1, 1, 1, 0])
+
+            for _ in range(4):
+                self.router.record_task("correct", 0, 0.1)
+            entry = self.router.stats()["tasks"]["correct"]["lite"]
+            self.assertEqual((entry["attempts"], entry["escalated"]), (3.5, 1.5))
+            self.assertEqual(self.router.choose("correct"), 0)  # recovered below the escalation threshold
+
+class TestAgentRouting(unittest.TestCase):
+    """Test that the agent runs its model tasks through the router"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        patcher = mock.patch.multiple(
+            Config,
+            VECTOR_DB_DIR=self.tmp_dir,
+            VENDOR_DB_PATH=f"{self.tmp_dir}/vendors.json",
+            BM25_INDEX_PATH=f"{self.tmp_dir}/bm25.sqlite3",
+            DOCUMENT_STORE_DIR=f"{self.tmp_dir}/documents",
+            EXTRACTED_TEXT_DIR=f"{self.tmp_dir}/texts",
+            DEDUPE_INVOICES=False,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+
+        self.default_model = FakeGenerativeModel()
+        self.tier_models = {name: FakeGenerativeModel(name) for name in TIERS}
+        self.tier_models["lite"].error_rate = 1.0
+        self.agent = InvoiceAgent(
+            pdf_extractor=PDFExtractor(model=self.default_model),
+            vector_indexer=VectorIndexer(embedding_function=FakeEmbeddingFunction()),
+            invoice_parser=InvoiceParser(model=self.default_model),
+            vendor_manager=VendorManager(),
+            model_router=ModelRouter(TIERS, stats_path="", model_factory=self.tier_models.__getitem__),
+        )
+
+    def test_pipeline_uses_tiers(self):
+        """A failing cheap tier escalates; the tools' own model is not called"""
+        result = self.agent.process_invoice(SAMPLE_PDF, "DOC-1")
+        self.assertIsNotNone(result["invoice_data"])
+        self.assertEqual(self.default_model.calls, [])
+        self.assertTrue(self.tier_models["flash"].calls)
+
+        tasks = self.agent.model_router.stats()["tasks"]
+        self.assertEqual(tasks["extract_text"]["lite"]["failed"], 1)
+        self.assertEqual(tasks["parse"]["flash"]["attempts"], 1)
+
+    def test_warnings_do_not_escalate(self):
+        """Only issues the validator would re-ask about reject a parse"""
+        warning = ValidationIssue(field="line_items", code="line_amount_mismatch", message="discount", reextract=False)
+        report = ValidationReport(valid=False, issues=[warning], confidence={"total_amount": 0.8})
+        self.assertEqual(InvoiceAgent._accept_validation(report), (True, 0.8))
+        report.issues.append(ValidationIssue(field="total_amount", code="total_mismatch", message="x", reextract=True))
+        self.assertFalse(InvoiceAgent._accept_validation(report)[0])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Unit tests for local page classification
+"""
+
+import os
+import random
+import unittest
+from PyPDF2 import PageObject
+from PyPDF2.generic import DecodedStreamObject, DictionaryObject, NameObject, NumberObject
+from tools.page_classifier import PageClassifier, group_invoice_pages
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_PDF = os.path.join(ROOT_DIR, "sample.pdf")
+TEST_PDF = os.path.join(ROOT_DIR, "test.pdf")
+
+class TextPage(dict):
+    """Page stand-in exposing only a text layer"""
+
+    def __init__(self, text: str):
+        super().__init__()
+        self.text = text
+
+    def extract_text(self):
+        return self.text
+
+def image_page(pixels: bytes, width: int = 100) -> PageObject:
+    """Blank page carrying one uncompressed grayscale image"""
+    image = DecodedStreamObject()
+    image.set_data(pixels)
+    image.update({
+        NameObject("/Subtype"): NameObject("/Image"),
+        NameObject("/Width"): NumberObject(width),
+        NameObject("/Height"): NumberObject(len(pixels) // width),
+        NameObject("/BitsPerComponent"): NumberObject(8),
+        NameObject("/ColorSpace"): NameObject("/DeviceGray"),
+    })
+    page = PageObject.create_blank_page(width=612, height=792)
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/Im0"): image})
+    })
+    return page
+
+class TestPageClassifier(unittest.TestCase):
+    """Test blank, scanned, invoice and non-invoice pages"""
+
+    def setUp(self):
+        self.classifier = PageClassifier()
+
+    def test_invoice_pages(self):
+        """Both sample invoice pages are kept for the model"""
+        self.assertEqual([c.label for c in self.classifier.classify_pdf(SAMPLE_PDF)], ["invoice", "invoice"])
+
+    def test_blank_and_scanned_pages(self):
+        """Image-only pages are blank unless their images carry detail"""
+        self.assertEqual(self.classifier.classify(PageObject.create_blank_page(width=612, height=792)).label, "blank")
+        self.assertEqual(self.classifier.classify(image_page(bytes([255]) * 10000)).label, "blank")
+
+        rng = random.Random(0)
+        noise = bytes(rng.getrandbits(8) for _ in range(10000))
+        scanned = self.classifier.classify(image_page(noise))
+        self.assertEqual(scanned.label, "scanned")
+        self.assertGreater(scanned.image_entropy, 1.0)
+
+    def test_non_invoice_text(self):
+        """Terms pages are 'other'; invoice text is kept"""
+        terms = TextPage("Terms and Conditions\n1. The supplier shall not be liable. Governing law: England. "
+                         "The customer hereby agrees to the warranty terms.")
+        self.assertEqual(self.classifier.classify(terms).label, "other")
+
+        invoice = TextPage("TAX INVOICE\nInvoice No: 42\nQty Unit Price Amount\n2 10.00 20.00\nTotal 20.00")
+        self.assertEqual(self.classifier.classify(invoice).label, "invoice")
+        self.assertNotIn("text", self.classifier.classify(invoice).model_dump())
+
+class TestInvoicePageGrouping(unittest.TestCase):
+    """Test stitching continuation pages into logical invoices"""
+
+    def setUp(self):
+        self.classifier = PageClassifier()
+
+    def group(self, *texts) -> list:
+        return group_invoice_pages([self.classifier.classify(TextPage(text)) for text in texts])
+
+    def test_sample_pdfs(self):
+        """A two-page invoice is one group; two complete copies stay separate"""
+        self.assertEqual(group_invoice_pages(self.classifier.classify_pdf(SAMPLE_PDF)), [[0, 1]])
+        self.assertEqual(group_invoice_pages(self.classifier.classify_pdf(TEST_PDF)), [[0], [1]])
+
+    def test_continuation_signals(self):
+        """Headerless pages, carried-forward totals and page x of y continue an invoice"""
+        header = "TAX INVOICE\nInvoice No: INV-7\nBill To: Acme\nQty Rate Amount\n"
+        items = "2 10.00 20.00\n3 5.00 15.00\n1 7.50 7.50\n"
+        self.assertEqual(self.group(header + items, items + "Grand Total 42.50"), [[0, 1]])
+        self.assertEqual(
+            self.group(header + items + "Carried forward 42.50", "Brought forward 42.50\nInvoice No: INV-7\n" + items
+                       + "Total 65.00"),
+            [[0, 1]],
+        )
+        self.assertEqual(self.group(header + items + "Page 1 of 2", header + items + "Page 2 of 2"), [[0, 1]])
+
+    def test_new_invoice_starts_group(self):
+        """A different invoice number, or any page after a final total, starts a new group"""
+        first = "TAX INVOICE\nInvoice No: INV-7\nQty Rate Amount\n2 10.00 20.00\n"
+        second = "TAX INVOICE\nInvoice No: INV-8\nQty Rate Amount\n4 10.00 40.00\n"
+        self.assertEqual(self.group(first, second), [[0], [1]])
+        self.assertEqual(self.group(first + "Total 20.00", "Qty Rate Amount\n4 10.00 40.00\nTotal 40.00"), [[0], [1]])
+
+        terms = "Terms and Conditions\nThe supplier shall not be liable. Governing law applies hereby."
+        self.assertEqual(self.group(first, terms, "Qty Rate Amount\n4 10.00 40.00\nTotal 40.00"), [[0], [2]])
+
+if __name__ == '__main__':
+    unittest.main()
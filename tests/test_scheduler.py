@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Unit tests for request admission control and priority scheduling
+"""
+
+import threading
+import unittest
+from unittest import mock
+from fastapi.testclient import TestClient
+import server
+from tools.scheduler import RequestScheduler, SchedulerSaturated
+
+class TestRequestScheduler(unittest.TestCase):
+    """Test bounded queues, weighted fair dequeueing and bulk concurrency limits"""
+
+    def setUp(self):
+        self.gate = threading.Event()
+        self.started = threading.Event()
+        self.order = []
+
+    def blocker(self):
+        self.started.set()
+        self.gate.wait(5)
+
+    def record(self, name):
+        self.order.append(name)
+
+    def test_weighted_fair_order(self):
+        """Queued interactive jobs get weight-many turns per bulk turn"""
+        scheduler = RequestScheduler(workers=1, classes={
+            "interactive": {"weight": 3, "max_queue": 10},
+            "bulk": {"weight": 1, "max_queue": 10},
+        })
+        running = scheduler.submit("bulk", self.blocker)
+        self.started.wait(5)
+        futures = [scheduler.submit("bulk", self.record, f"b{i}") for i in range(2)]
+        futures += [scheduler.submit("interactive", self.record, f"i{i}") for i in range(6)]
+        self.gate.set()
+        for future in [running] + futures:
+            future.result(5)
+        self.assertEqual(self.order, ["i0", "i1", "b0", "i2", "i3", "i4", "b1", "i5"])
+
+    def test_saturated_queue_rejects(self):
+        """A full queue raises with a Retry-After estimate; other classes still admit"""
+        scheduler = RequestScheduler(workers=1, classes={
+            "interactive": {"max_queue": 5},
+            "bulk": {"max_queue": 1},
+        })
+        running = scheduler.submit("bulk", self.blocker)
+        self.started.wait(5)
+        queued = scheduler.submit("bulk", self.record, "b")
+        with self.assertRaises(SchedulerSaturated) as ctx:
+            scheduler.submit("bulk", self.record, "rejected")
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        interactive = scheduler.submit("interactive", self.record, "i")
+
+        stats = scheduler.stats()["classes"]
+        self.assertEqual(stats["bulk"]["queued"], 1)
+        self.assertEqual(stats["bulk"]["rejected"], 1)
+        self.assertEqual(stats["interactive"]["queued"], 1)
+        self.gate.set()
+        for future in (running, queued, interactive):
+            future.result(5)
+        self.assertNotIn("rejected", self.order)
+
+    def test_bulk_leaves_workers_for_interactive(self):
+        """Bulk jobs never take every worker"""
+        scheduler = RequestScheduler(workers=2, classes={
+            "interactive": {"max_queue": 5},
+            "bulk": {"max_queue": 5, "max_active": 1},
+        })
+        bulk = [scheduler.submit("bulk", self.blocker) for _ in range(2)]
+        scheduler.submit("interactive", self.record, "i").result(5)
+        self.assertEqual(scheduler.stats()["classes"]["bulk"]["queued"], 1)
+        self.gate.set()
+        for future in bulk:
+            future.result(5)
+
+class TestServerAdmission(unittest.TestCase):
+    """Test the 429 response of a saturated endpoint"""
+
+    def test_retry_after(self):
+        """A full interactive queue turns a search into 429 with Retry-After"""
+        full = RequestScheduler(workers=1, classes={"interactive": {"max_queue": 0}, "bulk": {"max_queue": 0}})
+        with mock.patch.object(server, "scheduler", full):
+            response = TestClient(server.app).get("/search", params={"q": "total"})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+
+    def test_admin_index_work_is_scheduled(self):
+        """Index maintenance endpoints queue as bulk work instead of blocking the event loop"""
+        full = RequestScheduler(workers=1, classes={"interactive": {"max_queue": 0}, "bulk": {"max_queue": 0}})
+        client = TestClient(server.app)
+        with mock.patch.object(server, "scheduler", full):
+            self.assertEqual(client.post("/admin/index/compact").status_code, 429)
+            self.assertEqual(client.get("/admin/index/stats").status_code, 429)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Unit tests for response shaping, text ranges and compression
+"""
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+import server
+from config import Config
+from server import RangeNotSatisfiable, parse_range, shape_pages
+from tools import compression
+
+PAGE = {
+    "document_id": "DOC-1",
+    "page_number": 1,
+    "extracted_text": "Invoice text " * 100,
+    "invoice_data": {"metadata": {"invoice_number": "INV-1", "total_amount": 110.0}, "line_items": [{"amount": 110.0}]},
+    "vendor": {"vendor_id": "V1", "vendor_name": "Acme"},
+}
+
+class TestResponseShaping(unittest.TestCase):
+    """Test ?fields= and ?include_text="""
+
+    def test_include_text(self):
+        """Text is returned by default and dropped on request"""
+        self.assertIn("extracted_text", shape_pages([PAGE])[0])
+        shaped = shape_pages([PAGE], include_text=False)[0]
+        self.assertNotIn("extracted_text", shaped)
+        self.assertEqual(shaped["vendor"], PAGE["vendor"])
+        unparsed = {**PAGE, "invoice_data": None}
+        self.assertEqual(shape_pages([unparsed])[0]["extracted_text"], PAGE["extracted_text"])
+
+    def test_field_selection(self):
+        """Dotted paths select nested fields; identifying keys are kept"""
+        shaped = shape_pages([PAGE], fields="invoice_data.metadata.total_amount, vendor.vendor_id")[0]
+        self.assertEqual(shaped, {
+            "document_id": "DOC-1",
+            "page_number": 1,
+            "invoice_data": {"metadata": {"total_amount": 110.0}},
+            "vendor": {"vendor_id": "V1"},
+        })
+        failed = {"document_id": "DOC-2", "error": "boom", "invoice_data": None}
+        self.assertEqual(shape_pages([failed], fields="invoice_data.metadata")[0], failed)
+
+    def test_parse_range(self):
+        """Single ranges in chars or bytes; invalid ones are ignored, ones past the end are unsatisfiable"""
+        self.assertEqual(parse_range("chars=0-9", 100), ("chars", 0, 10))
+        self.assertEqual(parse_range("bytes=90-", 100), ("bytes", 90, 100))
+        self.assertEqual(parse_range("bytes=-10", 100), ("bytes", 90, 100))
+        self.assertEqual(parse_range("chars=95-200", 100), ("chars", 95, 100))
+        for header in ("lines=0-1", "bytes=0-1,5-6", "bytes=a-b", "bytes=5-2", "bytes=-", "bytes=5"):
+            self.assertIsNone(parse_range(header, 100), header)
+        for header in ("chars=100-", "bytes=-0"):
+            with self.assertRaises(RangeNotSatisfiable, msg=header):
+                parse_range(header, 100)
+
+@unittest.skipUnless(compression.brotli, "brotli not installed")
+class TestCompression(unittest.TestCase):
+    """Test content negotiation of the compression middlewares"""
+
+    def setUp(self):
+        from fastapi.middleware.gzip import GZipMiddleware
+        app = FastAPI()
+        app.add_middleware(GZipMiddleware, minimum_size=100)
+        app.add_middleware(compression.BrotliMiddleware, minimum_size=100)
+        app.get("/text")(lambda: PlainTextResponse("x" * 5000))
+        app.get("/small")(lambda: PlainTextResponse("x"))
+        app.get("/partial")(lambda: PlainTextResponse("x" * 5000, status_code=206))
+        self.client = TestClient(app)
+
+    def test_negotiation(self):
+        """br is preferred, gzip is the fallback; small and partial bodies pass through"""
+        cases = [("/text", "gzip, br", "br"), ("/text", "gzip", "gzip"), ("/text", "identity", None),
+                 ("/small", "br", None), ("/partial", "br", None)]
+        for path, accept, expected in cases:
+            with self.subTest(path=path, accept=accept):
+                response = self.client.get(path, headers={"Accept-Encoding": accept})
+                self.assertEqual(response.headers.get("content-encoding"), expected)
+                self.assertEqual(len(response.text), 5000 if path != "/small" else 1)
+
+class TestConditionalRequests(unittest.TestCase):
+    """Test ETag / Last-Modified revalidation and byte ranges of the preview"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir, ignore_errors=True)
+        patcher = mock.patch.object(Config, "SESSION_DATA_PATH", os.path.join(self.tmp_dir, "session.json"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.pdf_path = os.path.join(self.tmp_dir, "upload.pdf")
+        with open(self.pdf_path, "wb") as f:
+            f.write(bytes(range(256)) * 4)
+        server.save_session(self.pdf_path, [{k: v for k, v in PAGE.items() if k != "extracted_text"}])
+        self.client = TestClient(server.app)
+
+    def test_current_revalidation(self):
+        """An unchanged session answers 304; saving it changes the ETag"""
+        first = self.client.get("/current?include_text=false")
+        self.assertEqual(first.status_code, 200)
+        etag = first.headers["ETag"]
+        self.assertEqual(first.json()["pages"][0]["document_id"], "DOC-1")
+
+        cached = self.client.get("/current?include_text=false", headers={"If-None-Match": etag})
+        self.assertEqual((cached.status_code, cached.content), (304, b""))
+        since = self.client.get("/current?include_text=false",
+                                headers={"If-Modified-Since": first.headers["Last-Modified"]})
+        self.assertEqual(since.status_code, 304)
+
+        time.sleep(0.01)
+        server.save_session(self.pdf_path, [{**PAGE, "document_id": "DOC-2"}])
+        changed = self.client.get("/current?include_text=false", headers={"If-None-Match": etag})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers["ETag"], etag)
+        self.assertEqual(changed.json()["pages"][0]["document_id"], "DOC-2")
+
+    def test_pdf_ranges(self):
+        """The preview supports 304, single byte ranges, If-Range and 416; invalid ranges get the whole file"""
+        full = self.client.get("/pdf")
+        self.assertEqual((full.status_code, len(full.content)), (200, 1024))
+        self.assertEqual(full.headers["Accept-Ranges"], "bytes")
+        etag = full.headers["ETag"]
+        self.assertEqual(self.client.get("/pdf", headers={"If-None-Match": etag}).status_code, 304)
+
+        part = self.client.get("/pdf", headers={"Range": "bytes=256-511", "If-Range": etag})
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(part.content, bytes(range(256)))
+        self.assertEqual(part.headers["Content-Range"], "bytes 256-511/1024")
+
+        stale = self.client.get("/pdf", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+        self.assertEqual((stale.status_code, len(stale.content)), (200, 1024))
+        unsatisfiable = self.client.get("/pdf", headers={"Range": "bytes=2000-"})
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable.headers["Content-Range"], "bytes */1024")
+        for header in ("pages=1-2", "bytes=5-2", "bytes=0-1,5-6"):
+            ignored = self.client.get("/pdf", headers={"Range": header})
+            self.assertEqual((ignored.status_code, len(ignored.content)), (200, 1024), header)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Unit tests for schema-constrained generation
+"""
+
+import unittest
+from models import InvoiceData
+from tools.fake_model import FakeGenerativeModel
+from tools.invoice_parser import InvoiceParser
+from tools.structured_output import field_schema, response_schema
+
+class TestResponseSchema(unittest.TestCase):
+    """Test response schemas generated from the pydantic models"""
+
+    def test_invoice_schema_matches_models(self):
+        """Schema mirrors InvoiceData, with optional fields nullable"""
+        schema = response_schema(InvoiceData)
+        self.assertEqual(schema["required"], ["metadata"])
+        metadata = schema["properties"]["metadata"]["properties"]
+        self.assertEqual(metadata["total_amount"], {"type": "number", "nullable": True})
+        line_item = schema["properties"]["line_items"]["items"]["properties"]
+        self.assertIn("hsn_sac", line_item)
+        self.assertNotIn("HNS/SAC", line_item)
+
+    def test_partial_schema_has_no_required(self):
+        """Partial schemas allow delta responses"""
+        self.assertNotIn("required", response_schema(InvoiceData, partial=True))
+
+    def test_field_schema(self):
+        """Single-field schemas use the model's field type"""
+        self.assertEqual(field_schema("po_number")["properties"]["po_number"]["type"], "string")
+        self.assertEqual(field_schema("line_items")["properties"]["line_items"]["type"], "array")
+        self.assertIsNone(field_schema(""))
+
+class TestStructuredParsing(unittest.TestCase):
+    """Test parsing against the local stand-in model"""
+
+    def test_parse_with_fake_model(self):
+        """Parser sends the schema and validates the constrained response"""
+        model = FakeGenerativeModel()
+        parser = InvoiceParser(model=model)
+        result = parser.parse_invoice("Invoice Number: INV-7\nPO Number: PO-12345\nSubtotal: 1,200.50")
+        self.assertEqual(result.metadata.invoice_number, "INV-7")
+        self.assertEqual(result.metadata.po_number, "PO-12345")
+        self.assertEqual(result.metadata.subtotal, 1200.5)
+        config = model.calls[0]["generation_config"]
+        self.assertEqual(config["response_mime_type"], "application/json")
+        self.assertIn("metadata", config["response_schema"]["properties"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Unit tests for prompt text preprocessing
+"""
+
+import unittest
+from tools.text_preprocessor import compact_text, estimate_tokens
+
+class TestCompactText(unittest.TestCase):
+    """Test whitespace and header/footer compaction"""
+
+    def test_collapses_layout_whitespace(self):
+        """Indentation, column padding and blank-line runs shrink"""
+        text = "    INVOICE   \n\n\n\n  Qty      Price      Amount\n  2        10.00      20.00   \n"
+        self.assertEqual(compact_text(text), "INVOICE\n\nQty\tPrice\tAmount\n2\t10.00\t20.00")
+
+    def test_removes_repeated_headers_and_footers(self):
+        """Headers/footers repeated on every page are kept once"""
+        page = "ACME LTD - Tax Invoice\nItem {n}: widget\nPage {n} of 3\nThank you for your business"
+        text = "\f".join(page.format(n=n) for n in range(1, 4))
+        compacted = compact_text(text)
+        self.assertEqual(compacted.count("ACME LTD - Tax Invoice"), 1)
+        self.assertEqual(compacted.count("Thank you for your business"), 1)
+        self.assertNotIn("Page 2 of 3", compacted)
+        for n in range(1, 4):
+            self.assertIn(f"Item {n}: widget", compacted)
+
+    def test_single_page_keeps_content(self):
+        """Single-page text only loses whitespace"""
+        self.assertEqual(compact_text("Total: 5.00"), "Total: 5.00")
+
+    def test_dates_and_fractions_are_kept(self):
+        """Only "Page N of M" lines are dropped, not dates or quantities"""
+        self.assertEqual(compact_text("Period\n03/2024\n1/2\nPage 1/2"), "Period\n03/2024\n1/2")
+
+    def test_estimate_tokens(self):
+        """Token estimate scales with length"""
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertLess(estimate_tokens("a" * 40), estimate_tokens("a" * 400))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+Unit tests for vector indexer helpers
+"""
+
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+from config import Config
+from tools.fake_model import FakeEmbeddingFunction
+from tools.vector_indexer import VectorIndexer, date_key
+
+def make_indexer(tmp_dir: str, tenant_id: str = None) -> VectorIndexer:
+    """Build an indexer whose stores all live under tmp_dir"""
+    with mock.patch.multiple(
+        Config,
+        VECTOR_DB_DIR=tmp_dir,
+        BM25_INDEX_PATH=f"{tmp_dir}/bm25.sqlite3",
+        DOCUMENT_STORE_DIR=f"{tmp_dir}/documents",
+        EXTRACTED_TEXT_DIR=f"{tmp_dir}/texts",
+    ):
+        return VectorIndexer(embedding_function=FakeEmbeddingFunction(), tenant_id=tenant_id)
+
+class TestDateKey(unittest.TestCase):
+    """Test invoice date normalization used for range filters"""
+
+    def test_common_formats(self):
+        """Common invoice date layouts map to the same key"""
+        for value in ["2024-03-05", "05/03/2024", "05.03.2024", "5 Mar 2024", "March 5, 2024", "05-Mar-2024", "5th March 2024"]:
+            with self.subTest(value=value):
+                self.assertEqual(date_key(value), 20240305)
+
+    def test_unparseable(self):
+        """Missing or unknown dates yield None"""
+        self.assertIsNone(date_key(None))
+        self.assertIsNone(date_key(""))
+        self.assertIsNone(date_key("next Tuesday"))
+
+class TestVectorIndexer(unittest.TestCase):
+    """Test indexing against the document store"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.indexer = make_indexer(self.tmp_dir)
+        self.text = "".join(f"Line {i}: widget {i} costs {i * 3}.00\n" for i in range(200))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_full_document_is_exact(self):
+        """Overlapping chunks do not duplicate text in the reconstruction"""
+        self.indexer.index_document("DOC1", self.text)
+        self.assertEqual(self.indexer.get_full_document("DOC1"), self.text)
+
+    def test_chunk_offsets_resolve_text(self):
+        """Query results are sliced from the store by chunk offsets"""
+        self.indexer.index_document("DOC1", self.text)
+        chunks = self.indexer.query_document("DOC1", "widget 150", n_results=1)
+        self.assertEqual(len(chunks), 1)
+        self.assertIn(chunks[0], self.text)
+
+    def test_stream_matches_batch_indexing(self):
+        """Indexing text as it streams in yields the same chunks"""
+        stream = self.indexer.open_stream("DOC2")
+        for i in range(0, len(self.text), 37):
+            stream.feed(self.text[i:i + 37])
+        stream.close()
+        streamed = self.indexer.collection.get(where={"document_id": "DOC2"})
+        spans = sorted((m["start"], m["end"]) for m in streamed["metadatas"])
+        self.assertEqual(spans, self.indexer._chunk_spans(self.text))
+        self.assertEqual({m["chunk_count"] for m in streamed["metadatas"]}, {len(spans)})
+        self.assertEqual(self.indexer.get_full_document("DOC2"), self.text)
+
+    def test_cleared_metadata_is_removed(self):
+        """A field updated to None no longer matches metadata filters"""
+        self.indexer.index_document("DOC1", self.text)
+        self.indexer.update_document_metadata("DOC1", {"vendor_id": "V1", "currency": "USD"})
+        self.indexer.update_document_metadata("DOC1", {"vendor_id": None, "currency": "EUR"})
+        chunks = self.indexer.collection.get(where={"document_id": "DOC1"})["metadatas"]
+        self.assertFalse(any("vendor_id" in m for m in chunks))
+        self.assertEqual({m["currency"] for m in chunks}, {"EUR"})
+
+    def test_open_stream_resolves_chunk_text(self):
+        """Chunks indexed before close resolve to the streamed text, not an earlier version"""
+        self.indexer.index_document("DOC3", "old version " * 200)
+        stream = self.indexer.open_stream("DOC3")
+        stream.feed(self.text[:3000])
+        chunks = self.indexer.query_document("DOC3", "widget", n_results=3)
+        self.assertTrue(chunks)
+        for chunk in chunks:
+            self.assertIn(chunk, self.text)
+
+    def test_chunk_spans_cover_text(self):
+        """Chunk spans cover the text without a redundant tail chunk"""
+        spans = self.indexer._chunk_spans(self.text)
+        self.assertEqual(spans[0][0], 0)
+        self.assertEqual(spans[-1][1], len(self.text))
+        self.assertLess(spans[-2][1], len(self.text))
+
+class TestIndexLifecycle(unittest.TestCase):
+    """Test retention, deletion, compaction and tenant isolation"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.indexer = make_indexer(self.tmp_dir)
+        self.indexer.index_document("DOC-1", "Invoice from Acme for freight")
+        self.indexer.index_document("SAMPLE-1", "Sample invoice text", session="sample")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_delete_documents(self):
+        """Deleting a document removes chunks and stored text"""
+        self.indexer.delete_documents(["DOC-1"])
+        self.assertNotIn("DOC-1", self.indexer.list_documents())
+        self.assertEqual(self.indexer.get_full_document("DOC-1"), "")
+
+    def test_sample_retention(self):
+        """Sample sessions expire before regular documents"""
+        with mock.patch("tools.vector_indexer.time.time", return_value=time.time() + 2 * 86400):
+            deleted = self.indexer.apply_retention(session_max_age_hours=24)
+        self.assertEqual(deleted, ["SAMPLE-1"])
+        self.assertEqual(set(self.indexer.list_documents()), {"DOC-1"})
+
+    def test_compact_keeps_chunks(self):
+        """Compaction preserves remaining chunks and queries"""
+        self.indexer.delete_documents(["SAMPLE-1"])
+        self.assertEqual(self.indexer.compact(), 1)
+        self.assertEqual(self.indexer.stats()["documents"], 1)
+        self.assertEqual(self.indexer.query_document("DOC-1", "freight", 1), ["Invoice from Acme for freight"])
+
+    def test_interrupted_compaction_is_recovered(self):
+        """A live collection left renamed aside by a crash is restored on start-up"""
+        self.indexer.collection.modify(name=f"{self.indexer.collection_name}__old")
+        restored = make_indexer(self.tmp_dir)
+        self.assertEqual(set(restored.list_documents()), {"DOC-1", "SAMPLE-1"})
+
+    def test_tenant_collections_are_isolated(self):
+        """Each tenant gets its own collection"""
+        self.assertFalse(self.indexer.tenant_exists("acme"))
+        other = make_indexer(self.tmp_dir, tenant_id="acme")
+        self.assertEqual(other.collection_name, "invoice_documents_acme")
+        self.assertEqual(other.list_documents(), {})
+        self.assertTrue(self.indexer.tenant_exists("acme"))
+
+    def test_tenant_ids_are_not_rewritten(self):
+        """Ids that would need sanitizing are rejected instead of sharing a collection"""
+        self.assertEqual(VectorIndexer.collection_name_for("a_b"), "invoice_documents_a_b")
+        for tenant in ("a/b", "a b", "../x", "x" * 65):
+            with self.assertRaises(ValueError):
+                VectorIndexer.collection_name_for(tenant)
+
+if __name__ == '__main__':
+    unittest.main()
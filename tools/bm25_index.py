@@ -0,0 +1,187 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Optional, Tuple
+
+# Identifier-like tokens ("PO-12345", "27AAPFU0939F1ZV", "12/2024") are kept
+# whole; their alphanumeric parts are indexed as well for partial matches.
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+_PART_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokenize text for lexical matching
+
+    Args:
+        text: Text to tokenize
+
+    Returns:
+        List of lowercase tokens (compound tokens followed by their parts)
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group(0)
+        tokens.append(token)
+        parts = _PART_PATTERN.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+    return tokens
+
+
+class BM25Index:
+    """Local inverted index for lexical (BM25) retrieval over document chunks"""
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_document ON chunks(document_id);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, chunk_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(chunk_id);
+        """)
+        self.conn.commit()
+
+    def add_chunks(
+        self,
+        document_id: str,
+        chunk_ids: List[str],
+        chunks: List[str],
+        replace: bool = True
+    ):
+        """
+        Index chunks of a document
+
+        Args:
+            document_id: Document the chunks belong to
+            chunk_ids: Chunk IDs (same IDs as in the vector collection)
+            chunks: Chunk texts
+            replace: Drop previous entries for the document first
+        """
+        with self._lock:
+            if replace:
+                self._delete_document(document_id)
+            for chunk_id, chunk in zip(chunk_ids, chunks):
+                tokens = tokenize(chunk)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO chunks (chunk_id, document_id, length) VALUES (?, ?, ?)",
+                    (chunk_id, document_id, len(tokens))
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)",
+                    [(term, chunk_id, tf) for term, tf in Counter(tokens).items()]
+                )
+            self.conn.commit()
+
+    def remove_document(self, document_id: str):
+        """Remove all chunks of a document from the index"""
+        with self._lock:
+            self._delete_document(document_id)
+            self.conn.commit()
+
+    def vacuum(self):
+        """Reclaim space left by deleted documents"""
+        with self._lock:
+            self.conn.execute("VACUUM")
+
+    def query(
+        self,
+        query: str,
+        n_results: int = 5,
+        document_id: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Rank chunks against a query with BM25
+
+        Args:
+            query: Search query
+            n_results: Number of results to return
+            document_id: Restrict results to this document (optional)
+
+        Returns:
+            List of (chunk_id, score) tuples, best first
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            total_chunks, avg_length = self.conn.execute(
+                "SELECT COUNT(*), AVG(length) FROM chunks"
+            ).fetchone()
+            if not total_chunks:
+                return []
+            avg_length = avg_length or 1.0
+
+            scores = Counter()
+            for term in terms:
+                sql = (
+                    "SELECT p.chunk_id, p.tf, c.length FROM postings p "
+                    "JOIN chunks c ON c.chunk_id = p.chunk_id WHERE p.term = ?"
+                )
+                params = [term]
+                if document_id is not None:
+                    sql += " AND c.document_id = ?"
+                    params.append(document_id)
+                rows = self.conn.execute(sql, params).fetchall()
+                if not rows:
+                    continue
+
+                if document_id is None:
+                    doc_freq = len(rows)
+                else:
+                    doc_freq = self.conn.execute(
+                        "SELECT COUNT(*) FROM postings WHERE term = ?", (term,)
+                    ).fetchone()[0]
+                idf = math.log(1 + (total_chunks - doc_freq + 0.5) / (doc_freq + 0.5))
+
+                for chunk_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        return scores.most_common(n_results)
+
+    def _delete_document(self, document_id: str):
+        """Delete a document's rows (caller holds the lock)"""
+        self.conn.execute(
+            "DELETE FROM postings WHERE chunk_id IN (SELECT chunk_id FROM chunks WHERE document_id = ?)",
+            (document_id,)
+        )
+        self.conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """
+    Fuse several ranked ID lists with reciprocal-rank fusion
+
+    Args:
+        rankings: Ranked lists of IDs (best first)
+        k: RRF damping constant
+
+    Returns:
+        Fused list of IDs, best first
+    """
+    scores = Counter()
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking):
+            scores[item_id] += 1.0 / (k + rank + 1)
+    return [item_id for item_id, _ in scores.most_common()]
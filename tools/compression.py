@@ -0,0 +1,94 @@
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Already-compressed or binary payloads are sent as-is
+INCOMPRESSIBLE_TYPES = (
+    "application/pdf", "application/zip", "application/gzip",
+    "application/vnd.apache.parquet", "application/vnd.apache.arrow.stream",
+    "image/", "audio/", "video/",
+)
+
+
+class BrotliMiddleware:
+    """
+    ASGI middleware that brotli-compresses responses for clients sending
+    "Accept-Encoding: br"
+
+    Streaming responses are flushed chunk by chunk so NDJSON events are not
+    held back. Partial (206) responses, responses that already carry a
+    Content-Encoding, binary content types and bodies below minimum_size
+    are passed through. For requests it handles, "br" is the only encoding
+    left in Accept-Encoding, so an inner gzip middleware stays idle.
+    """
+
+    def __init__(self, app, minimum_size: int = 1000, quality: int = 5):
+        if brotli is None:
+            raise ImportError("BrotliMiddleware requires the brotli package")
+        self.app = app
+        self.minimum_size = minimum_size
+        self.quality = quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._accepts_brotli(scope):
+            await self.app(scope, receive, send)
+            return
+
+        scope = dict(scope, headers=[
+            (k, b"br") if k == b"accept-encoding" else (k, v) for k, v in scope["headers"]
+        ])
+        state = {"start": None, "passthrough": False, "compressor": None}
+
+        async def send_compressed(message):
+            if message["type"] == "http.response.start":
+                state["start"] = message
+                headers = {k.lower(): v for k, v in message.get("headers", [])}
+                content_type = headers.get(b"content-type", b"").decode("latin-1").lower()
+                state["passthrough"] = (
+                    message["status"] == 206
+                    or b"content-encoding" in headers
+                    or content_type.startswith(INCOMPRESSIBLE_TYPES)
+                )
+                if state["passthrough"]:
+                    await send(message)
+                return
+
+            if state["passthrough"]:
+                await send(message)
+                return
+            if message["type"] != "http.response.body":
+                # e.g. pathsend: the body never passes through this middleware
+                if state["compressor"] is None:
+                    await send(state["start"])
+                    state["passthrough"] = True
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if state["compressor"] is None:
+                if not more_body and len(body) < self.minimum_size:
+                    await send(state["start"])
+                    await send(message)
+                    state["passthrough"] = True
+                    return
+                state["compressor"] = brotli.Compressor(quality=self.quality)
+                start = state["start"]
+                start["headers"] = [
+                    (k, v) for k, v in start.get("headers", []) if k.lower() != b"content-length"
+                ] + [(b"content-encoding", b"br"), (b"vary", b"Accept-Encoding")]
+                await send(start)
+
+            compressor = state["compressor"]
+            data = compressor.process(body) + (compressor.flush() if more_body else compressor.finish())
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
+
+    def _accepts_brotli(self, scope) -> bool:
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                return "br" in [token.split(";")[0].strip() for token in value.decode("latin-1").split(",")]
+        return False
+
@@ -0,0 +1,45 @@
+import re
+from datetime import date, datetime
+from typing import List, Optional
+
+# Date layouts seen on invoices, in order of preference (day-first before
+# month-first where both could match)
+DATE_FORMATS = (
+    "%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%d.%m.%Y", "%m/%d/%Y", "%Y/%m/%d",
+    "%d %b %Y", "%d %B %Y", "%b %d, %Y", "%B %d, %Y", "%d-%b-%Y", "%d-%b-%y",
+    "%m-%d-%Y", "%d/%m/%y", "%m/%d/%y", "%d-%m-%y", "%b %d %Y", "%B %d %Y",
+    "%d %b, %Y", "%d %B, %Y", "%Y%m%d",
+)
+
+
+def parse_dates(value: Optional[str]) -> List[date]:
+    """
+    Every date an invoice date string can mean under DATE_FORMATS
+
+    Ordinal suffixes ("5th") and repeated whitespace are normalised first.
+
+    Args:
+        value: Date string as extracted
+
+    Returns:
+        Dates in format preference order (several for ambiguous day/month strings)
+    """
+    if not value:
+        return []
+    value = re.sub(r"(\d)(st|nd|rd|th)\b", r"\1", value.strip())
+    value = re.sub(r"\s+", " ", value)
+    candidates = []
+    for fmt in DATE_FORMATS:
+        try:
+            parsed = datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+        if parsed not in candidates:
+            candidates.append(parsed)
+    return candidates
+
+
+def parse_date(value: Optional[str]) -> Optional[date]:
+    """The preferred reading of an invoice date string, or None if it cannot be parsed"""
+    candidates = parse_dates(value)
+    return candidates[0] if candidates else None
@@ -0,0 +1,188 @@
+import json
+import mmap
+import os
+import threading
+import uuid
+import zlib
+from typing import Optional
+from config import Config
+
+class DocumentStore:
+    """
+    Canonical document text store
+
+    Each document is kept as a blob of independently zlib-compressed blocks of
+    BLOCK_CHARS characters plus a small offset index, so the full text or any
+    character range is served by decompressing only the blocks it touches.
+
+    Every put writes a new blob under a fresh name and then atomically
+    replaces the index that names it, so a reader always pairs an index
+    with its own blob. Cached indexes are checked against the index file
+    (inode, mtime, size) on each read, so a document re-put by another
+    worker process is picked up.
+    """
+
+    BLOCK_CHARS = 16384
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or Config.DOCUMENT_STORE_DIR
+        os.makedirs(self.root, exist_ok=True)
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def put(self, document_id: str, text: str):
+        """
+        Store document text, replacing any previous version
+
+        Args:
+            document_id: Document identifier
+            text: Full document text
+        """
+        previous = self._load_index(document_id)
+        blob = f"{document_id}.{uuid.uuid4().hex[:12]}.blob"
+        offsets = [0]
+        blob_tmp = os.path.join(self.root, blob + ".tmp")
+        with open(blob_tmp, "wb") as f:
+            for start in range(0, len(text), self.BLOCK_CHARS):
+                block = zlib.compress(text[start:start + self.BLOCK_CHARS].encode("utf-8"))
+                f.write(block)
+                offsets.append(offsets[-1] + len(block))
+        os.replace(blob_tmp, os.path.join(self.root, blob))
+
+        # Replacing the index switches readers to the new blob in one step
+        index = {"length": len(text), "block_chars": self.BLOCK_CHARS, "offsets": offsets, "blob": blob}
+        index_tmp = self._index_path(document_id) + ".tmp"
+        with open(index_tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(index_tmp, self._index_path(document_id))
+        with self._lock:
+            self._indexes.pop(document_id, None)
+        if previous is not None:
+            self._remove_blob(document_id, previous)
+
+    def get(self, document_id: str) -> Optional[str]:
+        """
+        Return the exact stored text of a document
+
+        Args:
+            document_id: Document identifier
+
+        Returns:
+            Document text, or None if the document is not stored
+        """
+        index = self._load_index(document_id)
+        if index is None:
+            return None
+        return self.get_range(document_id, 0, index["length"])
+
+    def get_range(self, document_id: str, start: int, end: int) -> Optional[str]:
+        """
+        Return a character range of a document
+
+        Args:
+            document_id: Document identifier
+            start: First character offset (inclusive)
+            end: Last character offset (exclusive)
+
+        Returns:
+            Text in [start, end), or None if the document is not stored
+        """
+        index = self._load_index(document_id)
+        if index is None:
+            return None
+        try:
+            return self._read_range(document_id, index, start, end)
+        except FileNotFoundError:
+            # Re-put by another process since the index was read; read the new version
+            index = self._load_index(document_id)
+            return self._read_range(document_id, index, start, end) if index else None
+
+    def _read_range(self, document_id: str, index: dict, start: int, end: int) -> str:
+        start = max(0, start)
+        end = min(end, index["length"])
+        if start >= end:
+            return ""
+
+        block_chars = index["block_chars"]
+        offsets = index["offsets"]
+        first_block = start // block_chars
+        last_block = (end - 1) // block_chars
+
+        path = self._blob_path(document_id, index)
+        with open(path, "rb") as f:
+            if offsets[-1] >= Config.DOCUMENT_STORE_MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as blob:
+                    parts = [
+                        zlib.decompress(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+                        for i in range(first_block, last_block + 1)
+                    ]
+            else:
+                f.seek(offsets[first_block])
+                data = f.read(offsets[last_block + 1] - offsets[first_block])
+                base = offsets[first_block]
+                parts = [
+                    zlib.decompress(data[offsets[i] - base:offsets[i + 1] - base]).decode("utf-8")
+                    for i in range(first_block, last_block + 1)
+                ]
+
+        text = "".join(parts)
+        block_start = first_block * block_chars
+        return text[start - block_start:end - block_start]
+
+    def length(self, document_id: str) -> Optional[int]:
+        """Return the character length of a stored document"""
+        index = self._load_index(document_id)
+        return index["length"] if index else None
+
+    def exists(self, document_id: str) -> bool:
+        """Check whether a document is stored"""
+        return self._load_index(document_id) is not None
+
+    def delete(self, document_id: str):
+        """Remove a document from the store"""
+        index = self._load_index(document_id)
+        with self._lock:
+            self._indexes.pop(document_id, None)
+        try:
+            os.remove(self._index_path(document_id))
+        except FileNotFoundError:
+            pass
+        if index is not None:
+            self._remove_blob(document_id, index)
+
+    def _load_index(self, document_id: str) -> Optional[dict]:
+        """Load the offset index of a document (cached while the index file is unchanged)"""
+        path = self._index_path(document_id)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._indexes.pop(document_id, None)
+            return None
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._indexes.get(document_id)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self._indexes[document_id] = (version, index)
+        return index
+
+    def _remove_blob(self, document_id: str, index: dict):
+        try:
+            os.remove(self._blob_path(document_id, index))
+        except FileNotFoundError:
+            pass
+
+    def _blob_path(self, document_id: str, index: dict) -> str:
+        # Stores written before blobs were versioned name the blob after the document
+        return os.path.join(self.root, index.get("blob") or f"{document_id}.blob")
+
+    def _index_path(self, document_id: str) -> str:
+        return os.path.join(self.root, f"{document_id}.idx.json")
@@ -0,0 +1,248 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import Optional, Tuple
+
+_WORD_PATTERN = re.compile(r"\w+")
+_AMOUNT_PATTERN = re.compile(r"\d[\d,]*(?:\.\d+)?")
+_BANDS = 4  # 64-bit fingerprint split in 16-bit bands
+_BAND_BITS = 64 // _BANDS
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def simhash(text: str, shingle: int = 3, min_words: int = 20) -> Optional[int]:
+    """
+    64-bit SimHash of a text over word shingles
+
+    Args:
+        text: Text to fingerprint
+        shingle: Words per shingle
+        min_words: Texts with fewer words get no fingerprint (blank or
+            near-empty pages would otherwise all look alike)
+
+    Returns:
+        Fingerprint, or None for short texts
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < min_words:
+        return None
+
+    digests = [
+        hashlib.blake2b(" ".join(words[i:i + shingle]).encode("utf-8"), digest_size=8).digest()
+        for i in range(len(words) - shingle + 1)
+    ]
+
+    # Count set bits per position via byte histograms instead of 64 steps per shingle
+    ones = [0] * 64
+    for position in range(8):
+        shift = (7 - position) * 8
+        for byte, count in Counter(digest[position] for digest in digests).items():
+            for bit in range(8):
+                if byte >> bit & 1:
+                    ones[shift + bit] += count
+    return sum(1 << bit for bit in range(64) if ones[bit] * 2 > len(digests))
+
+
+def invoice_key(vendor_id: Optional[str], invoice_number: Optional[str], total_amount) -> Optional[str]:
+    """Business key of an invoice, or None if the number or total is missing"""
+    if not invoice_number or total_amount is None:
+        return None
+    number = re.sub(r"[\s#:]", "", str(invoice_number)).upper()
+    return f"{vendor_id or ''}|{number}|{float(total_amount):.2f}"
+
+
+def text_mentions_invoice(text: str, invoice_number: Optional[str], total_amount) -> bool:
+    """
+    Whether text carries an invoice's number and total
+
+    Confirms a SimHash match: invoices generated from one template differ
+    in only a few words, so similar text alone does not make a duplicate.
+
+    Args:
+        text: Extracted text of the new document
+        invoice_number: Invoice number of the earlier result
+        total_amount: Total of the earlier result
+
+    Returns:
+        True only if both are known and both appear in the text
+    """
+    if not invoice_number or total_amount is None:
+        return False
+    number = re.sub(r"[\s#:]", "", str(invoice_number)).upper()
+    spaced = r"[\s#:]*".join(map(re.escape, number))  # "INV # 001" in the text matches "INV001"
+    if not number or not re.search(rf"(?<![A-Z0-9]){spaced}(?![A-Z0-9])", text.upper()):
+        return False
+    amounts = (float(match.replace(",", "")) for match in _AMOUNT_PATTERN.findall(text))
+    return any(abs(amount - float(total_amount)) < 0.005 for amount in amounts)
+
+
+def _signed(value: int) -> int:
+    """Map an unsigned 64-bit value into SQLite's signed INTEGER range"""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class DuplicateIndex:
+    """
+    Ingest-time duplicate detection
+
+    Three indexes, consulted at successive pipeline stages:
+      - exact file hash (before extraction)
+      - SimHash of the extracted text, banded so that fingerprints within
+        max_distance bits are found with indexed lookups (before indexing
+        and parsing)
+      - (vendor_id, invoice_number, total_amount) key (after parsing)
+    Each points at the document whose stored result is returned instead of
+    processing the copy again. A SimHash hit is only a candidate: it is
+    confirmed with text_mentions_invoice before the result is reused.
+    """
+
+    def __init__(self, path: str, max_distance: int = 3):
+        if max_distance >= _BANDS:
+            raise ValueError(f"max_distance must be below {_BANDS} for banded SimHash lookups")
+        self.path = path
+        self.max_distance = max_distance
+        self._lock = threading.Lock()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS results (
+                document_id TEXT PRIMARY KEY,
+                result TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                sha256 TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS invoice_keys (
+                key TEXT PRIMARY KEY,
+                document_id TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS simhashes (
+                document_id TEXT PRIMARY KEY,
+                hash INTEGER NOT NULL,
+                {", ".join(f"b{i} INTEGER NOT NULL" for i in range(_BANDS))}
+            );
+            {" ".join(f"CREATE INDEX IF NOT EXISTS idx_simhash_b{i} ON simhashes(b{i});" for i in range(_BANDS))}
+        """)
+        self.conn.commit()
+
+    def find_file(self, sha256: str) -> Optional[str]:
+        """Document previously ingested from identical bytes"""
+        return self._lookup("SELECT document_id FROM file_hashes WHERE sha256 = ?", (sha256,))
+
+    def find_key(self, key: Optional[str]) -> Optional[str]:
+        """Document previously parsed with the same business key"""
+        if key is None:
+            return None
+        return self._lookup("SELECT document_id FROM invoice_keys WHERE key = ?", (key,))
+
+    def find_near(self, fingerprint: Optional[int]) -> Optional[Tuple[str, int]]:
+        """
+        Closest document whose text fingerprint is within max_distance bits
+
+        Returns:
+            Tuple of (document_id, distance), or None
+        """
+        if fingerprint is None:
+            return None
+        bands = self._bands(fingerprint)
+        where = " OR ".join(f"b{i} = ?" for i in range(_BANDS))
+        with self._lock:
+            rows = self.conn.execute(f"SELECT document_id, hash FROM simhashes WHERE {where}", bands).fetchall()
+
+        best = None
+        for document_id, value in rows:
+            distance = bin((value % (1 << 64)) ^ fingerprint).count("1")
+            if distance <= self.max_distance and (best is None or distance < best[1]):
+                best = (document_id, distance)
+        return best
+
+    def result(self, document_id: str) -> Optional[dict]:
+        """Stored result of a document"""
+        row = self._lookup("SELECT result FROM results WHERE document_id = ?", (document_id,))
+        return json.loads(row) if row else None
+
+    def add(
+        self,
+        document_id: str,
+        result: dict,
+        sha256: Optional[str] = None,
+        fingerprint: Optional[int] = None,
+        key: Optional[str] = None
+    ):
+        """
+        Register a processed document
+
+        Args:
+            document_id: Document ID
+            result: Processing result returned for later duplicates
+                (extracted_text is not stored; it lives in the document store)
+            sha256: Hash of the source file bytes
+            fingerprint: SimHash of the extracted text
+            key: Business key (see invoice_key)
+        """
+        stored = {k: v for k, v in result.items() if k != "extracted_text"}
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (document_id, result) VALUES (?, ?)",
+                (document_id, json.dumps(stored))
+            )
+            if sha256:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO file_hashes (sha256, document_id) VALUES (?, ?)", (sha256, document_id)
+                )
+            if key:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO invoice_keys (key, document_id) VALUES (?, ?)", (key, document_id)
+                )
+            if fingerprint is not None:
+                self.conn.execute(
+                    f"INSERT OR REPLACE INTO simhashes VALUES (?, ?, {', '.join('?' * _BANDS)})",
+                    (document_id, _signed(fingerprint), *self._bands(fingerprint))
+                )
+            self.conn.commit()
+
+    def add_file_hash(self, sha256: Optional[str], document_id: str):
+        """Point further copies of a file at an existing document"""
+        if not sha256:
+            return
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (sha256, document_id) VALUES (?, ?)", (sha256, document_id)
+            )
+            self.conn.commit()
+
+    def remove(self, document_ids: list) -> int:
+        """Forget documents (e.g. after they were deleted from the index)"""
+        with self._lock:
+            for table in ("results", "file_hashes", "invoice_keys", "simhashes"):
+                self.conn.executemany(f"DELETE FROM {table} WHERE document_id = ?", [(d,) for d in document_ids])
+            self.conn.commit()
+        return len(document_ids)
+
+    def close(self):
+        self.conn.close()
+
+    def _lookup(self, sql: str, params: tuple):
+        with self._lock:
+            row = self.conn.execute(sql, params).fetchone()
+        return row[0] if row else None
+
+    @staticmethod
+    def _bands(fingerprint: int) -> list:
+        mask = (1 << _BAND_BITS) - 1
+        return [fingerprint >> (i * _BAND_BITS) & mask for i in range(_BANDS)]
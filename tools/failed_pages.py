@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+import time
+from typing import List, Optional
+from config import Config
+
+
+class FailedPageStore:
+    """
+    Persistent list of page groups whose processing failed
+
+    Each entry records where to find the pages again (file_path and 1-based
+    page_numbers) and when to retry: attempts back off exponentially from
+    RETRY_BACKOFF_S, and an entry is dropped after RETRY_MAX_ATTEMPTS. The
+    store is a small JSON file written atomically on every change.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or Config.FAILED_PAGES_PATH
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def add(
+        self,
+        document_id: str,
+        file_path: str,
+        page_numbers: List[int],
+        error: str,
+        session: Optional[str] = None,
+        page_type: Optional[str] = None
+    ):
+        """Record a failed page group (replacing an earlier entry for the same document)"""
+        with self._lock:
+            attempts = self._entries.get(document_id, {}).get("attempts", 0) + 1
+            self._entries[document_id] = {
+                "document_id": document_id,
+                "file_path": file_path,
+                "page_numbers": page_numbers,
+                "session": session,
+                "page_type": page_type,
+                "error": error,
+                "attempts": attempts,
+                "next_retry_at": time.time() + Config.RETRY_BACKOFF_S * 2 ** (attempts - 1),
+            }
+            if attempts > Config.RETRY_MAX_ATTEMPTS:
+                print(f"[RETRY] Giving up on {document_id} after {attempts - 1} retries: {error}")
+                del self._entries[document_id]
+            self._save()
+
+    def resolve(self, document_id: str):
+        """Forget a page group that has been processed"""
+        with self._lock:
+            if self._entries.pop(document_id, None) is not None:
+                self._save()
+
+    def due(self, now: Optional[float] = None) -> List[dict]:
+        """Entries whose next retry time has passed, oldest first"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entries = [dict(entry) for entry in self._entries.values() if entry["next_retry_at"] <= now]
+        return sorted(entries, key=lambda entry: entry["next_retry_at"])
+
+    def list(self) -> List[dict]:
+        """All pending entries"""
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values()]
+
+    def _load(self) -> dict:
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    return {entry["document_id"]: entry for entry in json.load(f)}
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                print(f"[WARNING] Error loading failed pages: {e}")
+        return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self._entries.values()), f)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,158 @@
+import hashlib
+import io
+import json
+import random
+import re
+import threading
+import time
+from typing import Callable, Optional
+from chromadb.api.types import EmbeddingFunction
+
+class FakeResponse:
+    """Minimal stand-in for a generate_content response (or stream chunk)"""
+
+    def __init__(self, text: str):
+        self.text = text
+
+    def __iter__(self):
+        yield self
+
+
+class FakeModelError(RuntimeError):
+    """Injected failure, shaped like a transient API error"""
+
+
+class FakeGenerativeModel:
+    """
+    Deterministic local stand-in for genai.GenerativeModel
+
+    Used for tests, benchmarks and offline runs (MODEL_BACKEND=fake). By
+    default it answers schema-constrained requests by filling the schema
+    from "Label: value" lines in the text parts, and text-extraction
+    requests by reading the PDF text layer. A custom responder can be
+    supplied instead. latency_ms (plus up to jitter_ms) is slept per call
+    and error_rate of calls raise FakeModelError; both are drawn from a
+    seeded generator so runs are repeatable.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "fake",
+        responder: Optional[Callable[[list, dict], str]] = None,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0
+    ):
+        self.model_name = model_name
+        self.responder = responder or default_responder
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.calls = []
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        """Answer a request; streamed responses are split into small chunks"""
+        contents = contents if isinstance(contents, list) else [contents]
+        config = dict(generation_config or {})
+        with self._lock:
+            self.calls.append({"contents": contents, "generation_config": config})
+            delay = self.latency_ms + self.jitter_ms * self._random.random()
+            fail = self._random.random() < self.error_rate
+            self.failures += fail
+
+        if delay:
+            time.sleep(delay / 1000)
+        if fail:
+            raise FakeModelError("503 Service Unavailable (injected by FakeGenerativeModel)")
+
+        text = self.responder(contents, config)
+        if not stream:
+            return FakeResponse(text)
+        return iter([FakeResponse(text[i:i + 64]) for i in range(0, len(text), 64)] or [FakeResponse("")])
+
+
+def default_responder(contents: list, generation_config: dict) -> str:
+    """Heuristic responder used when no custom responder is supplied"""
+    text_parts = [part for part in contents if isinstance(part, str)]
+    schema = generation_config.get("response_schema")
+    if schema is not None:
+        return json.dumps(_fill_schema(schema, "\n".join(text_parts[1:] or text_parts)))
+
+    for part in contents:
+        if isinstance(part, dict) and part.get("mime_type") == "application/pdf":
+            return _pdf_text(part["data"])
+
+    if generation_config.get("response_mime_type") == "application/json":
+        return "{}"
+    return ""
+
+
+def _fill_schema(schema: dict, text: str, name: Optional[str] = None):
+    """Build a schema-conforming value, filling scalars from labelled lines"""
+    schema_type = schema.get("type", "string").lower()
+    if schema_type == "object":
+        return {key: _fill_schema(prop, text, key) for key, prop in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        return []
+
+    value = _labelled_value(text, name) if name else None
+    if value is None:
+        return None
+    if schema_type in ("number", "integer"):
+        number = re.search(r"-?\d[\d,]*\.?\d*", value)
+        if not number:
+            return None
+        parsed = float(number.group(0).replace(",", ""))
+        return int(parsed) if schema_type == "integer" else parsed
+    return value
+
+
+def _labelled_value(text: str, name: str) -> Optional[str]:
+    """Find "Field Name: value" (or "Field Name # value") for a snake_case field"""
+    label = r"[\s_-]*".join(re.escape(word) for word in name.split("_"))
+    match = re.search(rf"(?im)^\s*{label}\s*[:#]\s*(.+?)\s*$", text)
+    return match.group(1) if match else None
+
+
+def _pdf_text(data: bytes) -> str:
+    """Read the text layer of a PDF"""
+    from PyPDF2 import PdfReader
+
+    try:
+        reader = PdfReader(io.BytesIO(data))
+        return "\n".join(page.extract_text() or "" for page in reader.pages)
+    except Exception:
+        return ""
+
+
+class FakeEmbeddingFunction(EmbeddingFunction):
+    """Deterministic offline embedding (bag of hashed words)"""
+
+    DIMENSIONS = 64
+
+    def __init__(self):
+        pass
+
+    def __call__(self, input):
+        vectors = []
+        for text in input:
+            vector = [0.0] * self.DIMENSIONS
+            for word in text.lower().split():
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.DIMENSIONS] += 1.0
+            vectors.append(vector)
+        return vectors
+
+    @staticmethod
+    def name():
+        return "fake-hash"
+
+    def get_config(self):
+        return {}
+
+    @staticmethod
+    def build_from_config(config):
+        return FakeEmbeddingFunction()
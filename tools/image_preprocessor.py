@@ -0,0 +1,228 @@
+import io
+import time
+from typing import List, Optional, Tuple
+from config import Config
+from models import ImagePreprocessing
+
+try:
+    from PIL import Image, ImageFilter, ImageOps
+except ImportError:  # Pillow is optional; images are then sent as uploaded
+    Image = None
+
+_FORMATS = {"jpeg": ("JPEG", "image/jpeg"), "webp": ("WEBP", "image/webp"), "png": ("PNG", "image/png")}
+_ANALYSIS_SIZE = 800  # long side of the thumbnail used for cropping and skew detection
+_PAGE_LONG_SIDE_INCHES = 11.7  # A4; used when an image carries no DPI
+_MAX_SKEW = 5.0
+
+
+def _otsu_threshold(histogram: List[int]) -> int:
+    """Gray level that best separates a 256-bin histogram into two classes"""
+    total = sum(histogram)
+    sum_all = sum(level * count for level, count in enumerate(histogram))
+    weight_b, sum_b, best, threshold = 0, 0, -1.0, 127
+    for level, count in enumerate(histogram):
+        weight_b += count
+        weight_f = total - weight_b
+        if weight_b == 0:
+            continue
+        if weight_f == 0:
+            break
+        sum_b += level * count
+        mean_b, mean_f = sum_b / weight_b, (sum_all - sum_b) / weight_f
+        between = weight_b * weight_f * (mean_b - mean_f) ** 2
+        if between > best:
+            best, threshold = between, level
+    return threshold
+
+
+def _profile(mask, horizontal: bool) -> List[int]:
+    """Mean of a mask per row (horizontal=True) or per column"""
+    size = (1, mask.height) if horizontal else (mask.width, 1)
+    return list(mask.resize(size, Image.BOX).tobytes())
+
+
+class ImagePreprocessor:
+    """
+    CPU-side cleanup of invoice photos and scans before the model sees them
+
+    Steps, all with Pillow:
+      - apply the EXIF orientation of phone photos
+      - crop to the paper (rows/columns that are almost all background)
+      - convert to grayscale
+      - downscale to IMAGE_TARGET_DPI and at most IMAGE_MAX_PIXELS
+      - deskew (projection-profile search within +/-5 degrees)
+      - crop to the printed content plus a small margin
+      - re-encode as IMAGE_FORMAT
+    If the result is not smaller than the upload, or Pillow cannot read it,
+    the original bytes are sent.
+    """
+
+    PAPER_MIN_FRACTION = 0.1  # rows/columns with less paper than this are background
+    LEVEL_PAPER_MIN_FRACTION = 0.5  # once deskewed, paper edges span most of a row/column
+    MARGIN = 0.02  # kept around the content, as a fraction of the image size
+
+    def __init__(
+        self,
+        target_dpi: Optional[int] = None,
+        max_pixels: Optional[int] = None,
+        grayscale: Optional[bool] = None,
+        output_format: Optional[str] = None,
+        quality: Optional[int] = None
+    ):
+        self.target_dpi = target_dpi or Config.IMAGE_TARGET_DPI
+        self.max_pixels = max_pixels or Config.IMAGE_MAX_PIXELS
+        self.grayscale = Config.IMAGE_GRAYSCALE if grayscale is None else grayscale
+        self.output_format = (output_format or Config.IMAGE_FORMAT).lower()
+        self.quality = quality or Config.IMAGE_QUALITY
+        if self.output_format not in _FORMATS:
+            raise ValueError(f"Unsupported image format: {self.output_format} (choose from {', '.join(_FORMATS)})")
+
+    def preprocess(self, data: bytes, mime_type: str) -> Tuple[bytes, ImagePreprocessing]:
+        """
+        Shrink an uploaded invoice image
+
+        Args:
+            data: Uploaded image bytes
+            mime_type: MIME type of the upload
+
+        Returns:
+            Tuple of (bytes to send, ImagePreprocessing report whose
+            mime_type is the type of those bytes)
+        """
+        start = time.perf_counter()
+        report = ImagePreprocessing(
+            mime_type=mime_type, bytes_in=len(data), bytes_out=len(data), size_in=[0, 0], size_out=[0, 0]
+        )
+        if Image is None:
+            print("[WARNING] Pillow is not installed; sending the image unchanged")
+            return data, report
+
+        try:
+            image = Image.open(io.BytesIO(data))
+            dpi = image.info.get("dpi")
+            report.size_in = report.size_out = list(image.size)
+            image = ImageOps.exif_transpose(image)
+            image = image.convert("RGBA").convert("RGB") if image.mode in ("P", "LA", "RGBA") else image
+            gray = image.convert("L")
+
+            box = self._paper_box(gray, self.PAPER_MIN_FRACTION)
+            image = image.crop(box).convert("L") if self.grayscale else image.convert("RGB").crop(box)
+            gray = image if self.grayscale else image.convert("L")
+            angle = self._skew_angle(gray)
+            image = self._downscale(image, dpi)
+            gray = image if self.grayscale else image.convert("L")
+            if angle:
+                # Fill with background so the now level paper edges can be cropped again
+                image = image.rotate(angle, Image.BICUBIC, expand=True, fillcolor=0 if self.grayscale else "black")
+                gray = image if self.grayscale else image.convert("L")
+                box = self._paper_box(gray, self.LEVEL_PAPER_MIN_FRACTION)
+                image, gray = image.crop(box), gray.crop(box)
+            image = image.crop(self._content_box(gray))
+            report.cropped = image.size != tuple(report.size_in)
+            report.skew_degrees = angle
+
+            out = io.BytesIO()
+            pil_format, out_mime = _FORMATS[self.output_format]
+            options = {"optimize": True} if pil_format == "PNG" else {"quality": self.quality}
+            image.save(out, pil_format, **options)
+        except Exception as e:
+            print(f"[WARNING] Image preprocessing failed, sending the image unchanged: {e}")
+            report.preprocess_ms = round((time.perf_counter() - start) * 1000, 1)
+            return data, report
+
+        report.preprocess_ms = round((time.perf_counter() - start) * 1000, 1)
+        if out.tell() >= len(data):
+            print(f"[IMAGE] Preprocessed image is not smaller ({out.tell():,} bytes); sending the original")
+            return data, report
+        report.mime_type = out_mime
+        report.bytes_out = out.tell()
+        report.size_out = list(image.size)
+        print(f"[IMAGE] {report.bytes_in:,} -> {report.bytes_out:,} bytes "
+              f"({report.size_in[0]}x{report.size_in[1]} -> {image.width}x{image.height}, "
+              f"skew {angle:+.1f} deg) in {report.preprocess_ms:.0f} ms")
+        return out.getvalue(), report
+
+    def _thumbnail(self, gray) -> Tuple[object, float]:
+        """Analysis copy with its long side at most _ANALYSIS_SIZE, and its scale"""
+        scale = min(1.0, _ANALYSIS_SIZE / max(gray.size))
+        if scale == 1.0:
+            return gray, 1.0
+        size = (max(1, round(gray.width * scale)), max(1, round(gray.height * scale)))
+        return gray.resize(size, Image.BOX), scale
+
+    def _scale_box(self, box: tuple, scale: float, size: tuple) -> tuple:
+        """Map a thumbnail box back to full size, clamped to the image"""
+        left, top, right, bottom = (round(v / scale) for v in box)
+        return max(0, left), max(0, top), min(size[0], right), min(size[1], bottom)
+
+    def _paper_box(self, gray, min_fraction: float) -> tuple:
+        """
+        Bounding box of the paper in a photo (the whole image for flat scans)
+
+        Rows and columns are trimmed from the edges inwards while less than
+        min_fraction of their pixels are brighter than the Otsu threshold.
+        """
+        small, scale = self._thumbnail(gray)
+        threshold = _otsu_threshold(small.histogram())
+        paper = small.point(lambda v: 255 if v > threshold else 0)
+        minimum = 255 * min_fraction
+        rows = [i for i, v in enumerate(_profile(paper, True)) if v >= minimum]
+        cols = [i for i, v in enumerate(_profile(paper, False)) if v >= minimum]
+        if not rows or not cols:
+            return 0, 0, gray.width, gray.height
+        return self._scale_box((cols[0], rows[0], cols[-1] + 1, rows[-1] + 1), scale, gray.size)
+
+    def _ink(self, gray):
+        """Thumbnail mask of dark (printed) pixels, speckle removed, and its scale"""
+        small, scale = self._thumbnail(gray)
+        threshold = _otsu_threshold(small.histogram())
+        ink = small.point(lambda v: 255 if v <= threshold else 0)
+        return ink.filter(ImageFilter.MedianFilter(3)), scale
+
+    def _skew_angle(self, gray) -> float:
+        """
+        Rotation (degrees, counter-clockwise) that makes text lines horizontal
+
+        Text lines produce the sharpest row profile when level, so the
+        angle maximising the sum of squared differences between adjacent
+        row sums wins. A coarse 1 degree search on a half-size mask is
+        refined in 0.2 degree steps at full thumbnail size.
+        """
+        ink, _ = self._ink(gray)
+        box = ink.getbbox()
+        if box is None:
+            return 0.0
+        ink = ink.crop(box)
+        coarse = ink.reduce(2) if min(ink.size) >= 2 else ink
+
+        def sharpness(mask, angle: float) -> float:
+            rows = _profile(mask.rotate(angle, Image.NEAREST), True)
+            return sum((a - b) ** 2 for a, b in zip(rows, rows[1:]))
+
+        best = max((float(a) for a in range(-int(_MAX_SKEW), int(_MAX_SKEW) + 1)), key=lambda a: sharpness(coarse, a))
+        best = max((best + step / 5 for step in range(-4, 5)), key=lambda a: sharpness(ink, a))
+        return round(best, 1) if abs(best) >= 0.3 else 0.0
+
+    def _content_box(self, gray) -> tuple:
+        """Bounding box of the printed content plus MARGIN (slivers of background at the edges are ignored)"""
+        ink, scale = self._ink(gray)
+        inset = max(1, round(min(ink.size) * 0.01))
+        box = ink.crop((inset, inset, ink.width - inset, ink.height - inset)).getbbox()
+        if box is None:
+            return 0, 0, gray.width, gray.height
+        box = (box[0] + inset, box[1] + inset, box[2] + inset, box[3] + inset)
+        left, top, right, bottom = self._scale_box(box, scale, gray.size)
+        pad_x, pad_y = round(gray.width * self.MARGIN), round(gray.height * self.MARGIN)
+        return max(0, left - pad_x), max(0, top - pad_y), min(gray.width, right + pad_x), min(gray.height, bottom + pad_y)
+
+    def _downscale(self, image, dpi: Optional[tuple]):
+        """Resize to the target DPI (the paper taken as A4 without DPI) and the pixel budget"""
+        if dpi and dpi[0]:
+            scale = self.target_dpi / float(dpi[0])
+        else:
+            scale = _PAGE_LONG_SIDE_INCHES * self.target_dpi / max(image.size)
+        scale = min(1.0, scale, (self.max_pixels / (image.width * image.height)) ** 0.5)
+        if scale >= 0.99:
+            return image
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
@@ -0,0 +1,228 @@
+import os
+import time
+import uuid
+from typing import Iterable, Optional
+from tools.vector_indexer import date_key
+
+# Output formats and their file extensions (Arrow uses the IPC streaming format)
+FORMATS = {"parquet": ".parquet", "arrow": ".arrows"}
+TABLES = ("invoices", "line_items")
+
+
+def _pyarrow():
+    """Import pyarrow on first use so the rest of the app runs without it"""
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("Columnar export requires pyarrow (pip install pyarrow)") from e
+    return pyarrow
+
+
+def table_schemas() -> dict:
+    """Arrow schemas of the exported tables (low-cardinality strings are dictionary-encoded)"""
+    pa = _pyarrow()
+    category = pa.dictionary(pa.int32(), pa.string())
+    return {
+        "invoices": pa.schema([
+            ("document_id", pa.string()),
+            ("page_number", pa.int32()),
+            ("vendor_id", category),
+            ("vendor_name", pa.string()),
+            ("invoice_number", pa.string()),
+            ("invoice_date", pa.string()),
+            ("invoice_date_key", pa.int32()),
+            ("due_date", pa.string()),
+            ("customer_name", pa.string()),
+            ("po_number", pa.string()),
+            ("currency", category),
+            ("subtotal", pa.float64()),
+            ("tax_total", pa.float64()),
+            ("total_amount", pa.float64()),
+            ("payment_terms", pa.string()),
+            ("line_item_count", pa.int32()),
+        ]),
+        "line_items": pa.schema([
+            ("document_id", category),
+            ("line_number", pa.int32()),
+            ("description", pa.string()),
+            ("hsn_sac", category),
+            ("quantity", pa.float64()),
+            ("unit_price", pa.float64()),
+            ("amount", pa.float64()),
+            ("tax_rate", pa.float64()),
+            ("tax_amount", pa.float64()),
+        ]),
+    }
+
+
+class InvoiceExporter:
+    """
+    Streaming writer for normalized invoices and line_items tables
+
+    Rows are buffered column-wise and written as record batches of
+    batch_rows, so memory stays bounded however many invoices are added.
+    Each exporter writes one new part file per table under
+    <out_dir>/<table>/, which makes repeated exports into the same
+    directory an incremental append; read a table back with read_table().
+
+    Usage:
+        with InvoiceExporter(out_dir, "parquet") as exporter:
+            for result in page_results:
+                exporter.add(result)
+    """
+
+    BATCH_ROWS = 10000
+
+    def __init__(self, out_dir: str, format: str = "parquet", batch_rows: Optional[int] = None):
+        if format not in FORMATS:
+            raise ValueError(f"Unsupported export format '{format}' (expected one of {', '.join(FORMATS)})")
+        self.schemas = table_schemas()
+        self.out_dir = out_dir
+        self.format = format
+        self.batch_rows = batch_rows or self.BATCH_ROWS
+        self.part_name = f"part-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}{FORMATS[format]}"
+        self.paths: dict = {}
+        self.counts = {table: 0 for table in TABLES}
+        self._buffers = {table: self._empty_buffer(table) for table in TABLES}
+        self._writers: dict = {}
+        self._sinks: dict = {}
+
+    def __enter__(self) -> "InvoiceExporter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def add(self, result: dict) -> bool:
+        """
+        Add one processed page/invoice
+
+        Args:
+            result: A page result as returned by process_invoice (document_id,
+                invoice_data, vendor, optional page_number)
+
+        Returns:
+            False if the result has no invoice data (e.g. a failed page)
+        """
+        data = result.get("invoice_data")
+        if not data:
+            return False
+
+        metadata = data.get("metadata") or {}
+        vendor = result.get("vendor") or {}
+        line_items = data.get("line_items") or []
+        document_id = result.get("document_id")
+
+        self._append("invoices", {
+            "document_id": document_id,
+            "page_number": result.get("page_number"),
+            "vendor_id": vendor.get("vendor_id"),
+            "vendor_name": metadata.get("vendor_name"),
+            "invoice_number": metadata.get("invoice_number"),
+            "invoice_date": metadata.get("invoice_date"),
+            "invoice_date_key": date_key(metadata.get("invoice_date") or ""),
+            "due_date": metadata.get("due_date"),
+            "customer_name": metadata.get("customer_name"),
+            "po_number": metadata.get("po_number"),
+            "currency": (metadata.get("currency") or "").upper() or None,
+            "subtotal": metadata.get("subtotal"),
+            "tax_total": metadata.get("tax_total"),
+            "total_amount": metadata.get("total_amount"),
+            "payment_terms": metadata.get("payment_terms"),
+            "line_item_count": len(line_items),
+        })
+        for i, item in enumerate(line_items, 1):
+            self._append("line_items", {"document_id": document_id, "line_number": i, **item})
+        return True
+
+    def add_all(self, results: Iterable[dict]) -> int:
+        """Add several results, returning how many had invoice data"""
+        return sum(1 for result in results if self.add(result))
+
+    def flush(self):
+        """Write buffered rows of every table"""
+        for table in TABLES:
+            self._flush(table)
+
+    def close(self) -> dict:
+        """
+        Flush and finish all part files
+
+        Returns:
+            Dictionary of table name -> written file path (tables without
+            rows produce no file)
+        """
+        self.flush()
+        for table, writer in self._writers.items():
+            writer.close()
+            if table in self._sinks:
+                self._sinks[table].close()
+        self._writers, self._sinks = {}, {}
+        return self.paths
+
+    def _append(self, table: str, row: dict):
+        buffer = self._buffers[table]
+        for column in buffer:
+            buffer[column].append(row.get(column))
+        if len(buffer["document_id"]) >= self.batch_rows:
+            self._flush(table)
+
+    def _flush(self, table: str):
+        buffer = self._buffers[table]
+        rows = len(buffer["document_id"])
+        if not rows:
+            return
+
+        pa = _pyarrow()
+        batch = pa.RecordBatch.from_pydict(buffer, schema=self.schemas[table])
+        self._writer(table).write_batch(batch)
+        self.counts[table] += rows
+        self._buffers[table] = self._empty_buffer(table)
+
+    def _writer(self, table: str):
+        """Open the part file for a table on its first batch"""
+        if table not in self._writers:
+            directory = os.path.join(self.out_dir, table)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, self.part_name)
+            schema = self.schemas[table]
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self._writers[table] = pq.ParquetWriter(path, schema, compression="zstd")
+            else:
+                pa = _pyarrow()
+                self._sinks[table] = pa.OSFile(path, "wb")
+                options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                self._writers[table] = pa.ipc.new_stream(self._sinks[table], schema, options=options)
+            self.paths[table] = path
+        return self._writers[table]
+
+    def _empty_buffer(self, table: str) -> dict:
+        return {name: [] for name in self.schemas[table].names}
+
+
+def read_table(out_dir: str, table: str, format: str = "parquet"):
+    """
+    Read all part files of an exported table
+
+    Args:
+        out_dir: Export directory
+        table: "invoices" or "line_items"
+        format: "parquet" or "arrow"
+
+    Returns:
+        pyarrow.Table
+    """
+    pa = _pyarrow()
+    import pyarrow.dataset as ds
+
+    directory = os.path.join(out_dir, table)
+    if format == "parquet":
+        return ds.dataset(directory, format="parquet").to_table()
+
+    tables = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(FORMATS["arrow"]):
+            with pa.OSFile(os.path.join(directory, name), "rb") as source:
+                tables.append(pa.ipc.open_stream(source).read_all())
+    return pa.concat_tables(tables, promote_options="permissive") if tables else table_schemas()[table].empty_table()
@@ -1,40 +1,134 @@
+import copy
+import inspect
 import json
-import google.generativeai as genai
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from config import Config
 from models import InvoiceData, InvoiceMetadata, LineItem
-from typing import Optional
+from pydantic import ValidationError
+from tools.json_patch import PatchError, apply_patch
+from tools.json_scanner import JSONStreamScanner, StreamingObjectReader, extract_json
+from tools.model_provider import create_model
+from tools.structured_output import field_schema, patch_schema, response_schema
+from tools.text_preprocessor import compact_text, estimate_tokens
+from typing import Callable, Optional
+
+# Query phrases that make a metadata field relevant to a correction
+_FIELD_KEYWORDS = {
+    "invoice_number": ("invoice number", "invoice no", "invoice id"),
+    "invoice_date": ("invoice date", "issue date", "dated", "date"),
+    "due_date": ("due date", "due"),
+    "vendor_name": ("vendor", "supplier", "seller"),
+    "vendor_address": ("vendor address", "supplier address"),
+    "vendor_tax_id": ("tax id", "vat number", "gstin", "tax number"),
+    "customer_name": ("customer", "buyer", "client", "bill to"),
+    "customer_address": ("customer address", "billing address", "bill to", "ship to"),
+    "po_number": ("po", "purchase order"),
+    "currency": ("currency", "usd", "eur", "gbp", "inr"),
+    "subtotal": ("subtotal", "sub total"),
+    "tax_total": ("tax", "vat", "gst"),
+    "total_amount": ("total", "grand total", "amount due"),
+    "payment_terms": ("payment terms", "terms"),
+}
+
+# Query words that put line items in scope
+_LINE_ITEM_KEYWORDS = {
+    "line", "lines", "item", "items", "row", "rows", "quantity", "qty",
+    "unit", "price", "rate", "hsn", "sac", "description",
+}
+_ROW_REFERENCE = re.compile(r"\b(?:line|item|row)\s*(?:item\s*)?(?:no\.?|number|#)?\s*(\d+)\b", re.IGNORECASE)
+_STOP_WORDS = {"the", "and", "for", "should", "not", "is", "are", "was", "from", "with", "this", "that", "missing", "wrong", "correct"}
+
+# Line items sent with a correction prompt before falling back to the count only
+_MAX_CONTEXT_ROWS = 20
+
+# Line-item region boundaries for map-reduce parsing
+_TABLE_HEADER = re.compile(r"\b(description|items?|particulars|products?|services?)\b.*\b(amount|price|rate|total)\b", re.IGNORECASE)
+_TOTALS_LINE = re.compile(r"^\s*(sub\s*-?\s*total|total|grand\s+total|amount\s+due|balance\s+due|tax|vat|gst)\b", re.IGNORECASE)
+_SEGMENT_CONTEXT_LINES = 2
+
 
 class InvoiceParser:
     """Tool for extracting structured data from invoice text"""
     
-    def __init__(self):
-        Config.validate()
-        genai.configure(api_key=Config.GOOGLE_API_KEY)
-        self.model = genai.GenerativeModel(Config.GEMINI_MODEL)
+    def __init__(self, model=None):
+        Config.validate(require_api_key=model is None)
+        self.model = model or create_model()
+        
+        # Response schemas derived from the pydantic models
+        self.invoice_schema = response_schema(InvoiceData)
+        self.correction_schema = response_schema(InvoiceData, partial=True)
+        self.patch_schema = patch_schema()
+        self.metadata_schema = self._subschema("metadata")
+        self.line_items_schema = self._subschema("line_items")
+        
+        # Estimated input tokens sent vs. the uncompacted request
+        self.prompt_stats = {"requests": 0, "baseline_tokens": 0, "sent_tokens": 0}
+        self.last_prompt_stats: Optional[dict] = None
+        self._stats_lock = threading.Lock()
     
-    def parse_invoice(self, text_content: str) -> InvoiceData:
+    def with_model(self, model) -> "InvoiceParser":
+        """
+        Parser that sends its requests to another model (e.g. a routed tier)
+        
+        The copy shares the schemas and prompt statistics; None returns self.
+        """
+        if model is None or model is self.model:
+            return self
+        parser = copy.copy(self)
+        parser.model = model
+        return parser
+    
+    def parse_invoice(
+        self,
+        text_content: str,
+        on_field: Optional[Callable[[str, object], None]] = None
+    ) -> InvoiceData:
         """
         Parse invoice text into structured JSON format
+        
+        Args:
+            text_content: Extracted invoice text
+            on_field: Called with (field_name, value) for each metadata field
+                as soon as it is complete in the streamed response
+            
+        Returns:
+            Parsed InvoiceData
         """
         text_content = text_content.strip()
         if not text_content:
             return InvoiceData(metadata=InvoiceMetadata(), line_items=[])
         print(f"[PARSE] Parsing invoice data...")
         prompt = self._build_extraction_prompt()
-        print(prompt)
-        response = self.model.generate_content([prompt, text_content])
-        print("**********",response.text)
+        
+        on_text = None
+        if on_field is not None:
+            reader = StreamingObjectReader("metadata")
+            
+            def on_text(chunk: str):
+                for name, value in reader.feed(chunk):
+                    if name in InvoiceMetadata.model_fields:
+                        on_field(name, value)
+        
+        if len(text_content) >= Config.MAP_REDUCE_MIN_CHARS:
+            return self._parse_map_reduce(text_content, on_text)
+        
+        contents = self._prepare_request(prompt, text_content)
+        json_text, raw_text = self._generate_json(contents, self.invoice_schema, on_text)
+        if json_text is None and "{" in raw_text and extract_json(raw_text) is None:
+            # Output limit hit mid-table: segments keep every response small
+            print(f"[WARNING] Response truncated after {len(raw_text)} chars, re-parsing in segments")
+            return self._parse_map_reduce(text_content)
         try:
-            json_text = self._extract_json(response.text)
-            print("**********",json_text)
-            data_dict = json.loads(json_text)
+            data_dict = json.loads(json_text or self._extract_json(raw_text))
             invoice_data = InvoiceData(**data_dict)
             print(f"[SUCCESS] Parsed metadata fields: {len([k for k, v in invoice_data.metadata.model_dump().items() if v is not None])}")
             print(f"[SUCCESS] Parsed line items: {len(invoice_data.line_items)}")
             return invoice_data
         except Exception as e:
             print(f"[ERROR] Error parsing invoice: {e}")
-            print(f"Raw response: {response.text[:500]}...")
+            print(f"Raw response: {raw_text[:500]}...")
             raise
     
     def reprompt_correction(
@@ -56,22 +150,31 @@ class InvoiceParser:
         """
         print(f"[UPDATE] Processing correction: {correction_query}")
         
-        prompt = self._build_correction_prompt(current_data, correction_query)
+        baseline_prompt = self._build_correction_prompt(current_data, correction_query, compact=False)
+        if Config.PATCH_CORRECTIONS:
+            prompt = self._build_patch_prompt(current_data, correction_query)
+            schema = self.patch_schema
+        else:
+            prompt = self._build_correction_prompt(current_data, correction_query)
+            schema = self.correction_schema
         
-        response = self.model.generate_content([prompt, text_content])
+        contents = self._prepare_request(prompt, text_content, baseline_prompt)
+        json_text, raw_text = self._generate_json(contents, schema)
         
         try:
-            json_text = self._extract_json(response.text)
-            correction_dict = json.loads(json_text)
+            correction_dict = json.loads(json_text or self._extract_json(raw_text))
             
-            # Merge corrections into current data
-            updated_data = self._apply_corrections(current_data, correction_dict)
+            # Merge corrections into current data (patch ops, or a legacy partial object)
+            if isinstance(correction_dict, dict) and "ops" in correction_dict:
+                updated_data = self._apply_patch_ops(current_data, correction_dict["ops"] or [])
+            else:
+                updated_data = self._apply_corrections(current_data, correction_dict)
             
             print(f"[SUCCESS] Applied corrections successfully")
             return updated_data
         except Exception as e:
             print(f"[ERROR] Error applying correction: {e}")
-            print(f"Raw response: {response.text[:500]}...")
+            print(f"Raw response: {raw_text[:500]}...")
             raise
     
     def extract_specific_field(
@@ -112,19 +215,241 @@ class InvoiceParser:
         Invoice text:
         """
         
-        response = self.model.generate_content([prompt, text_content])
+        contents = self._prepare_request(prompt, text_content)
+        json_text, raw_text = self._generate_json(contents, field_schema(field_name))
         
         try:
-            json_text = self._extract_json(response.text)
-            result = json.loads(json_text)
+            result = json.loads(json_text or self._extract_json(raw_text))
             print(f"[SUCCESS] Extracted: {result}")
             return result
         except Exception as e:
             print(f"[ERROR] Error extracting field: {e}")
             return {field_name: None}
     
+    def _parse_map_reduce(
+        self,
+        text_content: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> InvoiceData:
+        """
+        Parse a long invoice as a metadata pass plus parallel line-item segments
+        
+        The line-item region is split at line boundaries into segments of at
+        most PARSE_SEGMENT_CHARS, so no single response can outgrow the output
+        limit. Segment results are merged in order and reconciled with the
+        totals from the metadata pass.
+        
+        Args:
+            text_content: Extracted invoice text
+            on_text: Called with each streamed chunk of the metadata response
+            
+        Returns:
+            Parsed InvoiceData
+        """
+        header, segments, metadata_text = self._split_line_item_region(text_content)
+        print(f"[PARSE] Map-reduce parsing: {len(segments)} line-item segment(s)")
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(Config.PARSE_WORKERS, len(segments)))) as pool:
+            futures = [pool.submit(self._parse_segment, header, context, lines) for context, lines in segments]
+            
+            contents = self._prepare_request(self._build_metadata_prompt(), metadata_text)
+            json_text, raw_text = self._generate_json(contents, self.metadata_schema, on_text)
+            try:
+                metadata = InvoiceMetadata(**json.loads(json_text or self._extract_json(raw_text)).get("metadata", {}))
+            except Exception as e:
+                print(f"[ERROR] Error parsing invoice metadata: {e}")
+                print(f"Raw response: {raw_text[:500]}...")
+                raise
+            
+            segment_items = [future.result() for future in futures]
+        
+        line_items, seams = self._merge_segments(segment_items)
+        line_items = self._reconcile_segments(line_items, seams, metadata)
+        
+        invoice_data = InvoiceData(metadata=metadata, line_items=line_items)
+        print(f"[SUCCESS] Parsed metadata fields: {len([k for k, v in invoice_data.metadata.model_dump().items() if v is not None])}")
+        print(f"[SUCCESS] Parsed line items: {len(invoice_data.line_items)} from {len(segments)} segment(s)")
+        return invoice_data
+    
+    def _split_line_item_region(self, text_content: str) -> tuple:
+        """
+        Locate the line-item table and cut it into row-aligned segments
+        
+        Returns:
+            Tuple of (table header line or None, [(context lines, segment lines)],
+            text for the metadata pass: everything before and after the table)
+        """
+        lines = text_content.split("\n")
+        start = next((i for i, line in enumerate(lines) if _TABLE_HEADER.search(line)), None)
+        end = next((i for i in range(len(lines) - 1, (start or 0), -1)
+                    if _TOTALS_LINE.match(lines[i]) and not _TOTALS_LINE.match(lines[i - 1])), None)
+        
+        header = lines[start].strip() if start is not None else None
+        region = lines[(start + 1 if start is not None else 0):end]
+        
+        head = lines[:start + 1] if start is not None else self._take_chars(lines, Config.PARSE_SEGMENT_CHARS)
+        tail = lines[end:] if end is not None else self._take_chars(lines[::-1], Config.PARSE_SEGMENT_CHARS)[::-1]
+        
+        segments, current, size = [], [], 0
+        for line in region:
+            if current and size + len(line) + 1 > Config.PARSE_SEGMENT_CHARS:
+                segments.append(current)
+                current, size = [], 0
+            current.append(line)
+            size += len(line) + 1
+        if current or not segments:
+            segments.append(current)
+        
+        with_context = [
+            (segments[k - 1][-_SEGMENT_CONTEXT_LINES:] if k else [], segment)
+            for k, segment in enumerate(segments)
+        ]
+        return header, with_context, "\n".join(head + ["..."] + tail)
+    
+    def _parse_segment(self, header: Optional[str], context: list, lines: list) -> list:
+        """
+        Extract the line items of one segment
+        
+        A response that is still truncated or invalid is retried as two
+        half-size segments.
+        """
+        if not any(line.strip() for line in lines):
+            return []
+        
+        contents = self._prepare_request(self._build_segment_prompt(header, context), "\n".join(lines))
+        json_text, raw_text = self._generate_json(contents, self.line_items_schema)
+        try:
+            items = json.loads(json_text or self._extract_json(raw_text)).get("line_items") or []
+            return [LineItem(**item) for item in items]
+        except Exception as e:
+            if len(lines) < 2:
+                print(f"[ERROR] Error parsing line-item segment: {e}")
+                raise
+            print(f"[WARNING] Segment of {len(lines)} lines failed ({e}), splitting")
+            middle = len(lines) // 2
+            return (self._parse_segment(header, context, lines[:middle]) +
+                    self._parse_segment(header, lines[max(0, middle - _SEGMENT_CONTEXT_LINES):middle], lines[middle:]))
+    
+    def _merge_segments(self, segment_items: list) -> tuple:
+        """
+        Concatenate segment results in order
+        
+        A row repeated at the start of the next segment (it straddled the
+        boundary) is kept once.
+        
+        Returns:
+            Tuple of (line items, indices where each later segment begins)
+        """
+        merged, seams = [], []
+        for items in segment_items:
+            if merged and items and items[0] == merged[-1]:
+                items = items[1:]
+            if merged:
+                seams.append(len(merged))
+            merged.extend(items)
+        return merged, seams
+    
+    def _reconcile_segments(self, line_items: list, seams: list, metadata: InvoiceMetadata) -> list:
+        """
+        Check the merged rows against the totals
+        
+        If the sum is off by exactly one row at a segment boundary whose
+        amount repeats the row before it, that duplicate is dropped.
+        """
+        amounts = [item.amount for item in line_items]
+        targets = [t for t in (metadata.subtotal, metadata.total_amount) if t is not None]
+        if not targets or not amounts or None in amounts:
+            return line_items
+        
+        line_sum = sum(amounts)
+        if any(abs(line_sum - target) <= 0.01 for target in targets):
+            print(f"[RECONCILE] Line items sum to {line_sum:.2f}, matching the totals")
+            return line_items
+        
+        for seam in reversed(seams):
+            if seam >= len(line_items) or line_items[seam].amount != line_items[seam - 1].amount:
+                continue
+            if any(abs(line_sum - line_items[seam].amount - target) <= 0.01 for target in targets):
+                print(f"[RECONCILE] Dropped duplicated boundary row {seam}: {line_items[seam].description}")
+                return line_items[:seam] + line_items[seam + 1:]
+        
+        print(f"[RECONCILE] Line items sum to {line_sum:.2f}, totals are {targets}")
+        return line_items
+    
+    def _build_metadata_prompt(self) -> str:
+        """Build prompt for the metadata pass of map-reduce parsing"""
+        if Config.STRUCTURED_OUTPUT:
+            return """
+        Extract the invoice header and totals from this invoice. The line item
+        table has been removed ("...") and is extracted separately.
+        - Use null for fields that are not found or unclear
+        - Keep dates as strings in the format found
+        
+        Invoice text:
+        """
+        
+        fields = ", ".join(f'"{name}"' for name in InvoiceMetadata.model_fields)
+        return f"""
+        Extract the invoice header and totals from this invoice. The line item
+        table has been removed ("...") and is extracted separately.
+        
+        Return {{"metadata": {{...}}}} with these keys: {fields}
+        Use null for fields that are not found, numbers for amounts, and keep
+        dates as strings in the format found. Only return the JSON, no other text.
+        
+        Invoice text:
+        """
+    
+    def _build_segment_prompt(self, header: Optional[str], context: list) -> str:
+        """Build prompt for one line-item segment of map-reduce parsing"""
+        parts = [
+            "Extract the line items from this segment of a longer invoice table.",
+            "- Extract every row of the segment as a separate entry, in order",
+            "- Do not extract subtotal, tax or total summary lines",
+            "- Use null for fields that are not found or unclear",
+        ]
+        if not Config.STRUCTURED_OUTPUT:
+            keys = ", ".join(f'"{name}"' for name in LineItem.model_fields)
+            parts.append(f'Return {{"line_items": [...]}} where each item has the keys {keys}; only return the JSON')
+        if header:
+            parts.append(f"\nTable columns: {header}")
+        if context:
+            parts.append("\nEnd of the previous segment (already extracted, skip rows that end here):")
+            parts.extend(context)
+        parts.append("\nSegment:")
+        return "\n".join(parts) + "\n"
+    
+    def _subschema(self, key: str) -> dict:
+        """Response schema for one top-level key of InvoiceData"""
+        return {
+            "type": "object",
+            "properties": {key: self.invoice_schema["properties"][key]},
+            "required": [key],
+        }
+    
+    def _take_chars(self, lines: list, limit: int) -> list:
+        """Leading lines totalling at most limit characters"""
+        taken, size = [], 0
+        for line in lines:
+            if taken and size + len(line) + 1 > limit:
+                break
+            taken.append(line)
+            size += len(line) + 1
+        return taken
+    
     def _build_extraction_prompt(self) -> str:
         """Build prompt for initial invoice extraction"""
+        if Config.STRUCTURED_OUTPUT:
+            # The response schema carries the format; only semantics are described
+            return """
+        Extract ALL information from this invoice document.
+        - Extract ALL line items as separate entries
+        - Use null for fields that are not found or unclear
+        - Keep dates as strings in the format found
+        
+        Invoice text:
+        """
+        
         return """
         Extract ALL information from this invoice document and structure it as JSON.
         
@@ -149,7 +474,7 @@ class InvoiceParser:
           "line_items": [
             {
               "description": "string or null",
-              "HNS/SAC":number or null,
+              "hsn_sac": "string or null",
               "quantity": number or null,
               "unit_price": number or null,
               "amount": number or null,
@@ -172,10 +497,15 @@ class InvoiceParser:
     def _build_correction_prompt(
         self,
         current_data: InvoiceData,
-        correction_query: str
+        correction_query: str,
+        compact: Optional[bool] = None
     ) -> str:
         """Build prompt for correction/re-prompting"""
-        current_json = json.dumps(current_data.model_dump(), indent=2)
+        compact = Config.PREPROCESS_TEXT if compact is None else compact
+        if compact:
+            current_json = json.dumps(current_data.model_dump(exclude_none=True), separators=(",", ":"))
+        else:
+            current_json = json.dumps(current_data.model_dump(), indent=2)
         
         return f"""
         You have previously extracted this invoice data:
@@ -198,32 +528,279 @@ class InvoiceParser:
         Invoice text:
         """
     
+    def _build_patch_prompt(self, current_data: InvoiceData, correction_query: str) -> str:
+        """Build a correction prompt that asks for patch operations"""
+        context = self._correction_context(current_data, correction_query)
+        
+        return f"""
+        Current values relevant to the request (line items are addressed by their 0-based index "i"):
+        
+        {json.dumps(context, separators=(",", ":"))}
+        
+        The user has provided this correction/request:
+        "{correction_query}"
+        
+        Based on the invoice text below, return ONLY the changes as patch operations:
+        {{"ops": [{{"op": "replace", "path": "/metadata/po_number", "value": "PO-123"}}]}}
+        
+        Paths:
+        - /metadata/<field> to set an invoice field
+        - /line_items/<i>/<field> to change one value of an existing line item
+        - /line_items/- (op "add") with "item" to append a line item
+        - /line_items/<i> (op "replace") with "item" to replace a line item
+        - /line_items/<i> (op "remove") to delete a line item
+        Use numbers without currency symbols. Return {{"ops": []}} if nothing needs to change.
+        
+        Invoice text:
+        """
+    
+    def _correction_context(self, current_data: InvoiceData, correction_query: str) -> dict:
+        """
+        Select the current values a correction needs to see
+        
+        Metadata fields named by the query are included (even when null) and
+        line items referenced by number, description or value are included
+        with their index. Queries that match nothing get the non-null metadata.
+        
+        Args:
+            current_data: Current invoice data
+            correction_query: User's correction request
+            
+        Returns:
+            Dictionary with "metadata", "line_items" and "line_item_count"
+        """
+        words = re.findall(r"[a-z0-9.]+", correction_query.lower())
+        phrase = f" {' '.join(w.strip('.') for w in words)} "
+        
+        metadata = current_data.metadata.model_dump()
+        fields = [
+            name for name, keywords in _FIELD_KEYWORDS.items()
+            if f" {name.replace('_', ' ')} " in phrase or any(f" {k} " in phrase for k in keywords)
+        ]
+        
+        items = current_data.line_items
+        rows = self._relevant_rows(items, correction_query, words)
+        if not rows and _LINE_ITEM_KEYWORDS & set(words) and len(items) <= _MAX_CONTEXT_ROWS:
+            rows = list(range(len(items)))
+        
+        if not fields and not rows:
+            context_metadata = {k: v for k, v in metadata.items() if v is not None}
+        else:
+            context_metadata = {k: metadata[k] for k in fields}
+        
+        return {
+            "metadata": context_metadata,
+            "line_items": [
+                {"i": i, **items[i].model_dump(exclude_none=True)} for i in rows[:_MAX_CONTEXT_ROWS]
+            ],
+            "line_item_count": len(items),
+        }
+    
+    def _relevant_rows(self, items: list, correction_query: str, words: list) -> list:
+        """Indices of line items referenced by a correction query"""
+        rows = set()
+        for match in _ROW_REFERENCE.finditer(correction_query):
+            index = int(match.group(1)) - 1
+            if 0 <= index < len(items):
+                rows.add(index)
+        
+        terms = {w for w in words if len(w) >= 3 and w not in _STOP_WORDS and w not in _LINE_ITEM_KEYWORDS
+                 and not any(w in keywords for keywords in _FIELD_KEYWORDS.values())}
+        numbers = set()
+        for w in re.findall(r"[a-z0-9.]+", _ROW_REFERENCE.sub(" ", correction_query.lower())):
+            try:
+                numbers.add(float(w))
+            except ValueError:
+                pass
+        
+        for i, item in enumerate(items):
+            text = f"{item.description or ''} {item.hsn_sac or ''}".lower()
+            values = {item.quantity, item.unit_price, item.amount, item.tax_rate, item.tax_amount}
+            if terms & set(re.findall(r"[a-z0-9.]+", text)) or numbers & values:
+                rows.add(i)
+        
+        return sorted(rows)
+    
+    def _apply_patch_ops(self, current_data: InvoiceData, ops: list) -> InvoiceData:
+        """
+        Apply patch operations returned by a correction
+        
+        Values are validated against the target field's type before the
+        patch is applied; operations that cannot be applied are skipped.
+        """
+        normalized = []
+        for op in ops:
+            try:
+                normalized.append(self._normalize_op(op))
+            except (PatchError, ValidationError) as e:
+                print(f"[WARNING] Skipping correction op {op}: {e}")
+        
+        normalized = [op for op in normalized if op]
+        # Patch a shallow document: only line items addressed by a cell op are dumped
+        items = list(current_data.line_items)
+        for op in normalized:
+            parts = op["path"].strip("/").split("/")
+            if parts[0] == "line_items" and len(parts) == 3 and parts[1].isdigit() and int(parts[1]) < len(items):
+                row = items[int(parts[1])]
+                if isinstance(row, LineItem):
+                    items[int(parts[1])] = row.model_dump()
+        document = {"metadata": current_data.metadata.model_dump(), "line_items": items}
+        
+        patched, errors = apply_patch(document, normalized, in_place=True)
+        for error in errors:
+            print(f"[WARNING] Skipping correction op {error}")
+        
+        print(f"[EFFICIENCY] Applied {len(normalized) - len(errors)} of {len(ops)} correction ops")
+        return InvoiceData.model_construct(
+            metadata=InvoiceMetadata(**patched["metadata"]),
+            line_items=[LineItem(**row) if isinstance(row, dict) else row for row in patched["line_items"]],
+        )
+    
+    def _normalize_op(self, op: dict) -> Optional[dict]:
+        """
+        Check an op's path and coerce its value to the target field's type
+        
+        Returns:
+            Op ready for apply_patch, or None for no-op replacements with null
+        """
+        kind, path = op.get("op"), op.get("path") or ""
+        parts = path.strip("/").split("/")
+        value = op.get("item") if op.get("item") is not None else op.get("value")
+        
+        if kind == "remove":
+            return {"op": kind, "path": path}
+        
+        if parts[0] == "metadata" and len(parts) == 2:
+            model_cls, field = InvoiceMetadata, parts[1]
+        elif parts[0] == "line_items" and len(parts) == 3:
+            model_cls, field = LineItem, parts[2]
+        elif parts[0] == "line_items" and len(parts) == 2:
+            if not isinstance(value, dict):
+                raise PatchError("line item value must be an object")
+            return {"op": kind, "path": path, "value": LineItem(**self._clean_numbers(LineItem, value)).model_dump()}
+        else:
+            raise PatchError(f"unsupported path {path!r}")
+        
+        if field not in model_cls.model_fields:
+            raise PatchError(f"unknown field {field!r}")
+        if value is None:
+            return None
+        
+        value = self._clean_numbers(model_cls, {field: value})[field]
+        return {"op": kind, "path": path, "value": getattr(model_cls(**{field: value}), field)}
+    
+    def _clean_numbers(self, model_cls, values: dict) -> dict:
+        """Strip currency symbols and thousands separators from numeric fields"""
+        cleaned = dict(values)
+        for name, value in values.items():
+            field = model_cls.model_fields.get(name)
+            if field is not None and field.annotation == Optional[float] and isinstance(value, str):
+                number = re.sub(r"[^\d.\-]", "", value)
+                cleaned[name] = number or None
+        return cleaned
+    
     def _apply_corrections(
         self,
         current_data: InvoiceData,
         correction_dict: dict
     ) -> InvoiceData:
         """Apply delta corrections to current data"""
-        current_dict = current_data.model_dump()
+        metadata = current_data.metadata
+        line_items = list(current_data.line_items)
         
-        # Apply metadata corrections
+        # Apply metadata corrections (only the metadata is re-validated)
         if 'metadata' in correction_dict:
-            for key, value in correction_dict['metadata'].items():
-                if value is not None:
-                    current_dict['metadata'][key] = value
+            updates = {key: value for key, value in correction_dict['metadata'].items() if value is not None}
+            if updates:
+                metadata = InvoiceMetadata(**{**metadata.model_dump(), **updates})
         
         # Apply line items corrections (replace entirely if provided)
         if 'line_items' in correction_dict and correction_dict['line_items']:
-            current_dict['line_items'] = correction_dict['line_items']
+            line_items = [LineItem(**item) for item in correction_dict['line_items']]
+        
+        return InvoiceData.model_construct(metadata=metadata, line_items=line_items)
+    
+    def _prepare_request(
+        self,
+        prompt: str,
+        text_content: str,
+        baseline_prompt: Optional[str] = None
+    ) -> list:
+        """
+        Compact the prompt and invoice text, and record the token savings
         
-        return InvoiceData(**current_dict)
+        Args:
+            prompt: Prompt as built
+            text_content: Invoice text as extracted
+            baseline_prompt: Uncompacted prompt variant, if it differs
+            
+        Returns:
+            Contents list for generate_content
+        """
+        baseline = estimate_tokens(baseline_prompt or prompt) + estimate_tokens(text_content)
+        if Config.PREPROCESS_TEXT:
+            prompt = inspect.cleandoc(prompt) + "\n"
+            text_content = compact_text(text_content)
+        sent = estimate_tokens(prompt) + estimate_tokens(text_content)
+        
+        with self._stats_lock:
+            self.last_prompt_stats = {"baseline_tokens": baseline, "sent_tokens": sent}
+            self.prompt_stats["requests"] += 1
+            self.prompt_stats["baseline_tokens"] += baseline
+            self.prompt_stats["sent_tokens"] += sent
+        if baseline:
+            print(f"[EFFICIENCY] Prompt ~{sent} tokens vs ~{baseline} uncompacted "
+                  f"({(1 - sent / baseline) * 100:.1f}% saved)")
+        
+        return [prompt, text_content]
+    
+    def _generate_json(
+        self,
+        contents: list,
+        schema: Optional[dict] = None,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> tuple:
+        """
+        Stream a model response and stop at the first complete JSON value
+        
+        Args:
+            contents: Prompt parts for generate_content
+            schema: Response schema for schema-constrained JSON output
+            on_text: Called with each streamed text chunk
+            
+        Returns:
+            Tuple of (json_text or None, raw text received so far)
+        """
+        kwargs = {}
+        if schema is not None and Config.STRUCTURED_OUTPUT:
+            kwargs["generation_config"] = {
+                "response_mime_type": "application/json",
+                "response_schema": schema,
+            }
+        
+        scanner = JSONStreamScanner()
+        for chunk in self.model.generate_content(contents, stream=True, **kwargs):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. finish/safety metadata)
+                continue
+            if on_text is not None:
+                on_text(text)
+            values = scanner.feed(text)
+            if values:
+                return values[0], scanner.buffer
+        return None, scanner.buffer
     
     def _extract_json(self, text: str) -> str:
         """Extract JSON from response text"""
-        import re
-        
         text = text.strip()
         
+        # Find the outermost balanced object/array (code fences and prose are skipped)
+        json_text = extract_json(text)
+        if json_text is not None:
+            return json_text
+        
         # Remove markdown code blocks if present
         if text.startswith('```json'):
             text = text[7:]
@@ -232,12 +809,4 @@ class InvoiceParser:
         if text.endswith('```'):
             text = text[:-3]
         
-        # Handle embedded JSON - find JSON objects in text
-        json_pattern = r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}'
-        matches = re.findall(json_pattern, text, re.DOTALL)
-        
-        if matches:
-            # Return the first complete JSON object found
-            return matches[0].strip()
-        
-        return text.strip()
\ No newline at end of file
+        return text.strip()
@@ -0,0 +1,290 @@
+import re
+from datetime import date, timedelta
+from typing import List, Optional, Tuple
+from tools.date_parsing import parse_dates
+from models import CompactInvoice, InvoiceData, InvoiceMetadata, ValidationIssue, ValidationReport
+
+# A bare "$" is left alone: it is used by dozens of dollar and peso currencies
+_CURRENCY_SYMBOLS = {
+    "US$": "USD", "€": "EUR", "£": "GBP", "₹": "INR", "RS": "INR", "RS.": "INR",
+    "¥": "JPY", "A$": "AUD", "C$": "CAD", "S$": "SGD", "CHF": "CHF", "R$": "BRL",
+}
+# ISO 4217 alphabetic codes in use (including funds and precious metals)
+_CURRENCY_CODES = set("""
+    AED AFN ALL AMD ANG AOA ARS AUD AWG AZN BAM BBD BDT BGN BHD BIF BMD BND BOB BOV BRL BSD BTN BWP
+    BYN BZD CAD CDF CHE CHF CHW CLF CLP CNY COP COU CRC CUC CUP CVE CZK DJF DKK DOP DZD EGP ERN ETB
+    EUR FJD FKP GBP GEL GHS GIP GMD GNF GTQ GYD HKD HNL HTG HUF IDR ILS INR IQD IRR ISK JMD JOD JPY
+    KES KGS KHR KMF KPW KRW KWD KYD KZT LAK LBP LKR LRD LSL LYD MAD MDL MGA MKD MMK MNT MOP MRU MUR
+    MVR MWK MXN MXV MYR MZN NAD NGN NIO NOK NPR NZD OMR PAB PEN PGK PHP PKR PLN PYG QAR RON RSD RUB
+    RWF SAR SBD SCR SDG SEK SGD SHP SLE SLL SOS SRD SSP STN SVC SYP SZL THB TJS TMT TND TOP TRY TTD
+    TWD TZS UAH UGX USD USN UYI UYU UYW UZS VED VES VND VUV WST XAF XAG XAU XBA XBB XBC XBD XCD XCG
+    XDR XOF XPD XPF XPT XSU XUA YER ZAR ZMW ZWG ZWL
+""".split())
+
+
+class InvoiceValidator:
+    """
+    Local validation stage for extracted invoice data
+
+    Reconciles line items against subtotal and subtotal + tax against total,
+    sanity-checks dates and currency, and assigns a confidence to each field.
+    Values that follow deterministically from the others are filled in
+    locally; remaining inconsistencies name the field most worth re-asking
+    the model about.
+    """
+
+    ABS_TOLERANCE = 0.01
+    REL_TOLERANCE = 0.002  # per-line rounding on long invoices
+
+    def validate(self, invoice: InvoiceData) -> ValidationReport:
+        """
+        Check invoice data without changing it
+
+        Args:
+            invoice: Extracted invoice data
+
+        Returns:
+            ValidationReport with issues and per-field confidence
+        """
+        return self._check(invoice, fixes=[], derived=set())
+
+    def repair(self, invoice: InvoiceData, text: Optional[str] = None) -> Tuple[InvoiceData, ValidationReport]:
+        """
+        Fix deterministic errors locally, then validate
+
+        Only missing values are derived (amount = quantity x unit price,
+        subtotal from line items, total = subtotal + tax, ...) and currency
+        symbols are normalized to ISO codes; present values are never
+        overwritten by arithmetic.
+
+        Args:
+            invoice: Extracted invoice data
+            text: Invoice text, used to infer a missing currency
+
+        Returns:
+            Tuple of (repaired InvoiceData, ValidationReport)
+        """
+        compact = CompactInvoice.from_model(invoice)
+        meta, columns = compact.metadata, compact.columns
+        fixes, derived, rows = [], set(), set()
+
+        def fix(field: str, value, message: str):
+            fixes.append(message)
+            derived.add(field)
+            return value
+
+        def fix_row(i: int, field: str, value, message: str):
+            rows.add(i)
+            return fix(f"line_items[{i}].{field}", value, f"line_items[{i}].{field} = {message}")
+
+        quantities, prices, amounts = columns["quantity"], columns["unit_price"], columns["amount"]
+        for i, (qty, price, amount) in enumerate(zip(quantities, prices, amounts)):
+            if amount is None and qty is not None and price is not None:
+                amounts[i] = fix_row(i, "amount", round(qty * price, 2), "quantity x unit_price")
+            elif qty is None and price and amount is not None and self._is_whole(amount / price):
+                quantities[i] = fix_row(i, "quantity", float(round(amount / price)), "amount / unit_price")
+            elif price is None and qty and amount is not None:
+                prices[i] = fix_row(i, "unit_price", round(amount / qty, 4), "amount / quantity")
+
+        line_sum = compact.column_sum("amount")
+        line_sum = round(line_sum, 2) if line_sum is not None else None
+        tax_sum = compact.column_sum("tax_amount")
+
+        if meta["subtotal"] is None:
+            if meta["total_amount"] is not None and meta["tax_total"] is not None:
+                meta["subtotal"] = fix("subtotal", round(meta["total_amount"] - meta["tax_total"], 2),
+                                       "subtotal = total_amount - tax_total")
+            elif line_sum is not None and (meta["total_amount"] is None
+                                           or not self._close(line_sum, meta["total_amount"])):
+                # Lines summing to the total are gross amounts, not a subtotal
+                meta["subtotal"] = fix("subtotal", line_sum, "subtotal = sum of line item amounts")
+        if meta["tax_total"] is None:
+            if meta["total_amount"] is not None and meta["subtotal"] is not None:
+                meta["tax_total"] = fix("tax_total", round(meta["total_amount"] - meta["subtotal"], 2),
+                                        "tax_total = total_amount - subtotal")
+            elif tax_sum is not None:
+                meta["tax_total"] = fix("tax_total", round(tax_sum, 2),
+                                        "tax_total = sum of line item tax amounts")
+        if meta["total_amount"] is None and meta["subtotal"] is not None and meta["tax_total"] is not None:
+            meta["total_amount"] = fix("total_amount", round(meta["subtotal"] + meta["tax_total"], 2),
+                                       "total_amount = subtotal + tax_total")
+
+        currency = self._normalize_currency(meta["currency"])
+        if currency and currency != meta["currency"]:
+            meta["currency"] = fix("currency", currency, f"currency '{meta['currency']}' -> {currency}")
+        elif meta["currency"] in (None, "$") and text:
+            found = self._currency_in_text(text)
+            if found:
+                meta["currency"] = fix("currency", found, f"currency = {found} (only currency in text)")
+
+        if fixes:
+            print(f"[VALIDATE] Fixed locally: {'; '.join(fixes)}")
+        if not fixes:
+            return invoice, self._check(invoice, fixes, derived)
+        # Derived values are computed from validated ones; untouched rows are shared
+        repaired = compact.apply_to(invoice, rows)
+        return repaired, self._check(repaired, fixes, derived)
+
+    def _check(self, invoice: InvoiceData, fixes: List[str], derived: set) -> ValidationReport:
+        """Run all checks and score fields"""
+        meta = invoice.metadata
+        issues: List[ValidationIssue] = []
+        passed, implicated = set(), set()
+
+        # Line item arithmetic (discounts make this a warning, never a re-ask)
+        for i, item in enumerate(invoice.line_items):
+            if None in (item.quantity, item.unit_price, item.amount):
+                continue
+            net = item.quantity * item.unit_price
+            gross = [net + (item.tax_amount or 0)]
+            if item.tax_rate is not None:
+                gross.append(net * (1 + item.tax_rate / 100))
+            if self._close(net, item.amount) or any(self._close(g, item.amount) for g in gross):
+                passed.add("line_items")
+            else:
+                implicated.add("line_items")
+                issues.append(ValidationIssue(
+                    field=f"line_items[{i}].amount", code="line_amount_mismatch",
+                    message=f"quantity x unit_price = {net:.2f} but amount = {item.amount}",
+                ))
+
+        amounts = [item.amount for item in invoice.line_items]
+        line_sum = sum(amounts) if amounts and None not in amounts else None
+        totals_ok = None
+        if None not in (meta.subtotal, meta.tax_total, meta.total_amount):
+            totals_ok = self._close(meta.subtotal + meta.tax_total, meta.total_amount)
+
+        lines_ok = None
+        if line_sum is not None and meta.subtotal is not None:
+            # Line amounts may be printed net (sum to subtotal) or gross (sum to total)
+            lines_ok = self._close(line_sum, meta.subtotal) or (
+                meta.total_amount is not None and self._close(line_sum, meta.total_amount))
+            if lines_ok:
+                passed.update({"line_items", "subtotal"})
+            else:
+                implicated.update({"line_items", "subtotal"})
+                # A subtotal confirmed by subtotal + tax = total points at the line items
+                suspect = "line_items" if totals_ok else "subtotal"
+                issues.append(ValidationIssue(
+                    field=suspect, code="subtotal_mismatch",
+                    message=f"line items sum to {line_sum:.2f} but subtotal is {meta.subtotal}",
+                    reextract=suspect == "subtotal",
+                ))
+
+        if totals_ok is not None:
+            if totals_ok:
+                passed.update({"subtotal", "tax_total", "total_amount"})
+            else:
+                implicated.update({"subtotal", "tax_total", "total_amount"})
+                # With the subtotal backed by the line items, total or tax is wrong
+                suspect = "total_amount" if lines_ok is not False else "subtotal"
+                issues.append(ValidationIssue(
+                    field=suspect, code="total_mismatch",
+                    message=f"subtotal + tax_total = {meta.subtotal + meta.tax_total:.2f} "
+                            f"but total_amount is {meta.total_amount}",
+                    reextract=True,
+                ))
+
+        for field in ("subtotal", "tax_total", "total_amount"):
+            value = getattr(meta, field)
+            if value is not None and value < 0 and field != "tax_total":
+                implicated.add(field)
+                issues.append(ValidationIssue(field=field, code="negative_amount",
+                                              message=f"{field} is negative ({value})", reextract=True))
+
+        issues.extend(self._check_dates(meta, passed, implicated))
+
+        if meta.currency is not None:
+            if meta.currency in _CURRENCY_CODES:
+                passed.add("currency")
+            elif meta.currency == "$":
+                # Not worth a re-ask: the model cannot tell which dollar either
+                implicated.add("currency")
+                issues.append(ValidationIssue(field="currency", code="ambiguous_currency",
+                                              message="'$' does not name one currency", reextract=False))
+            else:
+                implicated.add("currency")
+                issues.append(ValidationIssue(field="currency", code="unknown_currency",
+                                              message=f"'{meta.currency}' is not a known ISO 4217 code",
+                                              reextract=True))
+
+        suspects = {issue.field for issue in issues}
+        confidence = {}
+        for field in list(InvoiceMetadata.model_fields) + ["line_items"]:
+            value = getattr(meta, field, None) if field != "line_items" else invoice.line_items
+            if value is None or value == []:
+                score = 0.0
+            elif field in suspects:
+                score = 0.3
+            elif field in implicated:
+                score = 0.5
+            elif field in derived:
+                score = 0.9
+            elif field in passed:
+                score = 1.0
+            else:
+                score = 0.8
+            confidence[field] = score
+
+        for issue in issues:
+            print(f"[VALIDATE] {issue.field}: {issue.message}")
+        return ValidationReport(valid=not issues, issues=issues, fixes=fixes, confidence=confidence)
+
+    def _check_dates(self, meta: InvoiceMetadata, passed: set, implicated: set) -> List[ValidationIssue]:
+        """Dates must parse, the invoice date must not be in the future, and due >= issued"""
+        issues = []
+        parsed = {}
+        for field in ("invoice_date", "due_date"):
+            value = getattr(meta, field)
+            if value is None:
+                continue
+            candidates = self._parse_dates(value)
+            if not candidates:
+                implicated.add(field)
+                issues.append(ValidationIssue(field=field, code="unparseable_date",
+                                              message=f"'{value}' is not a recognizable date", reextract=True))
+            else:
+                parsed[field] = candidates
+                passed.add(field)
+
+        issued = parsed.get("invoice_date")
+        if issued and min(issued) > date.today() + timedelta(days=1):
+            passed.discard("invoice_date")
+            implicated.add("invoice_date")
+            issues.append(ValidationIssue(field="invoice_date", code="future_date",
+                                          message=f"invoice date {meta.invoice_date} is in the future",
+                                          reextract=True))
+        due = parsed.get("due_date")
+        if issued and due and max(due) < min(issued):
+            passed.difference_update({"invoice_date", "due_date"})
+            implicated.update({"invoice_date", "due_date"})
+            issues.append(ValidationIssue(field="due_date", code="due_before_issue",
+                                          message=f"due date {meta.due_date} is before invoice date {meta.invoice_date}",
+                                          reextract=True))
+        return issues
+
+    def _parse_dates(self, value: str) -> List[date]:
+        """All dates a string can mean under the known formats"""
+        return sorted(parse_dates(value))
+
+    def _normalize_currency(self, value: Optional[str]) -> Optional[str]:
+        """Map symbols and lowercase codes to ISO 4217 codes"""
+        if value is None:
+            return None
+        key = value.strip().upper()
+        if key in _CURRENCY_CODES:
+            return key
+        return _CURRENCY_SYMBOLS.get(key, value)
+
+    def _currency_in_text(self, text: str) -> Optional[str]:
+        """The currency named in the text, if exactly one is"""
+        found = {code for code in _CURRENCY_CODES if re.search(rf"\b{code}\b", text)}
+        found.update(code for symbol, code in _CURRENCY_SYMBOLS.items()
+                     if not symbol[0].isalpha() and symbol in text)
+        return found.pop() if len(found) == 1 else None
+
+    def _close(self, a: float, b: float) -> bool:
+        return abs(a - b) <= max(self.ABS_TOLERANCE, abs(b) * self.REL_TOLERANCE)
+
+    def _is_whole(self, value: float) -> bool:
+        return abs(value - round(value)) < 1e-6
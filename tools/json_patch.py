@@ -0,0 +1,122 @@
+import copy
+from typing import List, Tuple
+
+class PatchError(ValueError):
+    """Raised when a patch operation cannot be applied"""
+
+
+def apply_patch(document: dict, ops: List[dict], in_place: bool = False) -> Tuple[dict, List[str]]:
+    """
+    Apply JSON-Patch style operations (add / replace / remove) to a document
+
+    Paths are JSON pointers such as "/metadata/po_number",
+    "/line_items/3/amount" or "/line_items/-" (append). Ops are applied in
+    order, but array indices always refer to the document as it was before
+    the patch: an add inserts before the original item at its index, and
+    earlier inserts and removals do not shift the targets of later ops.
+    An item removed earlier in the patch cannot be addressed again.
+
+    Args:
+        document: Document to patch (not modified)
+        ops: List of {"op", "path", "value"} dictionaries
+        in_place: Patch document itself instead of a deep copy
+
+    Returns:
+        Tuple of (patched document, list of errors for skipped operations)
+    """
+    patched = document if in_place else copy.deepcopy(document)
+    errors = []
+    positions = {}  # id(list) -> (list, original index per current item or None, original size)
+
+    for op in ops:
+        try:
+            _apply_op(patched, op, positions)
+        except PatchError as e:
+            errors.append(f"{op.get('op')} {op.get('path')}: {e}")
+
+    return patched, errors
+
+
+def _apply_op(document: dict, op: dict, positions: dict):
+    """Apply a single operation in place"""
+    kind = op.get("op")
+    if kind not in ("add", "replace", "remove"):
+        raise PatchError(f"unsupported op {kind!r}")
+    if kind != "remove" and "value" not in op:
+        raise PatchError("missing value")
+
+    parts = _split_pointer(op.get("path", ""))
+    if not parts:
+        raise PatchError("empty path")
+    parent = _resolve(document, parts[:-1], positions)
+    last = parts[-1]
+
+    if isinstance(parent, dict):
+        if kind == "remove":
+            parent.pop(last, None)
+        else:
+            parent[last] = op["value"]
+        return
+
+    if isinstance(parent, list):
+        origins = _origins(parent, positions)[1]
+        if last == "-":
+            if kind != "add":
+                raise PatchError("'-' is only valid for add")
+            parent.append(op["value"])
+            origins.append(None)
+            return
+        index = _position(parent, last, positions, insert=kind == "add")
+        if kind == "add":
+            parent.insert(index, op["value"])
+            origins.insert(index, None)
+        elif kind == "replace":
+            parent[index] = op["value"]
+        else:
+            del parent[index]
+            del origins[index]
+        return
+
+    raise PatchError("path does not address a container")
+
+
+def _resolve(document, parts: List[str], positions: dict):
+    """Walk a pointer to the container holding its last segment"""
+    node = document
+    for part in parts:
+        if isinstance(node, dict):
+            if part not in node or node[part] is None:
+                node[part] = {}
+            node = node[part]
+        elif isinstance(node, list):
+            node = node[_position(node, part, positions)]
+        else:
+            raise PatchError(f"cannot descend into {part!r}")
+    return node
+
+
+def _split_pointer(path: str) -> List[str]:
+    if not path.startswith("/"):
+        raise PatchError("path must start with '/'")
+    return [p.replace("~1", "/").replace("~0", "~") for p in path[1:].split("/")]
+
+
+def _origins(array: list, positions: dict) -> tuple:
+    """Position bookkeeping of a list, started the first time the patch touches it"""
+    entry = positions.get(id(array))
+    if entry is None or entry[0] is not array:
+        entry = positions[id(array)] = (array, list(range(len(array))), len(array))
+    return entry
+
+
+def _position(array: list, part: str, positions: dict, insert: bool = False) -> int:
+    """Current position of the item a pre-patch index refers to"""
+    _, origins, size = _origins(array, positions)
+    if not part.isdigit() or int(part) > size or (int(part) == size and not insert):
+        raise PatchError(f"index {part!r} out of range")
+    original = int(part)
+    if original == size:
+        return len(array)
+    if original not in origins:
+        raise PatchError(f"index {part!r} was removed earlier in the patch")
+    return origins.index(original)
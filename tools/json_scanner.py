@@ -0,0 +1,201 @@
+import json
+import re
+from typing import List, Optional, Tuple
+
+class JSONStreamScanner:
+    """
+    Incremental scanner for JSON values embedded in model output
+
+    Text is fed in arbitrary chunks (e.g. streamed response parts). The scanner
+    tracks nesting depth while respecting strings and escapes, and returns each
+    outermost object or array as soon as its closing bracket arrives. Balanced
+    candidates that are not valid JSON (prose such as "[see below]") are
+    skipped and scanning resumes just after their opening bracket.
+    """
+
+    _OPENERS = {"{": "}", "[": "]"}
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0
+        self._reset_candidate()
+
+    def feed(self, chunk: str) -> List[str]:
+        """
+        Add text and return any JSON values completed by it
+
+        Args:
+            chunk: Next piece of model output
+
+        Returns:
+            List of complete JSON texts, in order of appearance
+        """
+        self.buffer += chunk
+        completed = []
+
+        while self._pos < len(self.buffer):
+            char = self.buffer[self._pos]
+            self._pos += 1
+
+            if self._start is None:
+                if char in self._OPENERS:
+                    self._start = self._pos - 1
+                    self._stack.append(self._OPENERS[char])
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in self._OPENERS:
+                self._stack.append(self._OPENERS[char])
+            elif char in "}]":
+                if char != self._stack[-1]:
+                    self._retry_after_start()
+                    continue
+                self._stack.pop()
+                if not self._stack:
+                    candidate = self.buffer[self._start:self._pos]
+                    try:
+                        json.loads(candidate)
+                    except ValueError:
+                        self._retry_after_start()
+                        continue
+                    completed.append(candidate)
+                    self._reset_candidate()
+
+        return completed
+
+    def finish(self) -> List[str]:
+        """
+        Signal the end of input and return values found after unclosed candidates
+
+        A candidate that never closes (e.g. a stray "{" in prose) is abandoned
+        and scanning resumes from the next opening bracket after it. A
+        candidate that is valid JSON cut off at the end (truncated output) is
+        kept, so in_progress stays True and values nested in it are not
+        returned on their own.
+
+        Returns:
+            List of complete JSON texts, in order of appearance
+        """
+        completed = []
+        while self.in_progress and not _is_json_prefix(self.buffer[self._start:]):
+            self._retry_after_start()
+            completed.extend(self.feed(""))
+        return completed
+
+    @property
+    def in_progress(self) -> bool:
+        """True while an outermost value has been opened but not closed"""
+        return self._start is not None
+
+    def _retry_after_start(self):
+        """Abandon the current candidate and rescan from after its opening bracket"""
+        self._pos = self._start + 1
+        self._reset_candidate()
+
+    def _reset_candidate(self):
+        self._start = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+
+def _is_json_prefix(text: str) -> bool:
+    """True if text is the start of a JSON value that was cut off"""
+    try:
+        json.loads(text)
+    except json.JSONDecodeError as e:
+        return e.pos >= len(text.rstrip()) or e.msg.startswith("Unterminated string")
+    return True
+
+
+def extract_json(text: str) -> Optional[str]:
+    """
+    Return the first complete outermost JSON object or array in text
+
+    Args:
+        text: Model output, possibly wrapped in code fences or prose
+
+    Returns:
+        JSON text, or None if no complete value is present
+    """
+    scanner = JSONStreamScanner()
+    values = scanner.feed(text) or scanner.finish()
+    return values[0] if values else None
+
+
+class StreamingObjectReader:
+    """
+    Emit members of one nested JSON object as soon as each is complete
+
+    For streamed output such as '{"metadata": {"invoice_number": "A1", ...'
+    a reader for "metadata" returns ("invoice_number", "A1") once the value
+    is followed by a delimiter, long before the whole response has arrived.
+    """
+
+    def __init__(self, key: str):
+        self.buffer = ""
+        self.done = False
+        self._start_pattern = re.compile(r'(?<!\\)"' + re.escape(key) + r'"\s*:\s*\{')
+        self._pos = None
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, chunk: str) -> List[Tuple[str, object]]:
+        """
+        Add text and return members completed by it
+
+        Args:
+            chunk: Next piece of model output
+
+        Returns:
+            List of (member name, value) tuples, in order
+        """
+        self.buffer += chunk
+        if self.done:
+            return []
+
+        if self._pos is None:
+            match = self._start_pattern.search(self.buffer)
+            if not match:
+                return []
+            self._pos = match.end()
+
+        members = []
+        while True:
+            pos = self._skip(self._pos, ", \t\r\n")
+            if pos >= len(self.buffer):
+                break
+            if self.buffer[pos] == "}":
+                self.done = True
+                break
+            try:
+                name, pos = self._decoder.raw_decode(self.buffer, pos)
+                pos = self._skip(pos, " \t\r\n")
+                if pos >= len(self.buffer) or self.buffer[pos] != ":":
+                    break
+                value, end = self._decoder.raw_decode(self.buffer, self._skip(pos + 1, " \t\r\n"))
+            except ValueError:
+                break
+
+            # A scalar is only final once a delimiter follows (e.g. "12" may become "123")
+            after = self._skip(end, " \t\r\n")
+            if after >= len(self.buffer) or self.buffer[after] not in ",}":
+                break
+            members.append((name, value))
+            self._pos = after
+
+        return members
+
+    def _skip(self, pos: int, chars: str) -> int:
+        while pos < len(self.buffer) and self.buffer[pos] in chars:
+            pos += 1
+        return pos
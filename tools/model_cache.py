@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from typing import Optional
+from tools.fake_model import FakeResponse
+
+# Record header: sha256 request key + length of the zlib-compressed response
+_HEADER = struct.Struct(">32sI")
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class ModelCacheMiss(LookupError):
+    """A replayed request has no recorded response"""
+
+
+class ModelCacheStore:
+    """
+    Append-only log of model responses keyed by request hash
+
+    Each record is a fixed header (key, compressed length) followed by the
+    zlib-compressed response text. The key -> offset index is rebuilt by
+    scanning headers on open; a torn record at the end of the log (e.g.
+    after a crash) is cut off. Later records for the same key win.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._index = {}
+        self._lock = threading.Lock()
+        self._scan()
+        self._file = open(path, "ab")
+        self._reader = open(path, "rb")
+
+    def get(self, key: bytes) -> Optional[str]:
+        """Return the recorded response text for a key, or None"""
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            offset, length = entry
+            self._reader.seek(offset)
+            data = self._reader.read(length)
+        return zlib.decompress(data).decode("utf-8")
+
+    def put(self, key: bytes, text: str):
+        """Append a response to the log"""
+        data = zlib.compress(text.encode("utf-8"))
+        with self._lock:
+            offset = self._file.tell() + _HEADER.size
+            self._file.write(_HEADER.pack(key, len(data)) + data)
+            self._file.flush()
+            self._index[key] = (offset, len(data))
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def close(self):
+        self._file.close()
+        self._reader.close()
+
+    def reopen(self):
+        """Open fresh file handles (a forked worker must not share the parent's offsets)"""
+        self._lock = threading.Lock()
+        self._file = open(self.path, "ab")
+        self._reader = open(self.path, "rb")
+
+    def _scan(self):
+        if not os.path.exists(self.path):
+            return
+        end = 0
+        with open(self.path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            while end + _HEADER.size <= size:
+                key, length = _HEADER.unpack(f.read(_HEADER.size))
+                if end + _HEADER.size + length > size:
+                    break
+                self._index[key] = (end + _HEADER.size, length)
+                end += _HEADER.size + length
+                f.seek(end)
+        if end < size:
+            print(f"[WARNING] Model cache: dropping {size - end} bytes of a torn record in {self.path}")
+            os.truncate(self.path, end)
+
+
+def open_store(path: str) -> ModelCacheStore:
+    """Return the shared store for a path (opened once per process)"""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ModelCacheStore(path)
+            print(f"[CACHE] Model cache: {len(_stores[path])} recorded responses in {path}")
+        return _stores[path]
+
+
+def _reopen_stores():
+    global _stores_lock
+    _stores_lock = threading.Lock()
+    for store in _stores.values():
+        store.reopen()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reopen_stores)
+
+
+def request_key(model_name: str, contents: list, generation_config) -> bytes:
+    """
+    Hash a request into a cache key
+
+    Binary parts (PDF / image data) are represented by their own sha256,
+    so the key is cheap to build and independent of how the bytes are held.
+    """
+    def part(value):
+        if isinstance(value, (bytes, bytearray)):
+            return {"sha256": hashlib.sha256(value).hexdigest()}
+        if isinstance(value, dict):
+            return {k: part(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [part(v) for v in value]
+        return value
+
+    request = [model_name, part(contents), part(generation_config or {})]
+    return hashlib.sha256(
+        json.dumps(request, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    ).digest()
+
+
+class CachedModel:
+    """
+    Record/replay wrapper around a generative model
+
+    In "record" mode recorded responses are served and every other request
+    goes to the wrapped model, its response being appended to the store.
+    In "replay" mode only recorded responses are served (no model is
+    needed) and unknown requests raise ModelCacheMiss.
+    """
+
+    def __init__(self, model, store: ModelCacheStore, mode: str = "record", model_name: Optional[str] = None):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown model cache mode '{mode}' (expected 'record' or 'replay')")
+        if mode == "record" and model is None:
+            raise ValueError("Record mode needs a model to forward misses to")
+        self.model = model
+        self.store = store
+        self.mode = mode
+        self.model_name = model_name or getattr(model, "model_name", "model")
+        self.hits = 0
+        self.misses = 0
+
+    def generate_content(self, contents, stream: bool = False, generation_config=None, **kwargs):
+        """Serve a recorded response, or forward the request and record it"""
+        contents = contents if isinstance(contents, list) else [contents]
+        key = request_key(self.model_name, contents, generation_config)
+
+        text = self.store.get(key)
+        if text is not None:
+            self.hits += 1
+            return iter([FakeResponse(text)]) if stream else FakeResponse(text)
+
+        self.misses += 1
+        if self.mode == "replay":
+            raise ModelCacheMiss(f"No recorded response for request {key.hex()[:16]}")
+
+        if generation_config is not None:
+            kwargs["generation_config"] = generation_config
+        response = self.model.generate_content(contents, stream=stream, **kwargs)
+        if not stream:
+            self.store.put(key, response.text)
+            return response
+        return self._record_stream(key, response)
+
+    def _record_stream(self, key: bytes, chunks):
+        """
+        Pass chunks through, recording the text once the stream is done
+
+        A consumer that stops early (e.g. once a JSON object is complete)
+        gets the text it consumed recorded, and the model stream is closed
+        rather than drained, so the early stop still saves the rest of the
+        response. Replaying serves that text, which is all the consumer read.
+        """
+        chunks = iter(chunks)
+        parts = []
+        try:
+            for chunk in chunks:
+                parts.append(_chunk_text(chunk))
+                yield chunk
+        except GeneratorExit:
+            close = getattr(chunks, "close", None)
+            if close is not None:
+                close()
+            if parts:
+                self.store.put(key, "".join(parts))
+            raise
+        self.store.put(key, "".join(parts))
+
+
+def _chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except ValueError:
+        # Chunks without text parts (e.g. finish/safety metadata)
+        return ""
@@ -0,0 +1,47 @@
+from typing import Optional
+from config import Config
+
+def create_model(model_name: Optional[str] = None):
+    """
+    Create the generative model client for the configured backend
+
+    Args:
+        model_name: Model to use (defaults to Config.GEMINI_MODEL)
+
+    Returns:
+        genai.GenerativeModel, or FakeGenerativeModel when MODEL_BACKEND=fake,
+        behind a ResilientModel (circuit breaker, hedging) when enabled and
+        wrapped in a CachedModel when MODEL_CACHE is "record" or "replay"
+    """
+    model_name = model_name or Config.GEMINI_MODEL
+
+    if Config.MODEL_CACHE in ("record", "replay"):
+        from tools.model_cache import CachedModel, open_store
+        store = open_store(Config.MODEL_CACHE_PATH)
+        model = _create_backend_model(model_name) if Config.MODEL_CACHE == "record" else None
+        return CachedModel(model, store, Config.MODEL_CACHE, model_name=model_name)
+
+    return _create_backend_model(model_name)
+
+
+def _create_backend_model(model_name: str):
+    model = _create_client(model_name)
+    if Config.CIRCUIT_BREAKER or Config.HEDGE_REQUESTS:
+        from tools.model_resilience import ResilientModel, breaker_for
+        return ResilientModel(model, breaker_for(model_name))
+    return model
+
+
+def _create_client(model_name: str):
+    if Config.MODEL_BACKEND == "fake":
+        from tools.fake_model import FakeGenerativeModel
+        return FakeGenerativeModel(
+            model_name,
+            latency_ms=Config.FAKE_MODEL_LATENCY_MS,
+            error_rate=Config.FAKE_MODEL_ERROR_RATE
+        )
+
+    import google.generativeai as genai
+    Config.validate()
+    genai.configure(api_key=Config.GOOGLE_API_KEY)
+    return genai.GenerativeModel(model_name)
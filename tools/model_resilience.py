@@ -0,0 +1,275 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Optional
+from config import Config
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+_END = object()  # first "chunk" of a stream that produced none
+
+
+class CircuitOpenError(RuntimeError):
+    """A model call was refused because its circuit is open"""
+
+    def __init__(self, model_name: str, retry_after: float):
+        super().__init__(f"Model {model_name} is failing, circuit open for another {retry_after:.0f}s")
+        self.model_name = model_name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker and latency tracker for one model
+
+    The outcomes of the last CIRCUIT_WINDOW calls are kept. Once at least
+    CIRCUIT_MIN_CALLS of them are known and CIRCUIT_FAILURE_RATE of them
+    failed, the circuit opens and calls fail fast with CircuitOpenError for
+    CIRCUIT_COOLDOWN_S. After that a single trial call is let through
+    (half-open): success closes the circuit, failure reopens it.
+    Latencies of successful calls, and the time to the first chunk of
+    streamed calls, feed the hedging thresholds.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        window: Optional[int] = None,
+        failure_rate: Optional[float] = None,
+        min_calls: Optional[int] = None,
+        cooldown_s: Optional[float] = None,
+        enabled: Optional[bool] = None
+    ):
+        self.model_name = model_name
+        self.failure_rate = failure_rate if failure_rate is not None else Config.CIRCUIT_FAILURE_RATE
+        self.min_calls = min_calls if min_calls is not None else Config.CIRCUIT_MIN_CALLS
+        self.cooldown_s = cooldown_s if cooldown_s is not None else Config.CIRCUIT_COOLDOWN_S
+        self.enabled = enabled if enabled is not None else Config.CIRCUIT_BREAKER
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.opened = 0
+        self.rejected = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._outcomes = deque(maxlen=window or Config.CIRCUIT_WINDOW)
+        self._latencies = deque(maxlen=200)
+        self._first_chunk_latencies = deque(maxlen=200)
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go out now"""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.cooldown_s - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                print(f"[CIRCUIT] {self.model_name}: half-open, sending a trial call")
+                return
+            self.rejected += 1
+        raise CircuitOpenError(self.model_name, max(remaining, 0.0))
+
+    def record(self, ok: bool, latency_s: Optional[float] = None):
+        """Record the outcome of a call"""
+        with self._lock:
+            if ok and latency_s is not None:
+                self._latencies.append(latency_s)
+            if self.state == "half_open" and self._trial_running:
+                self._trial_running = False
+                if ok:
+                    print(f"[CIRCUIT] {self.model_name}: trial call succeeded, circuit closed")
+                    self.state = "closed"
+                    self._outcomes.clear()
+                else:
+                    self._open()
+                return
+            self._outcomes.append(ok)
+            if self.state == "closed" and self.enabled and len(self._outcomes) >= self.min_calls:
+                failures = self._outcomes.count(False)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._open()
+
+    def record_hedge(self, won: bool = False):
+        """Count a hedged request sent, or one that answered first"""
+        with self._lock:
+            if won:
+                self.hedge_wins += 1
+            else:
+                self.hedges += 1
+
+    def record_first_chunk(self, latency_s: float):
+        """Record the time a streamed call took to produce its first chunk"""
+        with self._lock:
+            self._first_chunk_latencies.append(latency_s)
+
+    def latency_quantile(self, quantile: float, min_samples: int, first_chunk: bool = False) -> Optional[float]:
+        """Latency (seconds) below which the given share of successful calls finished (or streamed a first chunk)"""
+        with self._lock:
+            latencies = self._first_chunk_latencies if first_chunk else self._latencies
+            if len(latencies) < min_samples:
+                return None
+            ordered = sorted(latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(quantile * len(ordered)) - 1)]
+
+    def stats(self) -> dict:
+        """State, recent failure rate, latency percentiles and hedge counts"""
+        p50 = self.latency_quantile(0.5, 1)
+        p95 = self.latency_quantile(0.95, 1)
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+            return {
+                "state": self.state,
+                "recent_calls": calls,
+                "recent_failure_rate": round(failures / calls, 3) if calls else None,
+                "p50_ms": round(p50 * 1000, 1) if p50 is not None else None,
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "opened": self.opened,
+                "rejected": self.rejected,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+            }
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.opened += 1
+        self._outcomes.clear()
+        print(f"[CIRCUIT] {self.model_name}: too many failures, failing fast for {self.cooldown_s:.0f}s")
+
+
+def breaker_for(model_name: str) -> CircuitBreaker:
+    """Return the shared breaker of a model (one per model name and process)"""
+    with _breakers_lock:
+        if model_name not in _breakers:
+            _breakers[model_name] = CircuitBreaker(model_name)
+        return _breakers[model_name]
+
+
+def breaker_stats() -> dict:
+    """Stats of every model breaker created in this process"""
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.stats() for name, breaker in breakers.items()}
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _hedge_pool
+    with _breakers_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=Config.HEDGE_WORKERS, thread_name_prefix="model-hedge")
+        return _hedge_pool
+
+
+class ResilientModel:
+    """
+    Generative model wrapper adding a circuit breaker and hedged requests
+
+    Every call is checked against the model's CircuitBreaker and its outcome
+    recorded. With hedging on, a call that is still running after the
+    HEDGE_QUANTILE latency of recent calls (once HEDGE_MIN_SAMPLES are known)
+    is sent a second time; the first successful response wins and the slower
+    one is discarded. Streamed calls are hedged on the time to their first
+    chunk, and the stream that answers first is the one read to the end.
+    """
+
+    def __init__(self, model, breaker: Optional[CircuitBreaker] = None, hedge: Optional[bool] = None):
+        self.model = model
+        self.model_name = getattr(model, "model_name", "model")
+        self.breaker = breaker or breaker_for(self.model_name)
+        self.hedge = hedge if hedge is not None else Config.HEDGE_REQUESTS
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        """Send a request unless the circuit is open, hedging slow non-streamed calls"""
+        self.breaker.before_call()
+        if stream:
+            return self._stream(contents, kwargs)
+        delay = self.breaker.latency_quantile(Config.HEDGE_QUANTILE, Config.HEDGE_MIN_SAMPLES) if self.hedge else None
+        if delay is None:
+            return self._call(contents, kwargs)
+        return self._hedged(self._call, contents, kwargs, delay)
+
+    def _hedged(self, fn, contents, kwargs, delay: float, discard=None):
+        """Run fn, sending a duplicate if it has not returned after delay; the first success wins"""
+        primary = _pool().submit(fn, contents, kwargs)
+        done, _ = wait([primary], timeout=delay)
+        if done or self.breaker.state != "closed":
+            return primary.result()
+
+        print(f"[CIRCUIT] {self.model_name}: no response after {delay * 1000:.0f} ms, sending a hedged request")
+        hedge = _pool().submit(fn, contents, kwargs)
+        self.breaker.record_hedge()
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        self.breaker.record_hedge(won=True)
+                    if discard is not None:
+                        loser = primary if future is hedge else hedge
+                        loser.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _call(self, contents, kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.model.generate_content(contents, **kwargs)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        self.breaker.record(True, time.perf_counter() - start)
+        return response
+
+    def _stream(self, contents, kwargs):
+        delay = self.breaker.latency_quantile(
+            Config.HEDGE_QUANTILE, Config.HEDGE_MIN_SAMPLES, first_chunk=True
+        ) if self.hedge else None
+        try:
+            if delay is None:
+                chunks, first = self._open_stream(contents, kwargs)
+            else:
+                chunks, first = self._hedged(self._open_stream, contents, kwargs, delay, discard=_close_stream)
+        except Exception:
+            self.breaker.record(False)
+            raise
+        return self._recorded_stream(chunks, first)
+
+    def _open_stream(self, contents, kwargs):
+        """Start a streamed call and wait for its first chunk"""
+        start = time.perf_counter()
+        chunks = iter(self.model.generate_content(contents, stream=True, **kwargs))
+        first = next(chunks, _END)
+        self.breaker.record_first_chunk(time.perf_counter() - start)
+        return chunks, first
+
+    def _recorded_stream(self, chunks, first):
+        ok = False
+        try:
+            if first is not _END:
+                yield first
+                yield from chunks
+            ok = True
+        except GeneratorExit:
+            # The consumer stopped early; the call itself worked
+            ok = True
+            raise
+        finally:
+            self.breaker.record(ok)
+
+
+def _close_stream(opened):
+    """Close the stream of a hedged call that lost the race"""
+    close = getattr(opened[0], "close", None)
+    if close is not None:
+        close()
@@ -0,0 +1,319 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+from config import Config
+from tools.model_provider import create_model
+from tools.text_preprocessor import estimate_tokens
+
+# Tokens billed per image or PDF page part
+_MEDIA_PART_TOKENS = 258
+_PDF_PAGE = re.compile(rb"/Type\s*/Page(?!s)")
+
+
+def parse_tier_prices(spec: str, count: int) -> List[Tuple[float, float]]:
+    """
+    Parse "in:out,in:out,..." USD prices per 1M tokens, one pair per tier
+
+    Missing entries repeat the last price (0 if none are given).
+    """
+    prices = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        price_in, _, price_out = entry.partition(":")
+        prices.append((float(price_in), float(price_out or price_in)))
+    while len(prices) < count:
+        prices.append(prices[-1] if prices else (0.0, 0.0))
+    return prices[:count]
+
+
+def estimate_input_tokens(contents) -> int:
+    """Approximate input tokens of a generate_content request"""
+    tokens = 0
+    for part in contents if isinstance(contents, list) else [contents]:
+        if isinstance(part, dict) and "data" in part:
+            data = part["data"]
+            is_pdf = part.get("mime_type") == "application/pdf" and isinstance(data, bytes)
+            pages = len(_PDF_PAGE.findall(data)) if is_pdf else 1
+            tokens += _MEDIA_PART_TOKENS * max(1, pages)
+        else:
+            tokens += estimate_tokens(str(part))
+    return tokens
+
+
+class MeteredModel:
+    """
+    Wrapper that records calls, tokens, cost and latency of one model tier
+
+    Streamed responses are measured until the consumer stops reading;
+    output tokens are estimated from the text received.
+    """
+
+    def __init__(self, model, router: "ModelRouter", tier: int):
+        self.model = model
+        self.router = router
+        self.tier = tier
+        self.model_name = router.tiers[tier]
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        """Forward a request to the tier's model and record its usage"""
+        input_tokens = estimate_input_tokens(contents)
+        start = time.perf_counter()
+        try:
+            response = self.model.generate_content(contents, stream=stream, **kwargs)
+            if stream:
+                return self._metered_stream(response, input_tokens, start)
+            text = response.text
+        except Exception:
+            self.router.record_call(self.tier, time.perf_counter() - start, input_tokens, 0, error=True)
+            raise
+        self.router.record_call(self.tier, time.perf_counter() - start, input_tokens, estimate_tokens(text))
+        return response
+
+    def _metered_stream(self, chunks, input_tokens: int, start: float):
+        output_chars, error = 0, False
+        try:
+            for chunk in chunks:
+                try:
+                    output_chars += len(chunk.text)
+                except ValueError:
+                    pass
+                yield chunk
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.router.record_call(
+                self.tier, time.perf_counter() - start, input_tokens, (output_chars + 3) // 4, error=error
+            )
+
+
+class ModelRouter:
+    """
+    Per-task model tier selection with escalation on failed validation
+
+    Tiers are ordered cheapest first (MODEL_TIERS). Each task starts on the
+    cheapest tier its inputs allow:
+      - scanned pages and images start one tier up for text extraction
+      - parses above ROUTER_LARGE_INPUT_TOKENS start one tier up
+      - a tier is skipped for a task once it has at least ROUTER_MIN_SAMPLES
+        attempts and escalates more often than ROUTER_MAX_ESCALATION_RATE or
+        its mean validation confidence is below ROUTER_MIN_CONFIDENCE;
+        every ROUTER_PROBE_EVERY-th task that would skip it runs on it
+        anyway, so a tier that has improved can win its tasks back
+    Task outcomes are halved once a tier's attempts pass ROUTER_STATS_WINDOW,
+    so the thresholds follow recent behaviour rather than all history.
+    A result that raises or fails its acceptance check is retried on the
+    next tier. Per-tier call statistics (calls, errors, tokens, cost,
+    latency) and per-task outcomes (attempts, escalations, confidence) are
+    kept in ROUTER_STATS_PATH so the thresholds can be tuned from data; the
+    file is written by flush() (every ROUTER_STATS_FLUSH_S from the server
+    and at exit), never on the request path.
+    """
+
+    HARD_PAGE_TYPES = ("scanned", "image")
+
+    def __init__(
+        self,
+        tiers: Optional[List[str]] = None,
+        prices: Optional[List[Tuple[float, float]]] = None,
+        stats_path: Optional[str] = None,
+        model_factory: Callable = create_model
+    ):
+        self.tiers = tiers or Config.MODEL_TIERS
+        if not self.tiers:
+            raise ValueError("MODEL_TIERS must name at least one model")
+        self.prices = prices or parse_tier_prices(Config.MODEL_TIER_PRICES, len(self.tiers))
+        self.stats_path = stats_path if stats_path is not None else Config.ROUTER_STATS_PATH
+        self.model_factory = model_factory
+        self._models = {}
+        self._skips = {}  # (task, tier name) -> times the tier was skipped, for probing
+        self._lock = threading.RLock()
+        self._stats = self._load_stats()
+        self._dirty = False
+        self._flush_lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def model(self, tier: int) -> MeteredModel:
+        """Metered model client of a tier (created on first use)"""
+        with self._lock:
+            if tier not in self._models:
+                self._models[tier] = MeteredModel(self.model_factory(self.tiers[tier]), self, tier)
+            return self._models[tier]
+
+    def choose(self, task: str, input_tokens: int = 0, page_type: Optional[str] = None) -> int:
+        """
+        Starting tier for a task
+
+        Args:
+            task: "extract_text", "parse", "correct" or "field"
+            input_tokens: Estimated size of the task's input
+            page_type: Page classification label ("invoice", "scanned", "image")
+
+        Returns:
+            Tier index into self.tiers
+        """
+        last = len(self.tiers) - 1
+        tier = 0
+        if task == "extract_text" and page_type in self.HARD_PAGE_TYPES:
+            tier = 1
+        if task == "parse" and input_tokens > Config.ROUTER_LARGE_INPUT_TOKENS:
+            tier = 1
+
+        with self._lock:
+            outcomes = self._stats["tasks"].get(task, {})
+            while tier < last:
+                entry = outcomes.get(self.tiers[tier])
+                if not entry or entry["attempts"] < Config.ROUTER_MIN_SAMPLES:
+                    break
+                escalation_rate = entry["escalated"] / entry["attempts"]
+                confidence = entry["confidence_sum"] / entry["confidence_count"] if entry["confidence_count"] else 1.0
+                if escalation_rate <= Config.ROUTER_MAX_ESCALATION_RATE and confidence >= Config.ROUTER_MIN_CONFIDENCE:
+                    break
+                key = (task, self.tiers[tier])
+                self._skips[key] = self._skips.get(key, 0) + 1
+                if Config.ROUTER_PROBE_EVERY > 0 and self._skips[key] % Config.ROUTER_PROBE_EVERY == 0:
+                    print(f"[ROUTER] Probing skipped tier {self.tiers[tier]} for {task}")
+                    break
+                tier += 1
+        return min(tier, last)
+
+    def run(
+        self,
+        task: str,
+        call: Callable,
+        accept: Optional[Callable] = None,
+        input_tokens: int = 0,
+        page_type: Optional[str] = None
+    ):
+        """
+        Run a task, escalating to stronger tiers until its result is accepted
+
+        Args:
+            task: Task name (see choose)
+            call: Called with a tier's model; returns the task result
+            accept: Called with the result; returns (accepted, confidence or None).
+                Results are always accepted without it.
+            input_tokens: Estimated input size (for choose)
+            page_type: Page classification label (for choose)
+
+        Returns:
+            The accepted result, or the last tier's result
+        """
+        tier = self.choose(task, input_tokens, page_type)
+        last = len(self.tiers) - 1
+        while True:
+            start = time.perf_counter()
+            try:
+                result = call(self.model(tier))
+            except Exception as e:
+                self.record_task(task, tier, time.perf_counter() - start, escalated=tier < last, failed=True)
+                if tier >= last:
+                    raise
+                print(f"[ROUTER] {task} failed on {self.tiers[tier]} ({e}), escalating to {self.tiers[tier + 1]}")
+                tier += 1
+                continue
+
+            accepted, confidence = accept(result) if accept else (True, None)
+            escalate = not accepted and tier < last
+            self.record_task(task, tier, time.perf_counter() - start, escalated=escalate, confidence=confidence)
+            if not escalate:
+                print(f"[ROUTER] {task} done on {self.tiers[tier]}")
+                return result
+            print(f"[ROUTER] {task} not accepted on {self.tiers[tier]}, escalating to {self.tiers[tier + 1]}")
+            tier += 1
+
+    def record_call(self, tier: int, seconds: float, input_tokens: int, output_tokens: int, error: bool = False):
+        """Add one model call to the tier's statistics"""
+        price_in, price_out = self.prices[tier]
+        with self._lock:
+            entry = self._stats["tiers"].setdefault(self.tiers[tier], {
+                "calls": 0, "errors": 0, "input_tokens": 0, "output_tokens": 0, "cost_usd": 0.0, "latency_ms": 0.0,
+            })
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["input_tokens"] += input_tokens
+            entry["output_tokens"] += output_tokens
+            entry["cost_usd"] += (input_tokens * price_in + output_tokens * price_out) / 1_000_000
+            entry["latency_ms"] += seconds * 1000
+            self._dirty = True
+
+    def record_task(
+        self,
+        task: str,
+        tier: int,
+        seconds: float,
+        escalated: bool = False,
+        failed: bool = False,
+        confidence: Optional[float] = None
+    ):
+        """Add one task attempt to the tier's outcome statistics"""
+        with self._lock:
+            entry = self._stats["tasks"].setdefault(task, {}).setdefault(self.tiers[tier], {
+                "attempts": 0, "escalated": 0, "failed": 0, "confidence_sum": 0.0, "confidence_count": 0,
+                "latency_ms": 0.0,
+            })
+            entry["attempts"] += 1
+            entry["escalated"] += int(escalated)
+            entry["failed"] += int(failed)
+            if confidence is not None:
+                entry["confidence_sum"] += confidence
+                entry["confidence_count"] += 1
+            entry["latency_ms"] += seconds * 1000
+            if entry["attempts"] > Config.ROUTER_STATS_WINDOW:
+                # Decay old outcomes so a tier's record reflects recent attempts
+                for field in entry:
+                    entry[field] /= 2
+            self._dirty = True
+
+    def stats(self) -> dict:
+        """Per-tier call statistics and per-task outcomes, with derived rates"""
+        with self._lock:
+            tiers = {}
+            for name in self.tiers:
+                entry = dict(self._stats["tiers"].get(name, {}))
+                calls = entry.get("calls", 0)
+                if calls:
+                    entry["mean_latency_ms"] = round(entry["latency_ms"] / calls, 1)
+                    entry["cost_per_call_usd"] = entry["cost_usd"] / calls
+                tiers[name] = entry
+            tasks = {}
+            for task, outcomes in self._stats["tasks"].items():
+                tasks[task] = {}
+                for name, entry in outcomes.items():
+                    derived = dict(entry)
+                    derived["escalation_rate"] = round(entry["escalated"] / entry["attempts"], 3)
+                    derived["mean_latency_ms"] = round(entry["latency_ms"] / entry["attempts"], 1)
+                    if entry["confidence_count"]:
+                        derived["mean_confidence"] = round(entry["confidence_sum"] / entry["confidence_count"], 3)
+                    tasks[task][name] = derived
+        return {"tiers": tiers, "tasks": tasks, "order": list(self.tiers)}
+
+    def _load_stats(self) -> dict:
+        if self.stats_path and os.path.exists(self.stats_path):
+            try:
+                with open(self.stats_path, "r", encoding="utf-8") as f:
+                    stats = json.load(f)
+                return {"tiers": stats.get("tiers", {}), "tasks": stats.get("tasks", {})}
+            except (OSError, ValueError) as e:
+                print(f"[WARNING] Error loading model router stats: {e}")
+        return {"tiers": {}, "tasks": {}}
+
+    def flush(self):
+        """Write the statistics to ROUTER_STATS_PATH if they changed since the last write"""
+        if not self.stats_path:
+            return
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps(self._stats)
+                self._dirty = False
+            # Disk I/O happens outside the router lock so model calls are not held up
+            os.makedirs(os.path.dirname(self.stats_path) or ".", exist_ok=True)
+            tmp_path = f"{self.stats_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self.stats_path)
@@ -0,0 +1,187 @@
+import re
+import zlib
+from typing import List
+from PyPDF2 import PdfReader
+from models import PageClassification
+
+# Phrases typical of invoices and of the pages that travel with them
+_INVOICE_TERMS = (
+    "invoice", "tax invoice", "bill to", "ship to", "invoice no", "invoice number", "invoice date",
+    "due date", "subtotal", "sub total", "total", "amount due", "balance due", "qty", "quantity",
+    "unit price", "rate", "hsn", "sac", "gst", "vat", "tax", "po number", "purchase order",
+)
+_OTHER_TERMS = (
+    "terms and conditions", "terms & conditions", "dear", "sincerely", "regards", "cover letter",
+    "remittance advice", "remittance slip", "please detach", "intentionally left blank",
+    "privacy", "liability", "governing law", "warranty", "hereby", "shall",
+)
+_AMOUNT = re.compile(r"\d[\d,]*\.\d{2}\b")
+
+# Signals used to stitch continuation pages to the invoice they belong to
+_HEADER_LINES = 15
+_HEADER = re.compile(r"\b(invoice|bill\s+to|buyer)\b", re.I)
+_INVOICE_NUMBER = re.compile(
+    r"\binv(?:oice)?\.?\s*(?:no\.?|number|num|#)\s*[:#.]?\s*([A-Z0-9][A-Z0-9/()_-]*\d[A-Z0-9/()_-]*)", re.I
+)
+_FINAL_TOTAL = re.compile(
+    r"\b(grand\s+total|total\s+due|amount\s+due|balance\s+due|total\s+amount|invoice\s+total)\b"
+    r"|^\s*total\b[^\n]*\d[\d,]*\.\d{2}",
+    re.I | re.M,
+)
+_CONTINUES = re.compile(r"\b(continued|carried\s+forward|c/f|contd)\b(?!\s+from)", re.I)
+_CONTINUED_FROM = re.compile(r"\b(brought\s+forward|b/f|continued\s+from)\b", re.I)
+_PAGE_OF = re.compile(r"\bpage\s+(\d+)\s+of\s+(\d+)\b", re.I)
+
+
+def _count_terms(text: str, terms: tuple) -> int:
+    return sum(1 for term in terms if re.search(rf"\b{re.escape(term)}\b", text))
+
+
+class PageClassifier:
+    """
+    Cheap local page classifier run before any model call
+
+    Uses the PyPDF2 text layer (character count, invoice vs. non-invoice
+    keyword scores, count of money amounts) and the estimated entropy of
+    the page images (compressed bits per pixel). Pages are labelled:
+      - "blank": almost no text and no image detail
+      - "scanned": image-only page with content; only the model can read it
+      - "invoice": text layer that looks like an invoice
+      - "other": text layer that does not (cover letters, T&C, remittance)
+    The rules lean towards "invoice"/"scanned" so a real invoice is not
+    skipped.
+    """
+
+    BLANK_MAX_CHARS = 20
+    BLANK_MAX_ENTROPY = 0.05  # bits per pixel; a blank scan compresses to almost nothing
+    MIN_INVOICE_SCORE = 3
+
+    def classify_pdf(self, pdf_path: str) -> List[PageClassification]:
+        """Classify every page of a PDF"""
+        return [self.classify(page) for page in PdfReader(pdf_path).pages]
+
+    def classify(self, page) -> PageClassification:
+        """
+        Classify one PyPDF2 page
+
+        Args:
+            page: PyPDF2 PageObject
+
+        Returns:
+            PageClassification (its text field holds the text layer)
+        """
+        try:
+            text = page.extract_text() or ""
+        except Exception:
+            text = ""
+        text_chars = len("".join(text.split()))
+        entropy = self._image_entropy(page)
+
+        if text_chars <= self.BLANK_MAX_CHARS:
+            label = "blank" if entropy <= self.BLANK_MAX_ENTROPY else "scanned"
+            return PageClassification(label=label, text_chars=text_chars, image_entropy=entropy, text=text)
+
+        lowered = text.lower()
+        invoice_score = _count_terms(lowered, _INVOICE_TERMS) + min(len(_AMOUNT.findall(text)), 5)
+        other_score = _count_terms(lowered, _OTHER_TERMS)
+        label = "invoice" if invoice_score >= self.MIN_INVOICE_SCORE and invoice_score > other_score else "other"
+        return PageClassification(
+            label=label,
+            text_chars=text_chars,
+            image_entropy=entropy,
+            invoice_score=invoice_score,
+            other_score=other_score,
+            text=text,
+        )
+
+    def _image_entropy(self, page) -> float:
+        """
+        Estimate the information in a page's images as compressed bits per pixel
+
+        JPEG/JBIG2/CCITT streams are already entropy-coded and are measured
+        as stored; raw and Flate images are decoded and re-compressed.
+        Returns the maximum over the page's images (0.0 without images).
+        """
+        try:
+            xobjects = page["/Resources"]["/XObject"].get_object()
+        except (KeyError, TypeError):
+            return 0.0
+
+        best = 0.0
+        for name in xobjects:
+            image = xobjects[name].get_object()
+            if image.get("/Subtype") != "/Image":
+                continue
+            try:
+                pixels = int(image["/Width"]) * int(image["/Height"])
+                filters = image.get("/Filter")
+                filters = [filters] if isinstance(filters, str) else list(filters or [])
+                if any(f in ("/DCTDecode", "/JPXDecode", "/JBIG2Decode", "/CCITTFaxDecode") for f in filters):
+                    size = len(image._data)
+                else:
+                    size = len(zlib.compress(image.get_data(), 6))
+            except Exception:
+                continue
+            if pixels:
+                best = max(best, size * 8 / pixels)
+        return round(best, 4)
+
+
+def group_invoice_pages(pages: List[PageClassification]) -> List[List[int]]:
+    """
+    Group adjacent invoice pages into logical invoices
+
+    A page continues the invoice on the page before it when either page
+    says so ("continued", "carried/brought forward", "page 2 of 3"), or
+    when the invoice so far has no final total yet and the page either has
+    no header of its own or repeats the same invoice number. Complete
+    copies of one invoice (each with header and total) stay separate.
+    Pages that are not "invoice" (blank, other, scanned) are never grouped.
+
+    Args:
+        pages: Classifications of all pages of a PDF (with text)
+
+    Returns:
+        Page index groups, one per logical invoice, for the invoice and
+        scanned pages
+    """
+    groups = []
+    open_group = None  # (page indexes, invoice number, has final total)
+    for i, page in enumerate(pages):
+        if page.label != "invoice":
+            if page.label == "scanned":
+                groups.append([i])
+            open_group = None
+            continue
+
+        text = page.text
+        header = "\n".join(line for line in text.splitlines() if line.strip())
+        header = "\n".join(header.splitlines()[:_HEADER_LINES])
+        match = _INVOICE_NUMBER.search(text)
+        number = re.sub(r"\s", "", match.group(1)).upper() if match else None
+        page_of = _PAGE_OF.search(text)
+        has_total = bool(_FINAL_TOTAL.search(text))
+
+        continues = False
+        if open_group is not None:
+            indexes, group_number, group_total = open_group
+            previous = pages[indexes[-1]].text
+            previous_page_of = _PAGE_OF.search(previous)
+            if (_CONTINUED_FROM.search(text) or _CONTINUES.search(previous)
+                    or (page_of and int(page_of.group(1)) > 1)
+                    or (previous_page_of and int(previous_page_of.group(1)) < int(previous_page_of.group(2)))):
+                continues = not (number and group_number and number != group_number)
+            elif not group_total:
+                if number and group_number:
+                    continues = number == group_number
+                else:
+                    continues = not _HEADER.search(header) and not number
+
+        if continues:
+            indexes, group_number, _ = open_group
+            indexes.append(i)
+            open_group = (indexes, group_number or number, has_total)
+        else:
+            groups.append([i])
+            open_group = (groups[-1], number, has_total)
+    return groups
@@ -1,22 +1,37 @@
+import copy
 import os
-import google.generativeai as genai
+from typing import Callable, Optional
 from config import Config
+from tools.model_provider import create_model
 
 class PDFExtractor:
     """Tool for extracting text from PDF invoices"""
     
-    def __init__(self):
-        Config.validate()
-        genai.configure(api_key=Config.GOOGLE_API_KEY)
-        self.model = genai.GenerativeModel(Config.GEMINI_MODEL)
+    def __init__(self, model=None):
+        Config.validate(require_api_key=model is None)
+        self.model = model or create_model()
     
-    def extract_text(self, pdf_path: str, document_id: str) -> str:
+    def with_model(self, model) -> "PDFExtractor":
+        """Extractor that sends its requests to another model (None returns self)"""
+        if model is None or model is self.model:
+            return self
+        extractor = copy.copy(self)
+        extractor.model = model
+        return extractor
+    
+    def extract_text(
+        self,
+        pdf_path: str,
+        document_id: str,
+        on_text: Optional[Callable[[str], None]] = None
+    ) -> str:
         """
         Extract text from PDF and save to file
         
         Args:
             pdf_path: Path to the PDF file
             document_id: Unique identifier for this document
+            on_text: Stream the response and call this with each text chunk
             
         Returns:
             Extracted text content
@@ -39,11 +54,19 @@ class PDFExtractor:
         """
         
         # Send request to Gemini
-        response = self.model.generate_content(
-            [prompt, {"mime_type": "application/pdf", "data": pdf_data}]
-        )
-        
-        extracted_text = response.text
+        contents = [prompt, {"mime_type": "application/pdf", "data": pdf_data}]
+        if on_text is None:
+            extracted_text = self.model.generate_content(contents).text
+        else:
+            parts = []
+            for chunk in self.model.generate_content(contents, stream=True):
+                try:
+                    text = chunk.text
+                except ValueError:
+                    continue
+                parts.append(text)
+                on_text(text)
+            extracted_text = "".join(parts)
         
         # Save to file
         output_path = os.path.join(
@@ -0,0 +1,194 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional
+from config import Config
+
+
+class SchedulerSaturated(Exception):
+    """Raised when a priority class's queue is full"""
+
+    def __init__(self, priority: str, retry_after: int):
+        super().__init__(f"{priority} queue is full, retry after {retry_after}s")
+        self.priority = priority
+        self.retry_after = retry_after
+
+
+class _PriorityClass:
+    """Bounded FIFO queue and counters of one priority class"""
+
+    def __init__(self, name: str, weight: int, max_queue: int, max_active: int):
+        self.name = name
+        self.weight = max(1, weight)
+        self.max_queue = max_queue
+        self.max_active = max_active
+        self.queue = deque()
+        self.active = 0
+        self.credit = 0  # smooth weighted round-robin state
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.wait_ms = 0.0
+        self.service_ms = 0.0
+        self.service_ewma_ms: Optional[float] = None
+
+
+class RequestScheduler:
+    """
+    Admission control and weighted fair scheduling of blocking agent work
+
+    Jobs are submitted to a priority class ("interactive" for corrections and
+    field extraction, "bulk" for uploads), each with its own bounded queue.
+    A fixed pool of worker threads takes the next job from the non-empty
+    classes by smooth weighted round-robin, so interactive jobs get
+    SCHEDULER_INTERACTIVE_WEIGHT turns for every SCHEDULER_BULK_WEIGHT bulk
+    turn. Bulk jobs occupy at most SCHEDULER_BULK_MAX_ACTIVE workers, leaving
+    the rest free for interactive work behind a long batch. A submit to a
+    full queue raises SchedulerSaturated with a Retry-After estimate from the
+    queue depth and the class's recent service time.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        classes: Optional[Dict[str, dict]] = None
+    ):
+        """
+        Args:
+            workers: Worker threads (default SCHEDULER_WORKERS)
+            classes: {name: {"weight", "max_queue", "max_active"}} (default from config)
+        """
+        self.workers = max(1, workers or Config.SCHEDULER_WORKERS)
+        if classes is None:
+            classes = {
+                "interactive": {
+                    "weight": Config.SCHEDULER_INTERACTIVE_WEIGHT,
+                    "max_queue": Config.SCHEDULER_INTERACTIVE_QUEUE,
+                    "max_active": self.workers,
+                },
+                "bulk": {
+                    "weight": Config.SCHEDULER_BULK_WEIGHT,
+                    "max_queue": Config.SCHEDULER_BULK_QUEUE,
+                    "max_active": Config.SCHEDULER_BULK_MAX_ACTIVE,
+                },
+            }
+        self.classes = {
+            name: _PriorityClass(
+                name, spec.get("weight", 1), spec.get("max_queue", 0), min(spec.get("max_active", self.workers), self.workers)
+            )
+            for name, spec in classes.items()
+        }
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def submit(self, priority: str, fn: Callable, *args, **kwargs) -> Future:
+        """
+        Queue fn(*args, **kwargs) in a priority class
+
+        Args:
+            priority: Priority class name
+            fn: Blocking callable to run on a worker thread
+
+        Returns:
+            Future of fn's result
+
+        Raises:
+            SchedulerSaturated: The class's queue is full
+        """
+        if priority not in self.classes:
+            raise ValueError(f"Unknown priority class: {priority}")
+        cls = self.classes[priority]
+        future = Future()
+        with self._cond:
+            if len(cls.queue) >= cls.max_queue:
+                cls.rejected += 1
+                retry_after = self._retry_after(cls)
+                print(f"[SCHEDULER] {priority} queue full ({len(cls.queue)}), retry after {retry_after}s")
+                raise SchedulerSaturated(priority, retry_after)
+            cls.submitted += 1
+            cls.queue.append((future, fn, args, kwargs, time.perf_counter()))
+            self._start_workers()
+            self._cond.notify()
+        return future
+
+    def stats(self) -> dict:
+        """Queue depth, active jobs and latency per priority class"""
+        with self._cond:
+            classes = {}
+            for name, cls in self.classes.items():
+                finished = cls.completed + cls.failed
+                started = finished + cls.active
+                classes[name] = {
+                    "queued": len(cls.queue),
+                    "max_queue": cls.max_queue,
+                    "active": cls.active,
+                    "max_active": cls.max_active,
+                    "weight": cls.weight,
+                    "submitted": cls.submitted,
+                    "rejected": cls.rejected,
+                    "completed": cls.completed,
+                    "failed": cls.failed,
+                    "mean_wait_ms": round(cls.wait_ms / started, 1) if started else None,
+                    "mean_service_ms": round(cls.service_ms / finished, 1) if finished else None,
+                    "retry_after_s": self._retry_after(cls),
+                }
+            return {"workers": self.workers, "classes": classes}
+
+    def _retry_after(self, cls: _PriorityClass) -> int:
+        """Seconds until the class's queue has drained by about half"""
+        service_s = (cls.service_ewma_ms or 1000.0) / 1000
+        backlog = len(cls.queue) / 2 + cls.active
+        return max(1, math.ceil(backlog * service_s / max(1, cls.max_active)))
+
+    def _start_workers(self):
+        # Started on first submit so a pre-forked master does not own them
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"scheduler-{len(self._threads)}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _next(self) -> Optional[_PriorityClass]:
+        """Pick a class by smooth weighted round-robin among runnable classes"""
+        runnable = [cls for cls in self.classes.values() if cls.queue and cls.active < cls.max_active]
+        if not runnable:
+            return None
+        total = 0
+        for cls in runnable:
+            cls.credit += cls.weight
+            total += cls.weight
+        chosen = max(runnable, key=lambda cls: cls.credit)
+        chosen.credit -= total
+        return chosen
+
+    def _work(self):
+        while True:
+            with self._cond:
+                cls = self._next()
+                while cls is None:
+                    self._cond.wait()
+                    cls = self._next()
+                future, fn, args, kwargs, queued_at = cls.queue.popleft()
+                cls.active += 1
+                start = time.perf_counter()
+                cls.wait_ms += (start - queued_at) * 1000
+
+            failed = False
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except BaseException as e:
+                    failed = True
+                    future.set_exception(e)
+
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._cond:
+                cls.active -= 1
+                cls.failed += int(failed)
+                cls.completed += int(not failed)
+                cls.service_ms += elapsed_ms
+                cls.service_ewma_ms = elapsed_ms if cls.service_ewma_ms is None else 0.8 * cls.service_ewma_ms + 0.2 * elapsed_ms
+                # A finished job may make another class runnable
+                self._cond.notify_all()
@@ -0,0 +1,107 @@
+from typing import Optional, Type
+from pydantic import BaseModel
+from models import InvoiceData, InvoiceMetadata, LineItem
+
+# Keys of the OpenAPI schema subset accepted for response_schema
+_SCHEMA_KEYS = ("description", "enum", "format")
+
+
+def response_schema(model_cls: Type[BaseModel], partial: bool = False) -> dict:
+    """
+    Build a response schema for schema-constrained generation from a pydantic model
+
+    Args:
+        model_cls: Pydantic model describing the expected JSON
+        partial: Drop "required" everywhere (for delta/partial responses)
+
+    Returns:
+        Schema dict (type/properties/items/nullable/required/description)
+    """
+    schema = model_cls.model_json_schema()
+    return _convert(schema, schema.get("$defs", {}), partial)
+
+
+def field_schema(field_name: str) -> Optional[dict]:
+    """
+    Build a response schema for extracting a single named field
+
+    Args:
+        field_name: Invoice field requested by the user
+
+    Returns:
+        Object schema with that field as its only property, or None if the
+        name is empty
+    """
+    if not field_name or not field_name.strip():
+        return None
+
+    if field_name in InvoiceMetadata.model_fields:
+        prop = response_schema(InvoiceMetadata)["properties"][field_name]
+    elif field_name == "line_items":
+        prop = response_schema(InvoiceData)["properties"]["line_items"]
+    elif field_name in LineItem.model_fields:
+        # A line-item attribute is requested for every line
+        prop = {"type": "array", "items": response_schema(LineItem)["properties"][field_name]}
+    else:
+        prop = {"type": "string", "nullable": True}
+
+    return {"type": "object", "properties": {field_name: prop}, "required": [field_name]}
+
+
+def patch_schema() -> dict:
+    """
+    Build a response schema for patch-based corrections
+
+    Scalar values travel as strings (pydantic coerces them back to numbers);
+    whole line items use "item" so they stay schema-constrained.
+
+    Returns:
+        Object schema {"ops": [{"op", "path", "value", "item"}]}
+    """
+    op = {
+        "type": "object",
+        "properties": {
+            "op": {"type": "string", "enum": ["add", "replace", "remove"]},
+            "path": {"type": "string", "description": "JSON pointer, e.g. /metadata/po_number or /line_items/3/amount"},
+            "value": {"type": "string", "nullable": True, "description": "New scalar value"},
+            "item": dict(response_schema(LineItem, partial=True), nullable=True,
+                         description="New line item for /line_items/- or /line_items/<index>"),
+        },
+        "required": ["op", "path"],
+    }
+    return {"type": "object", "properties": {"ops": {"type": "array", "items": op}}, "required": ["ops"]}
+
+
+def _convert(node: dict, defs: dict, partial: bool) -> dict:
+    """Convert a JSON Schema node into the response_schema subset"""
+    if "$ref" in node:
+        converted = _convert(defs[node["$ref"].split("/")[-1]], defs, partial)
+        if "description" in node:
+            converted["description"] = node["description"]
+        return converted
+
+    if "anyOf" in node:
+        options = [option for option in node["anyOf"] if option.get("type") != "null"]
+        converted = _convert(options[0], defs, partial)
+        if len(options) < len(node["anyOf"]):
+            converted["nullable"] = True
+        if "description" in node:
+            converted["description"] = node["description"]
+        return converted
+
+    converted = {"type": node.get("type", "string")}
+    for key in _SCHEMA_KEYS:
+        if key in node:
+            converted[key] = node[key]
+
+    if converted["type"] == "object":
+        converted["properties"] = {
+            name: _convert(prop, defs, partial)
+            for name, prop in node.get("properties", {}).items()
+        }
+        if node.get("required") and not partial:
+            converted["required"] = list(node["required"])
+    elif converted["type"] == "array" and "items" in node:
+        converted["items"] = _convert(node["items"], defs, partial)
+
+    return converted
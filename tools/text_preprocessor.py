@@ -0,0 +1,91 @@
+import re
+from collections import Counter
+from typing import List
+
+# Explicit page separators produced by extraction (form feeds or marker lines)
+_PAGE_BREAK = re.compile(r"\f|^\s*-{2,}\s*page\s+\d+\s*-{2,}\s*$", re.IGNORECASE | re.MULTILINE)
+# Needs the "page" prefix: a bare "03/2024" or "1/2" line is a date or quantity
+_PAGE_NUMBER = re.compile(r"^\s*page\s+\d+\s*(of|/)\s*\d+\s*$", re.IGNORECASE)
+_HORIZONTAL_RUN = re.compile(r"[ \t]{2,}")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+# Lines at the top/bottom of each page considered for header/footer detection
+_EDGE_LINES = 3
+
+
+def compact_text(text: str) -> str:
+    """
+    Shrink extracted invoice text before it is sent to the model
+
+    - Drops "Page N of M" lines and headers/footers repeated across pages
+    - Strips indentation and trailing whitespace
+    - Collapses runs of layout spaces into a single tab (keeps column breaks)
+    - Collapses multiple blank lines into one
+
+    Headers and footers are only recognised when the text carries explicit
+    page breaks (form feeds or "--- Page N ---" lines). PDFExtractor returns
+    one text per request without them, so an extracted multi-page PDF is
+    treated as a single page and only loses whitespace and page numbers.
+
+    Args:
+        text: Extracted text
+
+    Returns:
+        Compacted text
+    """
+    pages = _split_pages(text.replace("\r\n", "\n").replace("\r", "\n"))
+    pages = _remove_repeated_edges(pages)
+
+    lines = []
+    for page in pages:
+        for line in page:
+            if _PAGE_NUMBER.match(line):
+                continue
+            lines.append(_HORIZONTAL_RUN.sub("\t", line.strip()))
+        lines.append("")
+
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate the number of input tokens for text
+
+    Uses the common ~4 characters per token heuristic, which is close enough
+    to compare prompt variants without a tokenizer round trip.
+    """
+    return (len(text) + 3) // 4
+
+
+def _split_pages(text: str) -> List[List[str]]:
+    """Split text into pages (lists of lines) on explicit page breaks"""
+    return [page.split("\n") for page in _PAGE_BREAK.split(text)]
+
+
+def _remove_repeated_edges(pages: List[List[str]]) -> List[List[str]]:
+    """Keep only the first occurrence of header/footer lines repeated across pages"""
+    if len(pages) < 2:
+        return pages
+
+    def key(line: str) -> str:
+        # Page-number lines are dropped separately, so compare text exactly
+        return " ".join(line.split()).lower()
+
+    seen_on_pages = Counter()
+    for page in pages:
+        content = [line for line in page if line.strip()]
+        edges = content[:_EDGE_LINES] + content[-_EDGE_LINES:]
+        seen_on_pages.update({key(line) for line in edges})
+
+    threshold = max(2, (len(pages) + 1) // 2)
+    repeated = {k for k, count in seen_on_pages.items() if count >= threshold}
+
+    result = [pages[0]]
+    for page in pages[1:]:
+        content_idx = [i for i, line in enumerate(page) if line.strip()]
+        edge_idx = set(content_idx[:_EDGE_LINES] + content_idx[-_EDGE_LINES:])
+        result.append([
+            line for i, line in enumerate(page)
+            if not (i in edge_idx and key(line) in repeated)
+        ])
+    return result
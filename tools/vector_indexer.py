@@ -1,13 +1,51 @@
+import os
+import re
+import threading
+import time
 import chromadb
 from chromadb.config import Settings
+from chromadb.utils import embedding_functions
 from config import Config
+from tools.bm25_index import BM25Index, reciprocal_rank_fusion
+from tools.date_parsing import parse_date
+from tools.document_store import DocumentStore
+from typing import Optional
 import uuid
 
+# Tenant ids are used verbatim in collection and file names
+_TENANT_ID = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def date_key(value: Optional[str]) -> Optional[int]:
+    """
+    Convert an invoice date string to a sortable YYYYMMDD integer
+    
+    Args:
+        value: Date string in any common invoice layout
+        
+    Returns:
+        Integer date key, or None if the date cannot be parsed
+    """
+    parsed = parse_date(value)
+    if parsed is None:
+        return None
+    return parsed.year * 10000 + parsed.month * 100 + parsed.day
+
 class VectorIndexer:
     """Tool for indexing and embedding extracted text"""
     
-    def __init__(self):
-        Config.validate()
+    CHUNK_SIZE = 1000
+    CHUNK_OVERLAP = 200
+    
+    def __init__(self, embedding_function=None, tenant_id: Optional[str] = None):
+        Config.validate(require_api_key=False)
+        
+        # One collection (and lexical index / text store) per tenant when set
+        self.tenant_id = tenant_id if tenant_id is not None else Config.TENANT_ID
+        self.collection_name = self.collection_name_for(self.tenant_id)
+        suffix = f"_{self.tenant_id}" if self.tenant_id else ""
+        
+        # Embeddings are computed here so chunk text need not be stored in Chroma
+        self.embedding_function = embedding_function or self.default_embedding_function()
         
         # Initialize ChromaDB client
         self.client = chromadb.PersistentClient(
@@ -15,19 +53,66 @@ class VectorIndexer:
             settings=Settings(anonymized_telemetry=False)
         )
         
+        # Held by every collection operation and for the whole of compact(),
+        # so no thread uses a collection while it is being swapped
+        self._lock = threading.RLock()
+        self._recover_compaction()
+        
         # Get or create collection
         self.collection = self.client.get_or_create_collection(
-            name=Config.COLLECTION_NAME,
-            metadata={"description": "Invoice document embeddings"}
+            name=self.collection_name,
+            metadata={"description": "Invoice document embeddings"},
+            embedding_function=self.embedding_function
+        )
+        
+        # Canonical text lives in the document store; chunks keep offsets into it
+        self.document_store = DocumentStore(
+            os.path.join(Config.DOCUMENT_STORE_DIR, suffix.lstrip("_")) if suffix else None
         )
+        
+        # Lexical index kept next to the collection for exact-token matches
+        bm25_path = Config.BM25_INDEX_PATH
+        if suffix:
+            root, ext = os.path.splitext(bm25_path)
+            bm25_path = f"{root}{suffix}{ext}"
+        self.bm25_index = BM25Index(bm25_path) if Config.HYBRID_SEARCH else None
     
-    def index_document(self, document_id: str, text_content: str) -> str:
+    @staticmethod
+    def collection_name_for(tenant_id: Optional[str]) -> str:
+        """
+        Collection name of a tenant
+        
+        Raises:
+            ValueError: If the tenant id has characters other than letters,
+                digits, "_" and "-" (rewriting them could map two tenants
+                to one collection)
+        """
+        if not tenant_id:
+            return Config.COLLECTION_NAME
+        if not _TENANT_ID.match(tenant_id):
+            raise ValueError(f"Invalid tenant id {tenant_id!r}: use 1-64 letters, digits, '_' or '-'")
+        return f"{Config.COLLECTION_NAME}_{tenant_id}"
+    
+    def tenant_exists(self, tenant_id: Optional[str]) -> bool:
+        """Whether a tenant's collection has been created (in this indexer's database)"""
+        return self._has_collection(self.collection_name_for(tenant_id))
+    
+    @staticmethod
+    def default_embedding_function():
+        """Embedding function used when none is supplied (offline hashing with the fake backend)"""
+        if Config.MODEL_BACKEND == "fake":
+            from tools.fake_model import FakeEmbeddingFunction
+            return FakeEmbeddingFunction()
+        return embedding_functions.DefaultEmbeddingFunction()
+    
+    def index_document(self, document_id: str, text_content: str, session: Optional[str] = None) -> str:
         """
         Index document text into vector database
         
         Args:
             document_id: Unique identifier for the document
             text_content: Extracted text content
+            session: Session label used by retention policies (e.g. "sample")
             
         Returns:
             Document ID that was indexed
@@ -35,36 +120,79 @@ class VectorIndexer:
         print(f"[INDEX] Indexing document: {document_id}")
         
         # Split text into chunks for better embedding
-        chunks = self._chunk_text(text_content)
+        spans = self._chunk_spans(text_content)
         
-        # Prepare data for indexing
-        chunk_ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
-        metadatas = [
-            {
-                "document_id": document_id,
-                "chunk_index": i,
-                "chunk_count": len(chunks)
-            }
-            for i in range(len(chunks))
-        ]
+        # Replace any previous version of this document
+        with self._lock:
+            self.collection.delete(where={"document_id": document_id})
+        self.document_store.put(document_id, text_content)
         
-        print("**********",chunks)
-        print("**********",metadatas)
-        print("**********",chunk_ids)
-        # Add to collection
-        self.collection.add(
-            documents=chunks,
-            metadatas=metadatas,
-            ids=chunk_ids
-        )
+        self._add_chunks(document_id, text_content, spans, 0, int(time.time()), session, len(spans))
         
-        print(f"[SUCCESS] Indexed {len(chunks)} chunks for document {document_id}")
+        print(f"[SUCCESS] Indexed {len(spans)} chunks for document {document_id}")
         return document_id
     
+    def open_stream(self, document_id: str, session: Optional[str] = None) -> "IndexStream":
+        """
+        Start indexing a document whose text is still being generated
+        
+        Args:
+            document_id: Unique identifier for the document
+            session: Session label used by retention policies
+            
+        Returns:
+            IndexStream to feed text into and close when generation ends
+        """
+        return IndexStream(self, document_id, session)
+    
+    def _add_chunks(
+        self,
+        document_id: str,
+        text: str,
+        spans: list,
+        first_index: int,
+        indexed_at: int,
+        session: Optional[str],
+        chunk_count: Optional[int] = None
+    ):
+        """Embed chunk spans of text and add them to the collection and lexical index"""
+        if not spans:
+            return
+        
+        chunks = [text[start:end] for start, end in spans]
+        chunk_ids = [f"{document_id}_chunk_{first_index + i}" for i in range(len(chunks))]
+        metadatas = []
+        for i, (start, end) in enumerate(spans):
+            meta = {
+                "document_id": document_id,
+                "chunk_index": first_index + i,
+                "start": start,
+                "end": end,
+                "indexed_at": indexed_at,
+                "session": session or "default"
+            }
+            if chunk_count is not None:
+                meta["chunk_count"] = chunk_count
+            metadatas.append(meta)
+        
+        # Add embeddings and offsets only; text is resolved from the store
+        embeddings = self.embedding_function(chunks)
+        with self._lock:
+            self.collection.add(
+                embeddings=embeddings,
+                metadatas=metadatas,
+                ids=chunk_ids
+            )
+            if self.bm25_index is not None:
+                self.bm25_index.add_chunks(document_id, chunk_ids, chunks, replace=first_index == 0)
+    
     def query_document(self, document_id: str, query: str, n_results: int = 5) -> list:
         """
         Query specific document for relevant chunks
         
+        Vector hits are fused with BM25 hits (reciprocal-rank fusion) so that
+        exact tokens such as PO numbers or tax IDs rank highly.
+        
         Args:
             document_id: Document to query
             query: Search query
@@ -73,44 +201,463 @@ class VectorIndexer:
         Returns:
             List of relevant text chunks
         """
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=n_results,
-            where={"document_id": document_id}
-        )
+        if self.bm25_index is None:
+            with self._lock:
+                results = self.collection.query(
+                    query_texts=[query],
+                    n_results=n_results,
+                    where={"document_id": document_id}
+                )
+            
+            if results and results['ids']:
+                return self._resolve_texts(results['documents'][0], results['metadatas'][0])
+            return []
+        
+        # Over-fetch candidates from both retrievers before fusing
+        candidates = max(n_results * 2, 10)
+        with self._lock:
+            results = self.collection.query(
+                query_texts=[query],
+                n_results=candidates,
+                where={"document_id": document_id}
+            )
+        texts = {}
+        vector_ranking = []
+        if results and results['ids']:
+            vector_ranking = results['ids'][0]
+            texts.update(zip(
+                results['ids'][0],
+                self._resolve_texts(results['documents'][0], results['metadatas'][0])
+            ))
+        
+        lexical_ranking = [
+            chunk_id for chunk_id, _ in self.bm25_index.query(query, candidates, document_id=document_id)
+        ]
+        
+        fused = reciprocal_rank_fusion([vector_ranking, lexical_ranking], k=Config.RRF_K)[:n_results]
+        
+        # Fetch text for chunks that only the lexical index returned
+        missing = [chunk_id for chunk_id in fused if chunk_id not in texts]
+        if missing:
+            with self._lock:
+                fetched = self.collection.get(ids=missing)
+            texts.update(zip(fetched['ids'], self._resolve_texts(fetched['documents'], fetched['metadatas'])))
+        
+        return [texts[chunk_id] for chunk_id in fused if chunk_id in texts]
+    
+    def update_document_metadata(self, document_id: str, metadata: dict) -> int:
+        """
+        Denormalize invoice/vendor metadata into every chunk of a document
+        
+        Args:
+            document_id: Document whose chunks are updated
+            metadata: Fields to merge into chunk metadata (None removes a field,
+                so a value cleared by a correction no longer matches filters)
+            
+        Returns:
+            Number of chunks updated
+        """
+        with self._lock:
+            existing = self.collection.get(where={"document_id": document_id}, include=["metadatas"])
+            if not existing or not existing['ids']:
+                return 0
+            
+            self.collection.update(
+                ids=existing['ids'],
+                # Chroma merges update metadata into the stored one and deletes None keys
+                metadatas=[{**chunk_meta, **metadata} for chunk_meta in existing['metadatas']]
+            )
+        return len(existing['ids'])
+    
+    def search(
+        self,
+        query: str,
+        vendor_id: Optional[str] = None,
+        currency: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        top_k: int = 10,
+        offset: int = 0
+    ) -> dict:
+        """
+        Search chunks across the whole corpus with metadata filters
+        
+        Args:
+            query: Search query
+            vendor_id: Only chunks of invoices from this vendor
+            currency: Only chunks of invoices in this currency
+            date_from: Earliest invoice date (inclusive)
+            date_to: Latest invoice date (inclusive)
+            top_k: Page size
+            offset: Number of ranked hits to skip
+            
+        Returns:
+            Dictionary with the page of hits and pagination info
+        """
+        where = self._build_where(vendor_id, currency, date_from, date_to)
+        candidates = offset + top_k + 1
+        
+        with self._lock:
+            results = self.collection.query(
+                query_texts=[query],
+                n_results=candidates,
+                where=where
+            )
+        hits = {}
+        vector_ranking = []
+        if results and results['ids']:
+            vector_ranking = results['ids'][0]
+            texts = self._resolve_texts(results['documents'][0], results['metadatas'][0])
+            for chunk_id, text, meta in zip(results['ids'][0], texts, results['metadatas'][0]):
+                hits[chunk_id] = (text, meta)
+        
+        rankings = [vector_ranking]
+        if self.bm25_index is not None:
+            lexical_ids = [chunk_id for chunk_id, _ in self.bm25_index.query(query, candidates * 5)]
+            if lexical_ids:
+                # Apply the same metadata filter to lexical candidates
+                with self._lock:
+                    fetched = self.collection.get(ids=lexical_ids, where=where)
+                allowed = set(fetched['ids'])
+                texts = self._resolve_texts(fetched['documents'], fetched['metadatas'])
+                for chunk_id, text, meta in zip(fetched['ids'], texts, fetched['metadatas']):
+                    hits.setdefault(chunk_id, (text, meta))
+                rankings.append([chunk_id for chunk_id in lexical_ids if chunk_id in allowed])
+        
+        fused = reciprocal_rank_fusion(rankings, k=Config.RRF_K)
+        page = fused[offset:offset + top_k]
+        
+        return {
+            "results": [
+                {
+                    "chunk_id": chunk_id,
+                    "document_id": hits[chunk_id][1].get("document_id"),
+                    "text": hits[chunk_id][0],
+                    "metadata": hits[chunk_id][1],
+                }
+                for chunk_id in page
+            ],
+            "offset": offset,
+            "top_k": top_k,
+            "has_more": len(fused) > offset + top_k,
+        }
+    
+    def _build_where(
+        self,
+        vendor_id: Optional[str],
+        currency: Optional[str],
+        date_from: Optional[str],
+        date_to: Optional[str]
+    ) -> Optional[dict]:
+        """Build a Chroma metadata filter from search parameters"""
+        conditions = []
+        if vendor_id:
+            conditions.append({"vendor_id": vendor_id})
+        if currency:
+            conditions.append({"currency": currency.upper()})
+        for value, op in ((date_from, "$gte"), (date_to, "$lte")):
+            if value:
+                key = date_key(value)
+                if key is None:
+                    raise ValueError(f"Unrecognized date: {value}")
+                conditions.append({"invoice_date_key": {op: key}})
+        
+        if not conditions:
+            return None
+        if len(conditions) == 1:
+            return conditions[0]
+        return {"$and": conditions}
+    
+    def delete_documents(self, document_ids: list) -> int:
+        """
+        Delete whole documents from the collection, lexical index and text store
+        
+        Args:
+            document_ids: Documents to delete
+            
+        Returns:
+            Number of documents deleted
+        """
+        for document_id in document_ids:
+            with self._lock:
+                self.collection.delete(where={"document_id": document_id})
+                if self.bm25_index is not None:
+                    self.bm25_index.remove_document(document_id)
+            self.document_store.delete(document_id)
+        
+        if document_ids:
+            print(f"[DELETE] Removed {len(document_ids)} documents from index")
+        return len(document_ids)
+    
+    def list_documents(self, batch_size: int = 5000) -> dict:
+        """
+        Summarize indexed documents from chunk metadata
+        
+        Args:
+            batch_size: Chunks fetched per round trip
+            
+        Returns:
+            Dictionary of document_id -> {"indexed_at", "session", "chunks"}
+        """
+        documents = {}
+        offset = 0
+        while True:
+            with self._lock:
+                batch = self.collection.get(include=["metadatas"], limit=batch_size, offset=offset)
+            if not batch['ids']:
+                break
+            for meta in batch['metadatas']:
+                document_id = meta.get("document_id")
+                entry = documents.setdefault(document_id, {
+                    "indexed_at": meta.get("indexed_at"),
+                    "session": meta.get("session") or self._infer_session(document_id),
+                    "chunks": 0,
+                })
+                entry["chunks"] += 1
+            offset += len(batch['ids'])
+        return documents
+    
+    def apply_retention(
+        self,
+        max_age_days: Optional[float] = None,
+        session: Optional[str] = None,
+        session_max_age_hours: Optional[float] = None
+    ) -> list:
+        """
+        Delete documents that fall outside the retention policy
+        
+        Args:
+            max_age_days: Delete any document older than this (default: Config)
+            session: Session label with its own, shorter retention (default: "sample")
+            session_max_age_hours: Retention for that session (default: Config)
+            
+        Returns:
+            List of deleted document IDs
+        """
+        max_age_days = Config.INDEX_RETENTION_DAYS if max_age_days is None else max_age_days
+        session = session or "sample"
+        if session_max_age_hours is None:
+            session_max_age_hours = Config.SAMPLE_RETENTION_HOURS
+        
+        now = time.time()
+        expired = []
+        for document_id, info in self.list_documents().items():
+            # Legacy chunks without a timestamp count as infinitely old
+            age = now - info["indexed_at"] if info["indexed_at"] is not None else float("inf")
+            if max_age_days is not None and age > max_age_days * 86400:
+                expired.append(document_id)
+            elif (session_max_age_hours is not None and info["session"] == session
+                  and age > session_max_age_hours * 3600):
+                expired.append(document_id)
+        
+        self.delete_documents(expired)
+        return expired
+    
+    def compact(self, batch_size: int = 1000) -> int:
+        """
+        Rebuild the collection so deleted vectors are dropped from the HNSW graph
+        
+        The copy is built and checked before anything is dropped, and the
+        live collection is only renamed aside ("__old") until the copy has
+        taken its name, so a crash at any point leaves a complete index
+        (see _recover_compaction). Indexing and queries wait for the swap.
+        
+        Args:
+            batch_size: Chunks copied per round trip
+            
+        Returns:
+            Number of chunks in the compacted collection
+        """
+        print(f"[COMPACT] Rebuilding collection: {self.collection_name}")
+        temp_name = f"{self.collection_name}__compact"
+        old_name = f"{self.collection_name}__old"
+        with self._lock:
+            self._drop_collection(temp_name)
+            compacted = self.client.create_collection(
+                name=temp_name,
+                metadata=self.collection.metadata,
+                embedding_function=self.embedding_function
+            )
+            
+            offset = 0
+            while True:
+                batch = self.collection.get(
+                    include=["embeddings", "metadatas", "documents"],
+                    limit=batch_size,
+                    offset=offset
+                )
+                if not batch['ids']:
+                    break
+                compacted.add(
+                    ids=batch['ids'],
+                    embeddings=batch['embeddings'],
+                    metadatas=batch['metadatas'],
+                    documents=batch['documents'] if any(d is not None for d in batch['documents']) else None
+                )
+                offset += len(batch['ids'])
+            
+            live_count = self.collection.count()
+            if compacted.count() != offset or live_count != offset:
+                self._drop_collection(temp_name)
+                raise RuntimeError(
+                    f"Compaction copied {compacted.count()} of {live_count} chunks; live collection kept"
+                )
+            
+            self._drop_collection(old_name)
+            self.collection.modify(name=old_name)
+            compacted.modify(name=self.collection_name)
+            self.collection = self.client.get_collection(
+                name=self.collection_name,
+                embedding_function=self.embedding_function
+            )
+            self._drop_collection(old_name)
+            if self.bm25_index is not None:
+                self.bm25_index.vacuum()
         
-        if results and results['documents']:
-            return results['documents'][0]
-        return []
+        print(f"[SUCCESS] Compacted collection to {offset} chunks")
+        return offset
+    
+    def _recover_compaction(self):
+        """Finish or undo a compaction swap interrupted by a crash"""
+        old_name = f"{self.collection_name}__old"
+        if not self._has_collection(old_name):
+            return
+        if self._has_collection(self.collection_name):
+            # The copy took the live name; only the old collection is left to drop
+            self._drop_collection(old_name)
+        else:
+            print(f"[COMPACT] Restoring {self.collection_name} after an interrupted compaction")
+            self.client.get_collection(old_name).modify(name=self.collection_name)
+    
+    def _has_collection(self, name: str) -> bool:
+        try:
+            self.client.get_collection(name)
+            return True
+        except Exception:
+            return False
+    
+    def _drop_collection(self, name: str):
+        try:
+            self.client.delete_collection(name)
+        except Exception:
+            pass
+    
+    def _count(self) -> int:
+        with self._lock:
+            return self.collection.count()
+    
+    def stats(self) -> dict:
+        """
+        Report collection size and storage statistics
+        
+        Returns:
+            Dictionary of counts, sessions, ages and on-disk sizes
+        """
+        documents = self.list_documents()
+        timestamps = [d["indexed_at"] for d in documents.values() if d["indexed_at"] is not None]
+        sessions = {}
+        for info in documents.values():
+            sessions[info["session"]] = sessions.get(info["session"], 0) + 1
+        
+        return {
+            "collection": self.collection_name,
+            "tenant_id": self.tenant_id,
+            "chunks": self._count(),
+            "documents": len(documents),
+            "sessions": sessions,
+            "oldest_indexed_at": min(timestamps) if timestamps else None,
+            "newest_indexed_at": max(timestamps) if timestamps else None,
+            "disk_bytes": {
+                "vector_db": self._dir_size(Config.VECTOR_DB_DIR),
+                "document_store": self._dir_size(self.document_store.root),
+                "bm25_index": os.path.getsize(self.bm25_index.path) if self.bm25_index else 0,
+            },
+        }
+    
+    def _infer_session(self, document_id: Optional[str]) -> str:
+        """Session label for chunks indexed before sessions were recorded"""
+        if document_id and document_id.startswith("SAMPLE-"):
+            return "sample"
+        return "default"
+    
+    def _dir_size(self, path: str) -> int:
+        """Total size of files under a directory"""
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+        return total
     
     def get_full_document(self, document_id: str) -> str:
         """
-        Retrieve full document text from chunks
+        Retrieve full document text
         
         Args:
             document_id: Document ID to retrieve
             
         Returns:
-            Full reconstructed text
+            Exact original text
         """
-        # Get all chunks for this document
-        results = self.collection.get(
-            where={"document_id": document_id}
-        )
+        text = self.document_store.get(document_id)
+        if text is not None:
+            return text
+        
+        # Documents indexed before the document store existed
+        extracted_path = os.path.join(Config.EXTRACTED_TEXT_DIR, f"{document_id}_extracted.txt")
+        if os.path.exists(extracted_path):
+            with open(extracted_path, "r", encoding="utf-8") as f:
+                return f.read()
+        
+        with self._lock:
+            results = self.collection.get(
+                where={"document_id": document_id}
+            )
         
         if not results or not results['documents']:
             return ""
         
-        # Sort by chunk index and reconstruct
-        chunks_with_index = list(zip(
-            results['documents'],
-            results['metadatas']
-        ))
-        chunks_with_index.sort(key=lambda x: x[1]['chunk_index'])
+        # Sort by chunk index and stitch, dropping the overlap between chunks
+        chunks_with_index = sorted(
+            zip(results['documents'], results['metadatas']),
+            key=lambda x: x[1]['chunk_index']
+        )
+        text = ""
+        for chunk, _ in chunks_with_index:
+            chunk = chunk or ""
+            overlap = next(
+                (k for k in range(min(len(text), len(chunk)), 0, -1) if text.endswith(chunk[:k])),
+                0
+            )
+            text += chunk[overlap:]
+        return text
+    
+    def get_document_range(self, document_id: str, start: int, end: int) -> Optional[str]:
+        """
+        Retrieve a character range of a document without loading all of it
         
-        return "\n".join([chunk[0] for chunk in chunks_with_index])
+        Args:
+            document_id: Document ID
+            start: First character offset (inclusive)
+            end: Last character offset (exclusive)
+            
+        Returns:
+            Text in the range, or None if the document is not stored
+        """
+        return self.document_store.get_range(document_id, start, end)
+    
+    def _resolve_texts(self, documents: list, metadatas: list) -> list:
+        """Return chunk texts, slicing them from the document store by offset"""
+        texts = []
+        for document, meta in zip(documents or [None] * len(metadatas), metadatas):
+            if document is None and meta and "start" in meta:
+                document = self.document_store.get_range(meta["document_id"], meta["start"], meta["end"])
+            texts.append(document or "")
+        return texts
     
-    def _chunk_text(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> list:
+    def _chunk_text(self, text: str, chunk_size: int = CHUNK_SIZE, overlap: int = CHUNK_OVERLAP) -> list:
         """
         Split text into overlapping chunks
         
@@ -122,28 +669,103 @@ class VectorIndexer:
         Returns:
             List of text chunks
         """
-        if len(text) <= chunk_size:
-            return [text]
+        return [text[start:end] for start, end in self._chunk_spans(text, chunk_size, overlap)]
+    
+    def _chunk_spans(
+        self,
+        text: str,
+        chunk_size: int = CHUNK_SIZE,
+        overlap: int = CHUNK_OVERLAP,
+        start: int = 0,
+        final: bool = True
+    ) -> list:
+        """
+        Compute overlapping chunk boundaries
         
-        chunks = []
-        start = 0
+        Args:
+            text: Text to chunk
+            chunk_size: Size of each chunk in characters
+            overlap: Overlap between chunks
+            start: Offset of the first chunk
+            final: False while text may still grow; only chunks whose
+                boundaries can no longer change are returned
+            
+        Returns:
+            List of (start, end) character offsets
+        """
+        if final and start == 0 and len(text) <= chunk_size:
+            return [(0, len(text))]
+        
+        spans = []
         
         while start < len(text):
             end = start + chunk_size
-            chunk = text[start:end]
             
             # Try to break at sentence or word boundary
             if end < len(text):
+                chunk = text[start:end]
                 last_period = chunk.rfind('.')
                 last_newline = chunk.rfind('\n')
                 last_space = chunk.rfind(' ')
                 
                 break_point = max(last_period, last_newline, last_space)
                 if break_point > chunk_size * 0.7:  # Only if reasonable
-                    chunk = text[start:start + break_point + 1]
                     end = start + break_point + 1
+            elif not final:
+                break
             
-            chunks.append(chunk)
+            spans.append((start, min(end, len(text))))
+            if end >= len(text):
+                break
             start = end - overlap
         
-        return chunks
\ No newline at end of file
+        return spans
+
+
+class IndexStream:
+    """
+    Indexes a document chunk by chunk while its text is still arriving
+    
+    The text received so far is stored before each batch of chunks is
+    added, so search hits on a stream that is still open (or that failed
+    before close) resolve to the text those chunks were cut from.
+    """
+    
+    def __init__(self, indexer: VectorIndexer, document_id: str, session: Optional[str] = None):
+        self.indexer = indexer
+        self.document_id = document_id
+        self.session = session
+        self.text = ""
+        self.chunk_count = 0
+        self._next_start = 0
+        self._indexed_at = int(time.time())
+        
+        # Replace any previous version of this document
+        with indexer._lock:
+            indexer.collection.delete(where={"document_id": document_id})
+        indexer.document_store.delete(document_id)
+        print(f"[INDEX] Streaming index for document: {document_id}")
+    
+    def feed(self, text: str):
+        """Append generated text and index every chunk that is now final"""
+        self.text += text
+        self._index(self.indexer._chunk_spans(self.text, start=self._next_start, final=False))
+    
+    def close(self) -> str:
+        """Index the remaining text and store the full document"""
+        self._index(self.indexer._chunk_spans(self.text, start=self._next_start, final=True))
+        if self.indexer.document_store.length(self.document_id) != len(self.text):
+            self.indexer.document_store.put(self.document_id, self.text)
+        self.indexer.update_document_metadata(self.document_id, {"chunk_count": self.chunk_count})
+        print(f"[SUCCESS] Indexed {self.chunk_count} chunks for document {self.document_id}")
+        return self.document_id
+    
+    def _index(self, spans: list):
+        if not spans:
+            return
+        self.indexer.document_store.put(self.document_id, self.text)
+        self.indexer._add_chunks(
+            self.document_id, self.text, spans, self.chunk_count, self._indexed_at, self.session
+        )
+        self.chunk_count += len(spans)
+        self._next_start = spans[-1][1] - self.indexer.CHUNK_OVERLAP
@@ -1,6 +1,7 @@
 import json
 import os
 import re
+import threading
 import uuid
 from datetime import datetime
 from typing import Optional, List
@@ -11,9 +12,12 @@ class VendorManager:
     """Tool for managing vendor master data"""
     
     def __init__(self):
-        Config.validate()
+        Config.validate(require_api_key=False)
         self.db_path = Config.VENDOR_DB_PATH
+        self._lock = threading.RLock()  # pages of one PDF are processed concurrently
+        self._listed = (None, [])  # (file version, vendors) served by list_vendors
         self.vendors = self._load_vendors()
+        self._build_index()
     
     def search_vendor(self, name: str) -> Optional[Vendor]:
         """
@@ -36,11 +40,11 @@ class VendorManager:
             print(f"[ERROR] No vendor found for: '{name}' (empty query after normalization)")
             return None
         
-        # Exact match first
-        for vendor in self.vendors:
-            if vendor.normalized_name == normalized_query:
-                print(f"[SUCCESS] Found exact match: {vendor.name} (ID: {vendor.vendor_id})")
-                return vendor
+        # Exact match first (O(1) via the normalized-name index)
+        vendor = self._by_normalized_name.get(normalized_query)
+        if vendor:
+            print(f"[SUCCESS] Found exact match: {vendor.name} (ID: {vendor.vendor_id})")
+            return vendor
         
         # Fuzzy match (contains) - but only if query is not empty
         for vendor in self.vendors:
@@ -74,35 +78,54 @@ class VendorManager:
         """
         print(f"[ADD] Creating new vendor: {name}")
         
-        # Check if vendor already exists
-        existing = self.search_vendor(name)
-        if existing:
-            print(f"[WARNING] Vendor already exists: {existing.name} (ID: {existing.vendor_id})")
-            return existing
-        
-        # Create new vendor
-        vendor = Vendor(
-            vendor_id=self._generate_vendor_id(),
-            name=name,
-            normalized_name=self._normalize_name(name),
-            address=address,
-            tax_id=tax_id,
-            contact_email=contact_email,
-            contact_phone=contact_phone,
-            created_at=datetime.now().isoformat()
-        )
-        
-        self.vendors.append(vendor)
-        self._save_vendors()
+        with self._lock:
+            # Check if vendor already exists
+            existing = self.search_vendor(name)
+            if existing:
+                print(f"[WARNING] Vendor already exists: {existing.name} (ID: {existing.vendor_id})")
+                return existing
+            
+            # Create new vendor
+            vendor = Vendor(
+                vendor_id=self._generate_vendor_id(),
+                name=name,
+                normalized_name=self._normalize_name(name),
+                address=address,
+                tax_id=tax_id,
+                contact_email=contact_email,
+                contact_phone=contact_phone,
+                created_at=datetime.now().isoformat()
+            )
+            
+            self.vendors.append(vendor)
+            self._by_normalized_name.setdefault(vendor.normalized_name, vendor)
+            self._save_vendors()
         
         print(f"[SUCCESS] Vendor created: {vendor.name} (ID: {vendor.vendor_id})")
         return vendor
     
     def list_vendors(self) -> List[Vendor]:
         """
-        List all vendors (reloads from disk to ensure sync)
+        List all vendors (reloads from disk when the file has changed, e.g. in another process)
         """
-        return self._load_vendors()
+        with self._lock:
+            version = self.version()
+            if version is None:
+                return []
+            if self._listed[0] != version:
+                self._listed = (version, self._load_vendors())
+            return list(self._listed[1])
+    
+    def version(self) -> Optional[tuple]:
+        """
+        Version of the vendor database: (inode, mtime_ns, size) of its file,
+        changing on every save without reading it (None if there is no file)
+        """
+        try:
+            st = os.stat(self.db_path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
     
     def get_or_create_vendor(
         self,
@@ -154,6 +177,12 @@ class VendorManager:
         normalized = ' '.join(normalized.split())
         return normalized.strip()
     
+    def _build_index(self):
+        """Index vendors by normalized name (first vendor wins, as in a linear scan)"""
+        self._by_normalized_name = {}
+        for vendor in self.vendors:
+            self._by_normalized_name.setdefault(vendor.normalized_name, vendor)
+    
     def _generate_vendor_id(self) -> str:
         """Generate unique vendor ID"""
         return f"VEN-{uuid.uuid4().hex[:8].upper()}"
@@ -174,9 +203,12 @@ class VendorManager:
     def _save_vendors(self):
         """Save vendors to JSON file"""
         try:
-            with open(self.db_path, 'w', encoding='utf-8') as f:
+            # Replace atomically so readers never see a partial file
+            tmp_path = f"{self.db_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
                 data = [v.model_dump() for v in self.vendors]
                 json.dump(data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.db_path)
         except Exception as e:
             print(f"[ERROR] Error saving vendors: {e}")
             raise
\ No newline at end of file